@@ -0,0 +1,71 @@
+'''
+Пропускная способность БД при параллельных группах: старый движок по умолчанию
+(NullPool, журнал DELETE, чтение и запись через одно и то же) против create_engines
+(WAL, один писатель, пул читателей).
+Запуск из корня проекта: python -m benchmarks.db_concurrency [групп] [операций на группу]
+'''
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import db.services  # noqa: F401 - регистрирует все модели в Base.metadata
+from db.core import Base, create_engines, unit_of_work
+from game_manager.models import Game
+from lobby.models import Lobby, HiddenWord
+
+
+async def group_workload(chat_id: int, operations: int, write_session, read_session, errors: list):
+    for user_id in range(3):
+        try:
+            await Lobby.add_member(user_id=chat_id * 100 - user_id, chat_id=chat_id, username=None,
+                                   name=f'Игрок {user_id}', async_session=write_session)
+        except OperationalError as e:
+            errors.append(e)
+    for i in range(operations):
+        try:
+            if i % 4 == 0:
+                async with unit_of_work(write_session) as session:
+                    await HiddenWord.create(session=session, lobby_id=chat_id, word=f'тема {i}', user_id=chat_id * 100)
+            elif i % 4 == 1:
+                await Game.get_game_name_by_lobby_id(lobby_id=chat_id, async_session=read_session)
+            else:
+                await Lobby.get_members(chat_id=chat_id, async_session=read_session)
+        except OperationalError as e:
+            errors.append(e)
+
+
+async def run(name: str, writer, readers, groups: int, operations: int):
+    async with writer.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    write_session = async_sessionmaker(writer, expire_on_commit=False)
+    read_session = async_sessionmaker(readers, expire_on_commit=False)
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        group_workload(-(i + 1), operations, write_session, read_session, errors) for i in range(groups)
+    ])
+    elapsed = time.perf_counter() - start
+    total = groups * (operations + 3)
+    print(f'{name:<8} {total} операций за {elapsed:.2f} с: {total / elapsed:.0f} оп/с, ошибок блокировки: {len(errors)}')
+    await writer.dispose()
+    await readers.dispose()
+
+
+async def main(groups: int, operations: int):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'default.db')
+        default_engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+        await run('default', default_engine, default_engine, groups, operations)
+
+        writer, readers = create_engines(path=os.path.join(directory, 'tuned.db'))
+        await run('tuned', writer, readers, groups, operations)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    asyncio.run(main(*(args + [50, 40][len(args):])))
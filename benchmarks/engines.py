@@ -0,0 +1,310 @@
+'''
+Микробенчмарки игровых движков, кодека game_data и отрисовки графика со сравнением с сохранённым базовым замером.
+RoaInstance - на лобби от 2 до 1000 игроков и от 5 до 200 тем, DebateGameInstance (в дебатах всегда 2 игрока) -
+на тех же количествах тем, Plotter.create_plot - с миниатюрами из памяти вместо сети.
+Каждый случай калибруется так, чтобы один прогон шёл не меньше MIN_ROUND_SECONDS. Как и в timeit, сборщик мусора
+на время замера выключен.
+Скорость общей машины меняется в разы за минуты, поэтому прогоны случая чередуются с прогонами эталона - работы
+только со стандартной библиотекой, - и сравнивается время случая в эталонах (медиана по парам прогонов),
+а не в микросекундах.
+Весь набор проходит passes раз и при сохранении базового замера, и при сравнении. В зачёт идёт средний проход,
+а разброс между проходами расширяет допуск случая: шумный случай не считается регрессией от шума.
+Полный набор в 3 прохода идёт несколько минут, для проверки одной части есть --filter.
+Запуск из корня проекта: python -m benchmarks.engines [--filter roa.serialize] [--json результат.json]
+    [--baseline benchmarks/baselines/engines.json] [--threshold 0.25] [--passes 3] [--save]
+--save перезаписывает базовый замер. Эталон выравнивает скорость, но не устройство процессора, поэтому на другой
+машине базовый замер лучше снять заново. Код выхода 1, если какой-то случай медленнее базового больше допуска.
+'''
+import argparse
+import asyncio
+import gc
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from debate_game.models import DebateGameInstance
+from roa_game.graph import Plotter, RoundData
+from roa_game.models import RoaInstance
+from roa_game.render import ChartRenderer
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines', 'engines.json')
+LOBBY_SIZES = (2, 10, 100, 1000)
+TOPIC_COUNTS = (5, 50, 200)
+PLOT_TOPIC_COUNTS = (5, 50, 200)
+MIN_ROUND_SECONDS = 0.025
+ROUNDS = 15
+PLOT_ROUNDS = 3
+PASSES = 3
+# Допуск случая - не меньше стольких его разбросов между проходами.
+NOISE_MULTIPLIER = 2
+
+
+async def make_roa(players: int, topics: int) -> RoaInstance:
+    participants = [(10 ** 8 + i, f'Игрок {i}') for i in range(players)]
+    game = RoaInstance([f'Тема номер {i}' for i in range(topics)], participants)
+    for _ in range(topics):
+        for user_id, _ in participants:
+            await game.set_score_for_word(user_id=user_id, score=random.randint(-10, 10))
+        if game.current_round < game.num_rounds:
+            await game.next_round()
+    return game
+
+
+async def make_debate(topics: int) -> DebateGameInstance:
+    game = DebateGameInstance([f'Тема номер {i}' for i in range(topics)])
+    await game.add_player((936885205, 'Бибо'))
+    await game.add_player((936885206, 'Бобо'))
+    await game.start()
+    await game.set_poll_id(12345)
+    for _ in range(topics - 1):
+        await game.set_round_score(player_name='Бибо', score=random.randint(0, 5))
+        await game.next_round()
+    return game
+
+
+class MemoryImageScraper:
+    '''
+    Вместо Unsplash - одна и та же PNG-миниатюра для каждой темы.
+    '''
+
+    def __init__(self):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (50, 50), (200, 80, 40)).save(buffer, format='PNG')
+        self.thumbnail = buffer.getvalue()
+
+    async def fetch_thumbnails(self, keywords: list[str]) -> dict[str, bytes | None]:
+        return {keyword: self.thumbnail for keyword in keywords}
+
+
+def calibrate(seconds: float) -> int:
+    '''
+    Сколько вызовов нужно, чтобы прогон шёл не меньше MIN_ROUND_SECONDS, если один вызов занял seconds.
+    '''
+    return max(1, int(MIN_ROUND_SECONDS / seconds)) if seconds > 0 else 1000
+
+
+async def timed_round(operation, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await operation()
+    return (time.perf_counter() - start) / iterations
+
+
+async def measure(operation, rounds: int = ROUNDS) -> dict:
+    '''
+    Прогоны эталона и случая по очереди: каждый прогон случая делится на соседний прогон эталона,
+    поэтому то, что машина стала медленнее на какие-то секунды, почти не влияет на отношение.
+    :param operation: Функция без аргументов, которая возвращает корутину.
+    :param rounds: Сколько пар прогонов.
+    :return: Медианы времени одного вызова в микросекундах и отношения к эталону, число вызовов в прогоне.
+    '''
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        await reference()
+        reference_iterations = calibrate(time.perf_counter() - start)
+        start = time.perf_counter()
+        await operation()
+        iterations = calibrate(time.perf_counter() - start)
+        per_call = []
+        ratios = []
+        for _ in range(rounds):
+            unit = await timed_round(reference, reference_iterations)
+            seconds = await timed_round(operation, iterations)
+            per_call.append(seconds * 1e6)
+            ratios.append(seconds / unit)
+    finally:
+        gc.enable()
+    return {'us': statistics.median(per_call), 'relative': statistics.median(ratios), 'iterations': iterations}
+
+
+async def reference():
+    '''
+    Эталон: словари, строки, JSON и сортировка, как в коде игр, но без кода бота - иначе его замедление
+    замедлило бы и эталон, и регрессия бы не заметилась.
+    '''
+    data = {f'Тема номер {i}': [i, -i, i * i] for i in range(40)}
+    json.loads(json.dumps(data, ensure_ascii=False))
+    sorted(data, key=lambda word: data[word][1])
+
+
+async def roa_cases(players: int, topics: int):
+    game = await make_roa(players=players, topics=topics)
+    data = await game.serialize()
+    user_ids = list(game.participants)
+    scores = iter(range(1 << 62))
+
+    async def set_score():
+        # Оценки разных игроков по кругу, как в живой игре.
+        number = next(scores)
+        await game.set_score_for_word(user_id=user_ids[number % players], score=number % 21 - 10)
+
+    suffix = f'[players={players},topics={topics}]'
+    yield f'roa.set_score_for_word{suffix}', set_score
+    yield f'roa.serialize{suffix}', game.serialize
+    yield f'roa.deserialize{suffix}', lambda: RoaInstance.deserialize(data)
+    yield f'roa.get_scores_for_current_word{suffix}', game.get_scores_for_current_word
+    yield f'roa.get_total_scores_all{suffix}', game.get_total_scores_all
+
+
+async def debate_cases(topics: int):
+    game = await make_debate(topics=topics)
+    data = await game.serialize()
+
+    suffix = f'[topics={topics}]'
+    yield f'debate.set_round_score{suffix}', lambda: game.set_round_score(player_name='Бобо', score=1)
+    yield f'debate.serialize{suffix}', game.serialize
+    yield f'debate.deserialize{suffix}', lambda: DebateGameInstance.deserialize(data)
+    yield f'debate.get_round_info{suffix}', game.get_round_info
+    yield f'debate.get_game_result{suffix}', game.get_game_result
+
+
+def selected(name: str, name_filter: str | None) -> bool:
+    return not name_filter or name_filter in name
+
+
+async def run(name_filter: str | None) -> dict[str, dict]:
+    '''
+    Один проход по набору.
+    :param name_filter: Только случаи, в имени которых есть эта строка.
+    :return: Имя случая -> время в микросекундах и в эталонах.
+    '''
+    random.seed(0)
+    results = {}
+
+    async def run_case(name, operation, rounds=ROUNDS):
+        if not selected(name, name_filter):
+            return
+        results[name] = result = await measure(operation, rounds=rounds)
+        print(f'{name:<58} {result["us"]:>14.2f} мкс {result["relative"]:>12.3f} эт.', file=sys.stderr)
+
+    for players in LOBBY_SIZES:
+        for topics in TOPIC_COUNTS:
+            async for name, operation in roa_cases(players=players, topics=topics):
+                await run_case(name, operation)
+    for topics in TOPIC_COUNTS:
+        async for name, operation in debate_cases(topics=topics):
+            await run_case(name, operation)
+
+    plot_names = [f'plotter.create_plot[topics={topics}]' for topics in PLOT_TOPIC_COUNTS]
+    if any(selected(name, name_filter) for name in plot_names):
+        renderer = ChartRenderer(workers=1)
+        await renderer.warm_up()
+        plotter = Plotter(image_scraper=MemoryImageScraper(), renderer=renderer)
+        try:
+            for name, topics in zip(plot_names, PLOT_TOPIC_COUNTS):
+                rounds = [RoundData(users=None, total_score=random.randint(-40, 40), word=f'Тема номер {i}')
+                          for i in range(topics)]
+                await run_case(name, lambda rounds=rounds: plotter.create_plot(rounds), rounds=PLOT_ROUNDS)
+        finally:
+            renderer.close()
+    return results
+
+
+def machine() -> dict:
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+async def collect(name_filter: str | None, passes: int) -> dict[str, dict]:
+    '''
+    Пройти набор passes раз.
+    :return: Имя случая -> средний по relative проход (us, relative) и разброс relative между проходами
+    (spread, доля от среднего).
+    '''
+    runs = []
+    for number in range(passes):
+        print(f'проход {number + 1} из {passes}', file=sys.stderr)
+        runs.append(await run(name_filter))
+    results = {}
+    for name in runs[0]:
+        passes_of_case = sorted((results_of_pass[name] for results_of_pass in runs),
+                                key=lambda value: value['relative'])
+        middle = passes_of_case[len(passes_of_case) // 2]
+        spread = (passes_of_case[-1]['relative'] - passes_of_case[0]['relative']) / middle['relative']
+        results[name] = {'us': round(middle['us'], 3), 'relative': round(middle['relative'], 5),
+                         'spread': round(spread, 4), 'iterations': middle['iterations']}
+    return results
+
+
+def tolerance(result: dict, base: dict, threshold: float) -> float:
+    '''
+    Допустимое замедление случая: threshold, а для шумного случая - NOISE_MULTIPLIER его разбросов
+    в базовом замере или в этом, смотря где шума больше.
+    '''
+    return max(threshold, NOISE_MULTIPLIER * max(result['spread'], base['spread']))
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    '''
+    Напечатать таблицу против базового замера.
+    :return: Случаи, которые стали медленнее больше допуска.
+    '''
+    regressions = []
+    print(f'{"случай":<58} {"мкс":>12} {"эталонов":>10} {"база":>10} {"изм.":>7} {"допуск":>7}')
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f'{name:<58} {result["us"]:>12.2f} {result["relative"]:>10.3f} {"-":>10} {"новый":>7}')
+            continue
+        change = result['relative'] / base['relative'] - 1
+        allowed = tolerance(result, base, threshold)
+        regressed = change > allowed
+        if regressed:
+            regressions.append(name)
+        print(f'{name:<58} {result["us"]:>12.2f} {result["relative"]:>10.3f} {base["relative"]:>10.3f} '
+              f'{change:>+7.0%} {allowed:>7.0%}{"  РЕГРЕССИЯ" if regressed else ""}')
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.engines')
+    parser.add_argument('--filter', help='только случаи, в имени которых есть эта строка')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='допустимое замедление тихого случая, 0.25 - на 25%%')
+    parser.add_argument('--passes', type=int, default=PASSES, help='сколько раз пройти набор')
+    parser.add_argument('--json', help='записать результаты в этот файл')
+    parser.add_argument('--save', action='store_true', help='сохранить результаты как базовый замер')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            stored = json.load(file)
+        baseline = stored['results']
+        if stored['machine'] != machine():
+            print(f'базовый замер сделан на другой машине: {stored["machine"]}')
+
+    results = asyncio.run(collect(args.filter, args.passes))
+    # Новый базовый замер ни с чем не сравнивается: старый может быть снят по-другому.
+    regressions = compare(results, {} if args.save else baseline, args.threshold)
+
+    report = {'machine': machine(), 'passes': args.passes, 'results': results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.save:
+        if args.filter and baseline:
+            # Частичный прогон обновляет только свои случаи.
+            report['results'] = {**baseline, **results}
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f'базовый замер сохранён в {args.baseline}')
+        return 0
+    if regressions:
+        print(f'медленнее базового больше допуска: {len(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
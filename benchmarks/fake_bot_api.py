@@ -0,0 +1,202 @@
+'''
+Локальная заглушка Bot API для нагрузочных прогонов без Telegram.
+Понимает getUpdates, sendMessage, sendPhoto, sendPoll, stopPoll, editMessageText и getMe,
+остальные методы просто отвечают True. Можно добавить задержку ответа и случайные 429.
+Бот ходит сюда, если в config.ini задан BOTAPI Server = http://127.0.0.1:8081.
+Отдельный запуск: python -m benchmarks.fake_bot_api [порт] [задержка, мс] [доля 429]
+'''
+import asyncio
+import json
+import random
+import sys
+import time
+from dataclasses import dataclass
+
+from aiohttp import web
+
+
+@dataclass
+class Sent:
+    '''
+    Запрос бота к заглушке: что и куда он отправил.
+    '''
+    at: float
+    method: str
+    chat_id: int | None
+    text: str
+
+
+class FakeBotApi:
+    '''
+    :param latency_ms: Задержка каждого ответа, кроме getUpdates (тот и так ждёт апдейтов).
+    :param jitter_ms: Случайная добавка к задержке от 0 до jitter_ms.
+    :param flood_rate: Доля отправок, на которые придёт 429 Too Many Requests.
+    :param retry_after: Сколько секунд просить подождать в ответе 429.
+    '''
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081, latency_ms: float = 0, jitter_ms: float = 0,
+                 flood_rate: float = 0, retry_after: int = 1):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.sent: list[Sent] = []
+        self.calls: dict[str, int] = {}
+        self.flood_errors = 0
+        # Апдейты, которые бот ещё не подтвердил offset-ом, и момент постановки каждого.
+        self._updates: list[dict] = []
+        self.pushed_at: dict[int, float] = {}
+        self.delivered = 0
+        self._update_id = 0
+        self._message_id = 0
+        self._polls: dict[tuple[int, int], list[str]] = {}
+        self._changed = asyncio.Condition()
+        self._runner = None
+
+    def push_update(self, update: dict) -> int:
+        '''
+        Поставить апдейт в очередь getUpdates. update_id проставляется здесь.
+        :return: update_id
+        '''
+        self._update_id += 1
+        update['update_id'] = self._update_id
+        self._updates.append(update)
+        self.pushed_at[self._update_id] = time.perf_counter()
+        self._notify()
+        return self._update_id
+
+    def _notify(self):
+        async def notify():
+            async with self._changed:
+                self._changed.notify_all()
+        asyncio.ensure_future(notify())
+
+    async def wait_for(self, chat_id: int, after: int = 0, method: str | None = None, contains: str | None = None,
+                       timeout: float = 30) -> int | None:
+        '''
+        Дождаться, пока бот отправит в чат что-то подходящее.
+        :param after: Смотреть только отправки с номером не меньше этого (len(self.sent) до действия).
+        :return: Номер отправки или None, если не дождались.
+        '''
+        def found():
+            for index in range(after, len(self.sent)):
+                sent = self.sent[index]
+                if (sent.chat_id == chat_id and (method is None or sent.method == method)
+                        and (contains is None or contains in sent.text)):
+                    return index
+            return None
+
+        try:
+            async with self._changed:
+                await asyncio.wait_for(self._changed.wait_for(lambda: found() is not None), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return found()
+
+    def _message(self, chat_id: int, **fields) -> dict:
+        self._message_id += 1
+        chat = {'id': chat_id, 'type': 'group', 'title': f'Группа {chat_id}'} if chat_id < 0 else \
+            {'id': chat_id, 'type': 'private', 'first_name': f'Игрок {chat_id}'}
+        return {'message_id': self._message_id, 'date': int(time.time()), 'chat': chat, **fields}
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        confirmed = [update for update in self._updates if update['update_id'] < offset]
+        self.delivered += len(confirmed)
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates and timeout:
+            try:
+                async with self._changed:
+                    await asyncio.wait_for(self._changed.wait_for(lambda: bool(self._updates)), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _answer(self, method: str, params: dict):
+        chat_id = int(params['chat_id']) if params.get('chat_id') else None
+        if method == 'getme':
+            return {'id': 42, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        if method in ('sendmessage', 'editmessagetext'):
+            return self._message(chat_id, text=params.get('text', ''))
+        if method == 'sendphoto':
+            return self._message(chat_id, photo=[{'file_id': 'photo', 'file_unique_id': 'photo',
+                                                  'width': 100, 'height': 100}])
+        if method == 'sendpoll':
+            options = json.loads(params['options'])
+            message = self._message(chat_id, poll={
+                'id': str(self._message_id + 1), 'question': params.get('question', ''),
+                'options': [{'text': option, 'voter_count': 0} for option in options],
+                'total_voter_count': 0, 'is_closed': False, 'is_anonymous': True, 'type': 'regular',
+                'allows_multiple_answers': False,
+            })
+            self._polls[(chat_id, message['message_id'])] = options
+            return message
+        if method == 'stoppoll':
+            options = self._polls.pop((chat_id, int(params['message_id'])), [])
+            votes = [{'text': option, 'voter_count': random.randint(0, 5)} for option in options]
+            return {'id': params['message_id'], 'question': '', 'options': votes,
+                    'total_voter_count': sum(vote['voter_count'] for vote in votes), 'is_closed': True,
+                    'is_anonymous': True, 'type': 'regular', 'allows_multiple_answers': False}
+        return True
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method'].lower()
+        params = {key: value for key, value in (await request.post()).items() if isinstance(value, str)}
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == 'getupdates':
+            return web.json_response({'ok': True, 'result': await self._get_updates(params)})
+
+        if self.latency_ms or self.jitter_ms:
+            await asyncio.sleep((self.latency_ms + random.random() * self.jitter_ms) / 1000)
+        if method.startswith('send') and random.random() < self.flood_rate:
+            self.flood_errors += 1
+            return web.json_response(
+                {'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {self.retry_after}',
+                 'parameters': {'retry_after': self.retry_after}}, status=429)
+
+        result = self._answer(method, params)
+        if params.get('chat_id'):
+            self.sent.append(Sent(at=time.perf_counter(), method=method, chat_id=int(params['chat_id']),
+                                  text=params.get('text', '')))
+            self._notify()
+        return web.json_response({'ok': True, 'result': result})
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self):
+        app = web.Application(client_max_size=20 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(port: int, latency_ms: float, flood_rate: float):
+    api = FakeBotApi(port=port, latency_ms=latency_ms, flood_rate=flood_rate)
+    await api.start()
+    print(f'Bot API на {api.url}, задержка {latency_ms} мс, доля 429: {flood_rate}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await api.stop()
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    try:
+        asyncio.run(serve(port=int(arguments[0]) if arguments else 8081,
+                          latency_ms=float(arguments[1]) if len(arguments) > 1 else 0,
+                          flood_rate=float(arguments[2]) if len(arguments) > 2 else 0))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,99 @@
+'''
+Размер и скорость кодирования Game.game_data: старый JSON против бинарного формата.
+Запуск из корня проекта: python -m benchmarks.game_data_codec
+'''
+import asyncio
+import json
+import random
+import time
+
+from debate_game.models import DebateGameInstance
+from roa_game.models import RoaInstance
+
+
+def legacy_roa_json(game: RoaInstance) -> str:
+    return json.dumps({
+        "words": game.words,
+        "participants": list(game.participants.items()),
+        "num_rounds": game.num_rounds,
+        "current_round": game.current_round,
+        "current_scores": game.current_scores,
+        "word_total_scores": game.word_total_scores
+    })
+
+
+def legacy_debate_json(game: DebateGameInstance) -> str:
+    return json.dumps({
+        "words": game.words,
+        "players": game.players,
+        "current_round": game.current_round,
+        "current_word": game.current_word,
+        "current_player_index": game.current_player_index,
+        "scores": game.scores,
+        "positions": game.positions,
+        "can_switch_player": game.can_switch_player,
+        "state": game.state,
+        "last_poll_id": game.last_poll_id
+    }, default=lambda o: o.__dict__, indent=4)
+
+
+async def make_roa(players: int, words: int) -> RoaInstance:
+    participants = [(random.randint(10 ** 8, 10 ** 10), f'Игрок {i}') for i in range(players)]
+    game = RoaInstance([f'Тема номер {i}' for i in range(words)], participants)
+    for _ in range(words):
+        for user_id, _ in participants:
+            await game.set_score_for_word(user_id=user_id, score=random.randint(-10, 10))
+        if game.current_round < game.num_rounds:
+            await game.next_round()
+    return game
+
+
+async def make_debate(words: int) -> DebateGameInstance:
+    game = DebateGameInstance([f'Тема номер {i}' for i in range(words)])
+    await game.add_player((936885205, 'Бибо'))
+    await game.add_player((936885206, 'Бобо'))
+    await game.start()
+    await game.set_poll_id(12345)
+    return game
+
+
+async def timed(coroutine_factory, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await coroutine_factory()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+async def measure(name: str, game, legacy_encode, repeat: int):
+    legacy = legacy_encode(game)
+    binary = await game.serialize()
+
+    async def encode_legacy():
+        legacy_encode(game)
+
+    async def decode_legacy():
+        await game.deserialize(legacy)
+
+    async def decode_binary():
+        await game.deserialize(binary)
+
+    print(f'{name:<22} '
+          f'{len(legacy.encode()):>9} {len(binary):>9}   '
+          f'{await timed(encode_legacy, repeat):>9.1f} {await timed(game.serialize, repeat):>9.1f}   '
+          f'{await timed(decode_legacy, repeat):>9.1f} {await timed(decode_binary, repeat):>9.1f}')
+
+
+async def main():
+    random.seed(0)
+    print(f'{"game":<22} {"json B":>9} {"bin B":>9}   {"json enc":>9} {"bin enc":>9}   {"json dec":>9} {"bin dec":>9}'
+          '  (время в мкс)')
+    for players, words in ((2, 5), (5, 5), (20, 5), (20, 50), (100, 200)):
+        game = await make_roa(players=players, words=words)
+        await measure(f'roa {players}x{words}', game, legacy_roa_json, repeat=200)
+    for words in (4, 50):
+        game = await make_debate(words=words)
+        await measure(f'debate {words}', game, legacy_debate_json, repeat=2000)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,260 @@
+'''
+Нагрузочный прогон без Telegram: бот в этом же процессе забирает апдейты через getUpdates у заглушки
+benchmarks.fake_bot_api, а генератор сценариев изображает groups групп, которые одновременно играют.
+Доля debates групп играет в Дебаты (/join, /deb, темы в личку, /me, ходы, голосование), остальные -
+в Рейтинг всего (/join, /roa, темы в личку, оценки, /next). Игроки думают случайное время до think_ms.
+В конце печатается: апдейтов в секунду, p50/p99 времени хэндлеров и от апдейта до конца обработки,
+ошибки блокировки БД, упавшие апдейты и шаги сценария, на которые бот не ответил вовремя.
+База временная. Лимиты исходящих сообщений по умолчанию сняты, чтобы мерить сам бот, а не ожидание
+лимитов Telegram; --telegram-limits оставляет их как в config.ini.
+Запуск из корня проекта: python -m benchmarks.load_test [--groups 20] [--players 4] [--debates 0.3]
+    [--latency-ms 30] [--flood-rate 0.01] [--think-ms 300] [--fill-seconds 3] [--telegram-limits]
+Как и сам бот, требует токен в telegram/consts.py (в сеть запросы не уходят).
+Код выхода 1, если были ошибки блокировки, упавшие апдейты или зависшие шаги.
+'''
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import config
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load_test')
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--debates', type=float, default=0.3, help='доля групп, которые играют в Дебаты')
+    parser.add_argument('--topics', type=int, default=2, help='тем от каждого игрока')
+    parser.add_argument('--latency-ms', type=float, default=30, help='задержка ответа Bot API')
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--flood-rate', type=float, default=0.01, help='доля отправок, которые получат 429')
+    parser.add_argument('--think-ms', type=float, default=300, help='максимальная пауза игрока между действиями')
+    parser.add_argument('--fill-seconds', type=int, default=3, help='сколько открыт приём тем')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--telegram-limits', action='store_true')
+    return parser.parse_args(argv)
+
+
+ARGS = parse_args(sys.argv[1:])
+
+# Синглтоны бота берут настройки при импорте, поэтому всё подменяется до импорта модулей бота.
+_directory = tempfile.TemporaryDirectory()
+config.db_path = os.path.join(_directory.name, 'load.db')
+config.bot_api_server = f'http://127.0.0.1:{ARGS.port}'
+config.send_word_seconds = ARGS.fill_seconds
+config.sec_to_answer = 1
+config.sec_between_answers = 1
+if not ARGS.telegram_limits:
+    config.outbox_global_per_second = 1_000_000
+    config.outbox_group_per_minute = 1_000_000
+    config.outbox_private_per_second = 1_000_000
+    config.outbox_chat_burst = 1_000_000
+
+from aiogram import BaseMiddleware
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.webhook_replay import percentile
+
+
+class LatencyRecorder(BaseMiddleware):
+    '''
+    Время каждого хэндлера и время от постановки апдейта в заглушку до конца его обработки.
+    '''
+
+    def __init__(self, api: FakeBotApi):
+        self.api = api
+        self.handlers: dict[str, list[float]] = {}
+        self.updates: list[float] = []
+
+    async def __call__(self, handler, event, data):
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            end = time.perf_counter()
+            self.handlers.setdefault(data['handler'].callback.__name__, []).append(end - start)
+            pushed = self.api.pushed_at.pop(data['event_update'].update_id, None)
+            if pushed is not None:
+                self.updates.append(end - pushed)
+
+
+class ErrorCounter(logging.Handler):
+    '''
+    Считает по логам бота ошибки блокировки БД, упавшие апдейты и 429 от Bot API.
+    '''
+
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.db_locks = 0
+        self.failed_updates = 0
+        self.flood_control = 0
+        self.errors: dict[str, int] = {}
+
+    def emit(self, record: logging.LogRecord):
+        event = record.getMessage()
+        if event == 'flood_control':
+            self.flood_control += 1
+            return
+        if record.levelno < logging.ERROR:
+            return
+        self.errors[event] = self.errors.get(event, 0) + 1
+        if event == 'update_failed':
+            self.failed_updates += 1
+        error = record.exc_info[1] if record.exc_info else None
+        if isinstance(error, PoolTimeoutError) or (isinstance(error, OperationalError) and 'locked' in str(error)):
+            self.db_locks += 1
+
+
+class GroupScenario:
+    '''
+    Одна группа игроков от /join до конца игры. Шаг, на который бот не ответил вовремя, считается
+    зависшим, и сценарий группы на нём заканчивается.
+    '''
+
+    def __init__(self, api: FakeBotApi, index: int, players: int, topics: int, think_ms: float):
+        self.api = api
+        self.chat_id = -(1000 + index)
+        self.players = [(index + 1) * 1000 + number for number in range(players)]
+        self.topics = topics
+        self.think_ms = think_ms
+        self.stalled: str | None = None
+
+    def push(self, user_id: int, text: str, private: bool = False):
+        chat_id = user_id if private else self.chat_id
+        message = {
+            'message_id': random.randint(1, 1 << 30), 'date': int(time.time()), 'text': text,
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': f'Игрок {user_id}'} if private else
+            {'id': chat_id, 'type': 'group', 'title': f'Группа {chat_id}'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'Игрок {user_id}'},
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        self.api.push_update({'message': message})
+
+    async def think(self):
+        await asyncio.sleep(random.random() * self.think_ms / 1000)
+
+    async def expect(self, step: str, after: int, timeout: float, **match) -> bool:
+        if await self.api.wait_for(self.chat_id, after=after, timeout=timeout, **match) is None:
+            self.stalled = step
+            return False
+        return True
+
+    async def join_and_fill(self, command: str) -> bool:
+        for user_id in self.players:
+            self.push(user_id, '/join')
+            await self.think()
+        mark = len(self.api.sent)
+        self.push(self.players[0], command)
+        if not await self.expect(command, mark, 30, contains='Перейдите сюда'):
+            return False
+        for user_id in self.players:
+            for topic in range(self.topics):
+                self.push(user_id, f'Тема {user_id}-{topic}', private=True)
+                await self.think()
+        return True
+
+    async def rate_off_all(self):
+        mark = len(self.api.sent)
+        if not await self.join_and_fill('/roa'):
+            return
+        if not await self.expect('старт игры', mark, ARGS.fill_seconds + 30, contains='Рейтинг всего'):
+            return
+        for word in range(min(len(self.players) * self.topics, config.max_word_count_roa)):
+            for user_id in self.players:
+                self.push(user_id, str(random.randint(-10, 10)))
+                await self.think()
+            mark = len(self.api.sent)
+            self.push(self.players[0], '/next')
+            if not await self.expect(f'/next {word + 1}', mark, 30):
+                return
+
+    async def debate(self):
+        mark = len(self.api.sent)
+        if not await self.join_and_fill('/deb'):
+            return
+        if not await self.expect('старт игры', mark, ARGS.fill_seconds + 30, contains='Дебаты'):
+            return
+        mark = len(self.api.sent)
+        for user_id in self.players[:2]:
+            self.push(user_id, '/me')
+            await self.think()
+        if not await self.expect('/me', mark, 30, contains='Тема раунда'):
+            return
+        turns_seconds = 2 * (config.sec_to_answer + config.sec_between_answers)
+        for topic in range(min(len(self.players) * self.topics, config.max_word_count_deb)):
+            mark = len(self.api.sent)
+            self.push(self.players[0], '/next')
+            if not await self.expect(f'голосование {topic + 1}', mark, turns_seconds + 30, method='sendpoll'):
+                return
+            await self.think()
+            mark = len(self.api.sent)
+            self.push(self.players[0], '/next')
+            if not await self.expect(f'итоги {topic + 1}', mark, 30):
+                return
+
+
+async def main() -> int:
+    # Бот читает config при импорте: база, адрес Bot API и лимиты должны быть уже подменены выше.
+    from db.services import create_tables
+    from telegram.consts import bot, dp
+    import telegram.tg  # noqa: F401 - регистрирует хэндлеры в dp
+
+    random.seed(ARGS.seed)
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    api = FakeBotApi(port=ARGS.port, latency_ms=ARGS.latency_ms, jitter_ms=ARGS.jitter_ms,
+                     flood_rate=ARGS.flood_rate)
+    recorder = LatencyRecorder(api)
+    dp.message.middleware(recorder)
+    await api.start()
+    await create_tables()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+
+    debates = round(ARGS.groups * ARGS.debates)
+    scenarios = [GroupScenario(api, index, ARGS.players, ARGS.topics, ARGS.think_ms) for index in range(ARGS.groups)]
+    start = time.perf_counter()
+    await asyncio.gather(*[scenario.debate() if index < debates else scenario.rate_off_all()
+                           for index, scenario in enumerate(scenarios)])
+    elapsed = time.perf_counter() - start
+
+    await dp.stop_polling()
+    await polling
+    await api.stop()
+
+    handled = len(recorder.updates)
+    all_handlers = [seconds for durations in recorder.handlers.values() for seconds in durations]
+    stalled = [(scenario.chat_id, scenario.stalled) for scenario in scenarios if scenario.stalled]
+    print(f'групп {ARGS.groups} (дебаты {debates}), игроков в группе {ARGS.players}, '
+          f'Bot API {ARGS.latency_ms:.0f}+{ARGS.jitter_ms:.0f} мс, 429 на {ARGS.flood_rate:.1%} отправок')
+    print(f'апдейтов обработано {handled} за {elapsed:.1f} с: {handled / elapsed:.1f} в секунду')
+    print(f'хэндлеры: p50 {percentile(all_handlers, 0.5) * 1000:.1f} мс, '
+          f'p99 {percentile(all_handlers, 0.99) * 1000:.1f} мс')
+    print(f'от апдейта до конца обработки: p50 {percentile(recorder.updates, 0.5) * 1000:.1f} мс, '
+          f'p99 {percentile(recorder.updates, 0.99) * 1000:.1f} мс')
+    for name, durations in sorted(recorder.handlers.items()):
+        print(f'    {name:<32} {len(durations):>6}  p50 {percentile(durations, 0.5) * 1000:7.1f} мс  '
+              f'p99 {percentile(durations, 0.99) * 1000:7.1f} мс')
+    print('Bot API: ' + ', '.join(f'{method} {count}' for method, count in sorted(api.calls.items()))
+          + f'; 429 отдано {api.flood_errors}, бот переждал {errors.flood_control}')
+    print(f'ошибки блокировки БД: {errors.db_locks}, упавшие апдейты: {errors.failed_updates}')
+    if errors.errors:
+        print('ошибки в логах: ' + ', '.join(f'{event} {count}' for event, count in sorted(errors.errors.items())))
+    if stalled:
+        print(f'зависли {len(stalled)} групп: ' + ', '.join(f'{chat_id} на шаге {step}' for chat_id, step in stalled))
+    return 1 if errors.db_locks or errors.failed_updates or stalled else 0
+
+
+if __name__ == '__main__':
+    code = asyncio.run(main())
+    _directory.cleanup()
+    sys.exit(code)
@@ -0,0 +1,141 @@
+'''
+Сколько запросов к БД делает каждая команда. Прогоняет апдейты через настоящие хэндлеры из telegram/tg.py
+на временной базе, Bot API подменяется сессией, которая отвечает сразу и ничего не отправляет.
+Если команда сделала больше запросов, чем заявлено в BUDGETS, скрипт завершается с кодом 1.
+Запуск из корня проекта: python -m benchmarks.query_budget [-v]
+Как и сам бот, требует токен в telegram/consts.py (в сеть запросы не уходят).
+'''
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+
+import config
+
+# Бот открывает базу при импорте db.core, поэтому путь подменяется до импорта моделей.
+_directory = tempfile.TemporaryDirectory()
+config.db_path = os.path.join(_directory.name, 'budget.db')
+config.db_slow_query_ms = 0
+
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod, SendMessage, SendPhoto, SendPoll, EditMessageText
+from aiogram.types import Update, Message, Chat
+
+from db.query_stats import track_queries, QueryStats
+from db.services import create_tables
+from game_manager.controllers import GameManagerController
+from game_manager.models import GameTitles
+from roa_game.models import score_batcher
+from telegram.consts import bot, dp
+from telegram.outbox import outbox
+import telegram.tg  # noqa: F401 - регистрирует хэндлеры в dp
+
+# Команда -> сколько запросов она может сделать.
+BUDGETS = {
+    '/join': 4,
+    '/roa': 4,
+    'topic': 4,
+    'word_filling_closed': 7,
+    'score': 0,
+    '/next': 3,
+}
+
+CHAT_ID = -1000
+PLAYERS = (101, 102, 103)
+
+
+class LocalSession(BaseSession):
+    '''
+    Сессия Bot API без сети: отправка сообщений отвечает сообщением с новым id, остальное - True.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.message_id = 0
+
+    async def make_request(self, bot, method: TelegramMethod, timeout: int | None = None):
+        if isinstance(method, (SendMessage, SendPhoto, SendPoll, EditMessageText)):
+            self.message_id += 1
+            return Message(message_id=self.message_id, date=datetime.datetime.now(),
+                           chat=Chat(id=method.chat_id, type='group'))
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+def make_update(update_id: int, chat_id: int, user_id: int, text: str) -> Update:
+    message = {
+        'message_id': update_id, 'date': 0, 'text': text,
+        'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group', 'title': 'bench'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'Игрок {user_id}'},
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return Update(update_id=update_id, message=message)
+
+
+class Flow:
+    def __init__(self):
+        self.update_id = 0
+        # Команда -> статистика каждого её вызова.
+        self.results: dict[str, list[QueryStats]] = {}
+
+    async def send(self, name: str, chat_id: int, user_id: int, text: str):
+        self.update_id += 1
+        with track_queries() as stats:
+            await dp.feed_update(bot, make_update(self.update_id, chat_id, user_id, text))
+        self.results.setdefault(name, []).append(stats)
+
+    async def call(self, name: str, coroutine):
+        with track_queries() as stats:
+            await coroutine
+        self.results.setdefault(name, []).append(stats)
+
+    async def run(self):
+        for user_id in PLAYERS:
+            await self.send('/join', CHAT_ID, user_id, '/join')
+        await self.send('/roa', CHAT_ID, PLAYERS[0], '/roa')
+        for user_id in PLAYERS:
+            for topic in ('кошки', 'понедельник'):
+                await self.send('topic', user_id, user_id, f'{topic} {user_id}')
+        # В боте это делает таймер приёма тем.
+        await self.call('word_filling_closed',
+                        GameManagerController().finish_word_filling(CHAT_ID, GameTitles.rate_off_all))
+        for round_score in (3, -2):
+            for user_id in PLAYERS:
+                await self.send('score', CHAT_ID, user_id, str(round_score))
+            await score_batcher.drain(CHAT_ID)
+            await self.send('/next', CHAT_ID, PLAYERS[0], '/next')
+
+
+async def main(verbose: bool) -> int:
+    bot.session = LocalSession()
+    await create_tables()
+    flow = Flow()
+    await flow.run()
+    await outbox.close()
+
+    failed = []
+    for name, budget in BUDGETS.items():
+        runs = flow.results.get(name, [])
+        worst = max(runs, key=lambda stats: stats.count, default=QueryStats())
+        status = 'ok' if worst.count <= budget else 'ПРЕВЫШЕН'
+        print(f'{name:<20} запросов: {worst.count:>3} (бюджет {budget}), '
+              f'БД {worst.seconds * 1000:7.2f} мс, вызовов {len(runs)}  {status}')
+        if verbose or worst.count > budget:
+            for statement in worst.statements:
+                print(f'    {" ".join(statement.split())[:160]}')
+        if worst.count > budget:
+            failed.append(name)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    code = asyncio.run(main(verbose='-v' in sys.argv[1:]))
+    _directory.cleanup()
+    sys.exit(code)
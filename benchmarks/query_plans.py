@@ -0,0 +1,45 @@
+'''
+Планы горячих запросов из db/query_plans.py. Если какой-то запрос читает таблицу целиком,
+скрипт печатает его план и завершается с кодом 1. Бот при старте такие планы только пишет в лог.
+Без аргументов проверяется новая база после create_tables и миграций, с путём - существующая база.
+Запуск из корня проекта: python -m benchmarks.query_plans [path]
+'''
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+import config
+
+
+async def main() -> int:
+    # Бот открывает базу при импорте db.core, поэтому импорты после подмены пути.
+    from db.errors import FullTableScan
+    from db.query_plans import check_query_plans
+    from db.services import create_tables
+
+    await create_tables()
+    try:
+        await check_query_plans()
+    except FullTableScan as e:
+        print(e.msg)
+        return 1
+    print('ok')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Проверить планы горячих запросов')
+    parser.add_argument('path', nargs='?', help='База для проверки, по умолчанию новая временная')
+    args = parser.parse_args()
+    directory = None
+    if args.path:
+        config.db_path = args.path
+    else:
+        directory = tempfile.TemporaryDirectory()
+        config.db_path = os.path.join(directory.name, 'plans.db')
+    code = asyncio.run(main())
+    if directory is not None:
+        directory.cleanup()
+    sys.exit(code)
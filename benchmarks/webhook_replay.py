@@ -0,0 +1,62 @@
+'''
+Отправить записанные апдейты на локальный вебхук бота, как это делает Telegram.
+Файл - по одному JSON апдейта в строке (например, результат getUpdates, разложенный по строкам).
+Запуск: python -m benchmarks.webhook_replay updates.jsonl [url] [одновременных запросов]
+URL по умолчанию собирается из секции WEBHOOK в config.ini, секрет берётся оттуда же.
+'''
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+
+import config
+from telegram.webhook import SECRET_HEADER
+
+
+def percentile(values: list[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0
+
+
+async def replay(updates: list[dict], url: str, concurrency: int) -> tuple[dict[int, int], list[float], float]:
+    headers = {SECRET_HEADER: config.webhook_secret_token} if config.webhook_secret_token else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses: dict[int, int] = {}
+    latencies: list[float] = []
+
+    async def post(session: aiohttp.ClientSession, update: dict):
+        async with semaphore:
+            start = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                await response.read()
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*[post(session, update) for update in updates])
+    return statuses, latencies, time.perf_counter() - start
+
+
+def main():
+    host = '127.0.0.1' if config.webhook_host == '0.0.0.0' else config.webhook_host
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.webhook_replay')
+    parser.add_argument('path', help='файл с апдейтами, по одному JSON в строке')
+    parser.add_argument('url', nargs='?', default=f'http://{host}:{config.webhook_port}{config.webhook_path}')
+    parser.add_argument('concurrency', nargs='?', type=int, default=10, help='одновременных запросов')
+    args = parser.parse_args()
+    path, url, concurrency = args.path, args.url, args.concurrency
+    with open(path, encoding='utf-8') as file:
+        updates = [json.loads(line) for line in file if line.strip()]
+
+    statuses, latencies, elapsed = asyncio.run(replay(updates, url, concurrency))
+    print(f'{len(updates)} апдейтов за {elapsed:.2f} с: {len(updates) / elapsed:.0f} в секунду')
+    print(f'ответ вебхука: p50 {percentile(latencies, 0.5) * 1000:.1f} мс, '
+          f'p99 {percentile(latencies, 0.99) * 1000:.1f} мс')
+    print('статусы: ' + ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items())))
+
+
+if __name__ == '__main__':
+    main()
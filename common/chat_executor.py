@@ -0,0 +1,58 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import config
+from common import metrics
+
+wait_seconds = metrics.registry.histogram(
+    'bot_chat_wait_seconds', 'Сколько апдейт или отложенное действие ждали своей очереди в чате')
+
+
+class ChatExecutor:
+    '''
+    Всё, что меняет состояние игры чата, выполняется строго по одному и в порядке поступления:
+    у каждого чата своя очередь (asyncio.Lock отпускает ожидающих по порядку).
+    Разные чаты идут параллельно, но одновременно работает не больше max_concurrency.
+    Блокировка не реентерабельная: внутри слота нельзя ждать другой слот того же чата.
+    '''
+
+    def __init__(self, max_concurrency: int = config.dispatch_max_concurrency):
+        # chat_id -> [очередь чата, сколько задач её держат или ждут]
+        self._chats: dict[int, list] = {}
+        self._running = asyncio.Semaphore(max_concurrency)
+
+    @asynccontextmanager
+    async def slot(self, chat_id: int | None):
+        '''
+        Дождаться своей очереди в чате, а потом - свободного места среди всех чатов.
+        :param chat_id: None - апдейт без чата, ограничивается только общим лимитом.
+        :return:
+        '''
+        start = time.perf_counter()
+        if chat_id is None:
+            async with self._running:
+                wait_seconds.observe(time.perf_counter() - start)
+                yield
+            return
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = [asyncio.Lock(), 0]
+        chat[1] += 1
+        try:
+            async with chat[0]:
+                # Общий лимит берётся уже в очереди чата, чтобы ждущие чаты не занимали места.
+                async with self._running:
+                    wait_seconds.observe(time.perf_counter() - start)
+                    yield
+        finally:
+            chat[1] -= 1
+            if chat[1] == 0:
+                del self._chats[chat_id]
+
+    def active_chats(self) -> int:
+        return len(self._chats)
+
+
+chat_executor = ChatExecutor()
@@ -0,0 +1,36 @@
+import aiohttp
+
+import config
+
+
+class HttpClient:
+    '''
+    Один долгоживущий aiohttp-клиент на весь бот: соединения переиспользуются между запросами,
+    а общее их число ограничено пулом коннектора.
+    '''
+
+    def __init__(self, pool_size: int = config.http_pool_size,
+                 request_timeout_seconds: float = config.http_request_timeout_seconds):
+        self.pool_size = pool_size
+        self.request_timeout_seconds = request_timeout_seconds
+        self._session: aiohttp.ClientSession | None = None
+
+    def session(self) -> aiohttp.ClientSession:
+        '''
+        Сессия создаётся при первом запросе, уже внутри работающего event loop.
+        :return:
+        '''
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout_seconds),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+http_client = HttpClient()
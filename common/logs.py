@@ -0,0 +1,101 @@
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+
+import config
+
+# Атрибуты, которые есть у любой LogRecord. Всё остальное пришло через extra и пишется отдельными полями.
+STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Одна запись - одна строка JSON: время, уровень, логгер, событие и поля из extra.
+    '''
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class JsonQueueHandler(logging.handlers.QueueHandler):
+    '''
+    Стандартный QueueHandler перед очередью дописывает traceback в текст сообщения и стирает exc_info,
+    и в JSON он попадал бы внутрь event. Здесь текст исключения уходит в exc_text, а сообщение остаётся событием.
+    '''
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            # Traceback держит кадры стека живыми, пока запись лежит в очереди.
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    '''
+    Пропускать только долю записей уровня: для частых событий вроде оценок хватает выборки.
+    Уровни, которых нет в rates, проходят всегда.
+    '''
+
+    def __init__(self, rates: dict[int, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno)
+        return rate is None or rate >= 1 or random.random() < rate
+
+
+def setup_logging(level: str = config.log_level, path: str = config.log_file,
+                  sample_rates: dict[str, float] = config.log_sample_rates) -> logging.handlers.QueueListener:
+    '''
+    Корневой логгер кладёт записи в очередь, а форматирует и пишет их фоновый поток.
+    В event loop остаётся только создание записи и put в очередь.
+    :param level:
+    :param path: Файл для логов, пустая строка - stderr.
+    :param sample_rates: Уровень -> доля записей, которые попадут в лог.
+    :return: Запущенный listener, его нужно остановить при выходе, чтобы дописать очередь.
+    '''
+    log_queue = queue.SimpleQueue()
+    queue_handler = JsonQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter({logging.getLevelName(name): rate for name, rate in sample_rates.items()}))
+
+    output = logging.FileHandler(path, encoding='utf-8') if path else logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+    # aiogram сам пишет каждую обработанную апдейт на INFO.
+    logging.getLogger('aiogram.event').setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    listener.start()
+    return listener
+
+
+def elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
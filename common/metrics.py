@@ -0,0 +1,202 @@
+import logging
+import time
+from bisect import bisect_left
+from typing import Awaitable, Callable
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм в секундах: от быстрых ответов из кэша до отрисовки графика.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def expose(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for label_values, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    '''
+    Корзины хранятся без накопления, кумулятивные значения считаются только при выдаче метрик,
+    поэтому observe - это один bisect и два сложения.
+    '''
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # label_values -> [счётчики по корзинам + корзина +Inf, сумма]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, seconds: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, seconds)] += 1
+        series[1] += seconds
+
+    def time(self, *label_values) -> 'Timer':
+        return Timer(self, label_values)
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return sum(series[0]) if series is not None else 0
+
+    def expose(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                bucket_labels = _format_labels(self.labels, label_values, f'le="{le}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram: Histogram, label_values: tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+class Gauge:
+    '''
+    Значение считается в момент запроса метрик: collect возвращает {значения меток: число}.
+    '''
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...],
+                 collect: Callable[[], Awaitable[dict[tuple, float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.collect = collect
+        self._values: dict[tuple, float] = {}
+
+    async def refresh(self):
+        self._values = await self.collect()
+
+    def expose(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        for label_values, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name: str, documentation: str, labels: tuple[str, ...],
+              collect: Callable[[], Awaitable[dict[tuple, float]]]) -> Gauge:
+        return self.register(Gauge(name, documentation, labels, collect))
+
+    async def expose(self) -> str:
+        '''
+        Все метрики в текстовом формате Prometheus.
+        Если gauge не удалось посчитать, остаётся его прошлое значение.
+        '''
+        lines = []
+        for metric in self._metrics.values():
+            if isinstance(metric, Gauge):
+                try:
+                    await metric.refresh()
+                except Exception:
+                    logger.exception('gauge_collect_failed', extra={'metric': metric.name})
+            lines += metric.expose()
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+handler_seconds = registry.histogram(
+    'bot_handler_seconds', 'Время обработки сообщения хэндлером', ('handler',))
+handler_errors = registry.counter(
+    'bot_handler_errors_total', 'Хэндлер завершился исключением', ('handler',))
+updates = registry.counter(
+    'bot_updates_total', 'Полученные апдейты', ('update_type',))
+db_transaction_seconds = registry.histogram(
+    'bot_db_transaction_seconds', 'Длительность транзакций БД', ('engine', 'outcome'))
+send_seconds = registry.histogram(
+    'bot_send_seconds', 'Время запроса к Bot API из очереди отправки', ('method', 'outcome'))
+
+
+class MetricsServer:
+    '''
+    Локальный HTTP-сервер с одной страницей /metrics.
+    '''
+
+    def __init__(self, host: str = config.metrics_host, port: int = config.metrics_port,
+                 registry: Registry = registry):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner = None
+
+    async def handle(self, request):
+        from aiohttp import web
+        return web.Response(body=(await self.registry.expose()).encode(),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def start(self):
+        # aiohttp.web нужен только при включённых метриках, на запуск без них он не влияет.
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics_server = MetricsServer()
@@ -1,11 +1,11 @@
 from __future__ import annotations
 
-from sqlalchemy import String, ForeignKey, select
+from sqlalchemy import String, ForeignKey, select, inspect
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship, Mapped, mapped_column, selectinload
 
 from common.errors import UserAlreadyInLobby
-from db.core import Base
+from db.core import Base, async_read_session_maker
 
 
 class User(Base):
@@ -14,7 +14,7 @@ class User(Base):
     name: Mapped[str] = mapped_column(String())
     username: Mapped[str] = mapped_column(String(), nullable=True)
 
-    lobby_id: Mapped[int] = mapped_column(ForeignKey('lobby.chat_id'))
+    lobby_id: Mapped[int] = mapped_column(ForeignKey('lobby.chat_id'), index=True)
     lobby = relationship('Lobby', back_populates='users')
 
     words = relationship('HiddenWord', back_populates='user', uselist=True)
@@ -22,16 +22,28 @@ class User(Base):
     @classmethod
     async def get(cls, tg_id: int, session: AsyncSession) -> User | None:
         '''
-        Получить юзера с его лобби
+        Получить юзера с его лобби.
+        Если юзер уже загружен в этой сессии - запроса в БД не будет.
         :param tg_id:
         :param session:
         :return:
         '''
-        user = (await session.execute(
-            select(cls).options(selectinload(cls.lobby)).where(cls.tg_id == tg_id)
-        )).scalar_one_or_none()
+        user = await session.get(cls, tg_id, options=[selectinload(cls.lobby)])
+        if user is not None and 'lobby' in inspect(user).unloaded:
+            await session.refresh(user, attribute_names=['lobby'])
         return user
 
+    @classmethod
+    async def get_lobby_id(cls, tg_id: int, async_session=async_read_session_maker) -> int | None:
+        '''
+        В каком лобби юзер. Одним запросом по колонке, без загрузки юзера и лобби.
+        :param tg_id:
+        :param async_session:
+        :return: chat_id лобби или None, если юзер ни в одном.
+        '''
+        async with async_session() as session:
+            return (await session.execute(select(cls.lobby_id).where(cls.tg_id == tg_id))).scalar()
+
     @classmethod
     async def create(cls, session: AsyncSession, tg_id: int, name: str, username: str, lobby_id: int) -> User:
         '''
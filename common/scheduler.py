@@ -0,0 +1,111 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Hashable
+
+from common.chat_executor import chat_executor
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    '''
+    Все отложенные действия бота на одной задаче: куча дедлайнов и ожидание до ближайшего.
+    Каждое действие хранится под ключом, повторный schedule с тем же ключом заменяет старое.
+    Само состояние таймеров живёт в БД, после рестарта его заново планируют reload-функции.
+    '''
+
+    def __init__(self):
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._jobs: dict[Hashable, tuple[int, Callable[..., Awaitable], tuple, int | None]] = {}
+        self._seq = itertools.count()
+        self._running: set[asyncio.Task] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def schedule_in(self, key: Hashable, seconds: float, callback: Callable[..., Awaitable], *args,
+                    chat_id: int | None = None) -> None:
+        '''
+        Запланировать callback(*args) через seconds секунд.
+        :param key: Ключ действия, например ('word_filling', chat_id).
+        :param seconds:
+        :param callback: Корутина-функция.
+        :param args:
+        :param chat_id: Действие меняет игру этого чата - выполнить его в очереди чата вместе с апдейтами.
+        :return:
+        '''
+        seq = next(self._seq)
+        deadline = asyncio.get_running_loop().time() + max(seconds, 0)
+        self._jobs[key] = (seq, callback, args, chat_id)
+        heapq.heappush(self._heap, (deadline, seq, key))
+        if self._wakeup is not None and self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def schedule(self, key: Hashable, when: datetime.datetime, callback: Callable[..., Awaitable], *args,
+                 chat_id: int | None = None) -> None:
+        '''
+        Запланировать callback(*args) на момент when (UTC без таймзоны, как в CountdownTimer).
+        Если момент уже прошёл - действие выполнится сразу.
+        '''
+        self.schedule_in(key, (when - datetime.datetime.utcnow()).total_seconds(), callback, *args, chat_id=chat_id)
+
+    def schedule_at(self, key: Hashable, timestamp: float, callback: Callable[..., Awaitable], *args,
+                    chat_id: int | None = None) -> None:
+        '''
+        Запланировать callback(*args) на unix-время timestamp.
+        '''
+        self.schedule_in(key, timestamp - time.time(), callback, *args, chat_id=chat_id)
+
+    def cancel(self, key: Hashable) -> None:
+        self._jobs.pop(key, None)
+
+    def is_scheduled(self, key: Hashable) -> bool:
+        return key in self._jobs
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, seq, key = heapq.heappop(self._heap)
+                job = self._jobs.get(key)
+                if job is None or job[0] != seq:
+                    continue
+                del self._jobs[key]
+                task = asyncio.create_task(self._run(key, job[1], job[2], job[3]))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    async def _run(key: Hashable, callback: Callable[..., Awaitable], args: tuple, chat_id: int | None):
+        try:
+            if chat_id is None:
+                await callback(*args)
+            else:
+                async with chat_executor.slot(chat_id):
+                    await callback(*args)
+        except Exception:
+            logger.exception('scheduled_job_failed', extra={'key': repr(key)})
+
+
+scheduler = Scheduler()
@@ -1,10 +1,9 @@
 import abc
-import asyncio
+import datetime
 from abc import ABC
 
 from aiogram.types import message
 
-import config
 from lobby.controllers import WordProviderController
 from lobby.errors import EmptyParty, FillerAlreadyUsed, GameIsRunning
 from lobby.views import WordProviderTgView
@@ -21,15 +20,21 @@ class GameService(ABC):
 
 class WordProviderService():
     @staticmethod
-    async def run_timer(message: message):
-        await WordProviderController().start(message=message)
-        await asyncio.sleep(config.send_word_seconds)
-        await WordProviderController().close_chat(message=message)
+    async def start_timer(message: message, game_name: str) -> datetime.datetime:
+        return await WordProviderController().start(message=message, game_name=game_name)
 
     @staticmethod
-    async def word_counter(message: message) -> int:
-        return await WordProviderController().count_words(message=message)
+    async def close_chat(chat_id: int):
+        await WordProviderController().close_chat(chat_id=chat_id)
 
     @staticmethod
-    async def get_shuffled_trimed_words(message: message, max_word_count: int) -> list[str]:
-        return await WordProviderController().shuffle_and_trim_words(message=message, max_word_count=max_word_count)
+    async def reopen_chat(chat_id: int):
+        await WordProviderController().reopen_chat(chat_id=chat_id)
+
+    @staticmethod
+    async def word_counter(chat_id: int) -> int:
+        return await WordProviderController().count_words(chat_id=chat_id)
+
+    @staticmethod
+    async def get_shuffled_trimed_words(chat_id: int, max_word_count: int) -> list[str]:
+        return await WordProviderController().shuffle_and_trim_words(chat_id=chat_id, max_word_count=max_word_count)
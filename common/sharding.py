@@ -0,0 +1,58 @@
+import os
+
+import config
+
+# Через переменные окружения супервизор говорит процессу-обработчику, какие чаты его и как принимать апдейты.
+SHARD_ENV = 'BOT_SHARD'
+SECRET_ENV = 'BOT_SHARD_SECRET'
+
+
+def shard_of(chat_id: int, count: int) -> int:
+    '''
+    Номер обработчика, которому принадлежит чат. Остаток от деления не зависит от запуска,
+    в отличие от hash() строк, поэтому фронт и обработчики считают его одинаково.
+    '''
+    return chat_id % count
+
+
+class Shard:
+    '''
+    Какую часть чатов обслуживает этот процесс. Без шардирования - все чаты.
+    '''
+
+    def __init__(self, index: int = 0, count: int = 1, secret: str = ''):
+        self.index = index
+        self.count = count
+        # Секрет, с которым фронт пересылает апдейты этому обработчику.
+        self.secret = secret
+
+    @property
+    def is_worker(self) -> bool:
+        return self.count > 1
+
+    def owns(self, chat_id: int) -> bool:
+        return shard_of(chat_id, self.count) == self.index
+
+
+current_shard = Shard()
+
+
+def configure_worker_from_env() -> bool:
+    '''
+    Если процесс запущен супервизором как обработчик - запомнить его долю чатов и поправить
+    настройки, которые нельзя делить между процессами. Вызывать до импорта модулей бота:
+    синглтоны берут значения из config при импорте.
+    :return: Процесс - обработчик.
+    '''
+    value = os.environ.get(SHARD_ENV)
+    if not value:
+        return False
+    index, count = (int(part) for part in value.split('/'))
+    current_shard.index = index
+    current_shard.count = count
+    current_shard.secret = os.environ.get(SECRET_ENV, '')
+    # Фронт слушает порт метрик сам, обработчики - следующие за ним.
+    config.metrics_port += 1 + index
+    # Общий лимит Bot API один на бота, обработчики делят его поровну.
+    config.outbox_global_per_second /= count
+    return True
@@ -0,0 +1,32 @@
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    '''
+    Сколько занимает каждая фаза запуска бота - от старта процесса до приёма апдейтов.
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def report(self):
+        logger.info('startup', extra={
+            'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in self.phases},
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+        })
+
+
+startup_report = StartupReport()
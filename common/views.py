@@ -1,6 +1,6 @@
 from aiogram.types import Message
 
-from telegram.consts import bot
+from telegram.outbox import outbox
 
 
 class CommonView:
@@ -27,7 +27,7 @@ class CommandView():
             "Но сильно не спеши, возможно, твои друзья заставят тебя передумать и ты поставишь другую оценку."
             "После того, как все поставили оценки - напишите команду /next."
             "По итогу вы узнаете, что круче, а что не заслуживает вашего внимания.🤔")
-        await message.answer(text=text, parse_mode='Markdown')
+        outbox.send_message(chat_id=message.chat.id, text=text, parse_mode='Markdown')
 
     @staticmethod
     async def start_in_private(message: Message):
@@ -35,4 +35,4 @@ class CommandView():
                 'свою тему одним сообщение, например "Белые носороги".\n'
                 'Не забывай, количество тем, которое ты можешь дать ограничено. 📝\n\n'
                 'Давай добавим яркости этой игре! 🎨 Жду интересных и разнообразных тем! 🌟')
-        await message.answer(text=text, parse_mode='Markdown')
+        outbox.send_message(chat_id=message.chat.id, text=text, parse_mode='Markdown')
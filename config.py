@@ -1,14 +1,84 @@
 import configparser
 
 config = configparser.ConfigParser()
-config.read('config.ini')
+config.read('config.ini', encoding='utf-8')
 max_word_count_roa = int(config['ROA']['MaxWordCount'])
 max_word_count_deb = int(config['DEB']['MaxWordCount'])
 unsplash_api_key = str(config['DEFAULT']['UnsplashApiKey'])
 is_desktop_exist = True if config['DEFAULT']['DesktopUI'] == 'yes' else False
 bot_link = config['DEFAULT']['BotLink']
+db_path = config['DB']['Path']
+db_journal_mode = config['DB']['JournalMode']
+db_synchronous = config['DB']['Synchronous']
+db_busy_timeout_ms = int(config['DB']['BusyTimeoutMs'])
+db_cache_size = int(config['DB']['CacheSize'])
+db_mmap_size = int(config['DB']['MmapSize'])
+db_read_pool_size = int(config['DB']['ReadPoolSize'])
+db_writer_timeout_seconds = float(config['DB']['WriterTimeoutSeconds'])
+game_data_compress_threshold = int(config['DB']['CompressThreshold'])
+game_snapshot_every = int(config['DB']['SnapshotEvery'])
+db_slow_query_ms = float(config['DB']['SlowQueryMs'])
+game_conflict_retries = int(config['DB']['ConflictRetries'])
+log_level = config['LOGGING']['Level']
+log_file = config['LOGGING']['File']
+log_sample_rates = {
+    'DEBUG': float(config['LOGGING']['DebugSampleRate']),
+    'INFO': float(config['LOGGING']['InfoSampleRate']),
+}
+bot_api_server = config['BOTAPI']['Server'].rstrip('/')
+metrics_enabled = config['METRICS']['Enabled'] == 'yes'
+metrics_host = config['METRICS']['Host']
+metrics_port = int(config['METRICS']['Port'])
+dispatch_max_concurrency = int(config['DISPATCH']['MaxConcurrentUpdates'])
+webhook_enabled = config['WEBHOOK']['Enabled'] == 'yes'
+webhook_url = config['WEBHOOK']['Url'].rstrip('/')
+webhook_path = config['WEBHOOK']['Path']
+webhook_host = config['WEBHOOK']['Host']
+webhook_port = int(config['WEBHOOK']['Port'])
+webhook_secret_token = config['WEBHOOK']['SecretToken']
+webhook_workers = int(config['WEBHOOK']['Workers'])
+webhook_queue_size = int(config['WEBHOOK']['QueueSize'])
+sharding_workers = int(config['SHARDING']['Workers'])
+sharding_base_port = int(config['SHARDING']['BasePort'])
+sharding_queue_size = int(config['SHARDING']['QueueSize'])
+sharding_restart_delay_seconds = float(config['SHARDING']['RestartDelaySeconds'])
+outbox_global_per_second = float(config['OUTBOX']['GlobalPerSecond'])
+outbox_group_per_minute = float(config['OUTBOX']['GroupPerMinute'])
+outbox_private_per_second = float(config['OUTBOX']['PrivatePerSecond'])
+outbox_chat_burst = int(config['OUTBOX']['ChatBurst'])
+outbox_max_in_flight = int(config['OUTBOX']['MaxInFlight'])
+outbox_max_retries = int(config['OUTBOX']['MaxRetries'])
+http_pool_size = int(config['HTTP']['PoolSize'])
+http_request_timeout_seconds = float(config['HTTP']['RequestTimeoutSeconds'])
+image_fetch_concurrency = int(config['IMAGES']['FetchConcurrency'])
+image_fetch_total_timeout_seconds = float(config['IMAGES']['TotalTimeoutSeconds'])
+image_thumbnail_size = int(config['IMAGES']['ThumbnailSize'])
+image_cache_dir = config['IMAGES']['CacheDir']
+image_cache_max_bytes = int(float(config['IMAGES']['CacheMaxMb']) * 1024 * 1024)
+image_cache_ttl_seconds = float(config['IMAGES']['CacheTtlHours']) * 3600
+image_cache_negative_ttl_seconds = float(config['IMAGES']['NegativeCacheTtlHours']) * 3600
+render_workers = int(config['RENDER']['Workers'])
+render_queue_limit = int(config['RENDER']['QueueLimit'])
+render_timeout_seconds = float(config['RENDER']['TimeoutSeconds'])
+render_profile = config['RENDER']['Profile']
+render_warm_up = config['RENDER']['WarmUp'] == 'yes'
+render_profiles = {
+    section.split(':', 1)[1]: {
+        'dpi': int(config[section]['Dpi']),
+        'format': config[section]['Format'],
+        'max_side': int(config[section]['MaxSide']),
+        'max_bytes': int(config[section]['MaxKb']) * 1024,
+        'quality': int(config[section]['Quality']),
+    }
+    for section in config.sections() if section.startswith('RENDER:')
+}
 send_word_seconds = int(config['ROA']['SendWordSeconds'])
 personal_word_count = int(config['ROA']['PersonalWordCount'])
+roa_flush_seconds = float(config['ROA']['FlushSeconds'])
+roa_score_window_ms = int(config['ROA']['ScoreWindowMs'])
+score_ack_mode = config['ROA']['ScoreAck']
+score_ack_debounce_seconds = float(config['ROA']['ScoreAckDebounceSeconds'])
+score_ack_reaction = config['ROA']['ScoreAckReaction']
 
 sec_between_answers = int(config['DEB']['SecBetweenAnswers'])
 sec_to_answer = int(config['DEB']['SecToAnswer'])
\ No newline at end of file
@@ -1,8 +1,138 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from sqlalchemy.orm import declarative_base, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import config
+from common import metrics
+from .errors import WriteInReadUnit
+from .query_stats import instrument_engine
+
+
+def _pragmas(read_only: bool) -> list[str]:
+    pragmas = [
+        f'PRAGMA busy_timeout = {config.db_busy_timeout_ms:d}',
+        f'PRAGMA cache_size = {config.db_cache_size:d}',
+        f'PRAGMA mmap_size = {config.db_mmap_size:d}',
+    ]
+    if read_only:
+        pragmas.append('PRAGMA query_only = 1')
+    else:
+        pragmas += [
+            f'PRAGMA journal_mode = {config.db_journal_mode}',
+            f'PRAGMA synchronous = {config.db_synchronous}',
+        ]
+    return pragmas
+
+
+def create_engines(path: str = config.db_path, read_pool_size: int = config.db_read_pool_size
+                   ) -> tuple[AsyncEngine, AsyncEngine]:
+    '''
+    Создать движок-писатель с единственным соединением и пул соединений только для чтения.
+    Все записи идут по очереди через одно соединение, поэтому писатели не ловят
+    "database is locked" друг от друга, а в режиме WAL читатели не ждут писателя.
+    :param path: Путь к файлу SQLite.
+    :param read_pool_size: Сколько соединений держать для чтения.
+    :return: (писатель, читатели)
+    '''
+    writer = create_async_engine(
+        f'sqlite+aiosqlite:///{path}',
+        poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0,
+        pool_timeout=config.db_writer_timeout_seconds,
+    )
+    readers = create_async_engine(
+        f'sqlite+aiosqlite:///file:{path}?mode=ro&uri=true',
+        poolclass=AsyncAdaptedQueuePool, pool_size=read_pool_size, max_overflow=0,
+    )
+    for created, read_only in ((writer, False), (readers, True)):
+        @event.listens_for(created.sync_engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record, read_only=read_only):
+            cursor = dbapi_connection.cursor()
+            for pragma in _pragmas(read_only=read_only):
+                cursor.execute(pragma)
+            cursor.close()
+    return writer, readers
+
+
+def instrument_transactions():
+    '''
+    Считать транзакции всех сессий и их длительность в метриках.
+    Читающие сессии обычно заканчиваются откатом при закрытии - это их нормальный исход.
+    '''
+    @event.listens_for(Session, 'after_begin')
+    def transaction_started(session, transaction, connection):
+        engine_kind = 'read' if connection.engine.url.query.get('mode') == 'ro' else 'write'
+        session.info['transaction_started'] = (time.perf_counter(), engine_kind)
+
+    def finished(session, outcome: str):
+        started = session.info.pop('transaction_started', None)
+        if started is not None:
+            metrics.db_transaction_seconds.observe(time.perf_counter() - started[0], started[1], outcome)
+
+    event.listen(Session, 'after_commit', lambda session: finished(session, 'commit'))
+    event.listen(Session, 'after_rollback', lambda session: finished(session, 'rollback'))
+
+
+if config.metrics_enabled:
+    instrument_transactions()
 
 # Создание файла базы данных SQLite
-engine = create_async_engine('sqlite+aiosqlite:///database.db')
+engine, read_engine = create_engines()
+instrument_engine(engine)
+instrument_engine(read_engine)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
+# Для поиска без изменений: участники лобби, название игры, загрузка игры в кэш.
+async_read_session_maker = async_sessionmaker(read_engine, expire_on_commit=False)
 
 Base = declarative_base()
+
+# Сессия текущей единицы работы, задача, которая её открыла, и открыта ли она только для чтения.
+_current_unit: ContextVar[tuple[AsyncSession, asyncio.Task, bool] | None] = ContextVar('current_unit', default=None)
+
+
+def _is_read_only(async_session) -> bool:
+    bind = getattr(async_session, 'kw', {}).get('bind')
+    return bind is not None and bind.url.query.get('mode') == 'ro'
+
+
+@asynccontextmanager
+async def unit_of_work(async_session=async_session_maker):
+    '''
+    Одна сессия и одна транзакция на весь блок.
+    Вложенные unit_of_work в той же задаче переиспользуют уже открытую сессию,
+    поэтому проверки-декораторы и сам метод модели работают в одной транзакции,
+    а уже загруженные объекты берутся из identity map сессии без повторных запросов.
+    Фоновые задачи, созданные внутри блока, открывают свою сессию.
+    Читать внутри пишущего блока можно, а писать внутри читающего - WriteInReadUnit:
+    его соединение открыто только для чтения.
+    :param async_session:
+    :return:
+    '''
+    read_only = _is_read_only(async_session)
+    unit = _current_unit.get()
+    if unit is not None and unit[1] is asyncio.current_task():
+        if unit[2] and not read_only:
+            raise WriteInReadUnit()
+        yield unit[0]
+        return
+
+    async with async_session() as session:
+        async with session.begin():
+            token = _current_unit.set((session, asyncio.current_task(), read_only))
+            try:
+                yield session
+            finally:
+                _current_unit.reset(token)
+
+
+def in_unit_of_work() -> bool:
+    '''
+    Текущая задача уже внутри unit_of_work - значит, транзакцией управляет внешний код.
+    '''
+    unit = _current_unit.get()
+    return unit is not None and unit[1] is asyncio.current_task()
@@ -0,0 +1,10 @@
+class FullTableScan(Exception):
+    def __init__(self, message="Запрос читает таблицу целиком"):
+        self.msg = f'Запросы без индекса:\n{message}'
+        super().__init__(self.msg)
+
+
+class WriteInReadUnit(Exception):
+    def __init__(self, message="Запись внутри unit_of_work только для чтения"):
+        self.msg = message
+        super().__init__(self.msg)
@@ -0,0 +1,129 @@
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from sqlalchemy import select, func, update
+
+import roa_game.models
+import game_manager.models
+import debate_game.models
+
+from .core import engine, async_session_maker
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Migration:
+    '''
+    Одна версия схемы. Номер последней применённой версии хранится в PRAGMA user_version.
+    statements выполняются одной транзакцией, run - для переноса данных, открывает свои сессии.
+    Все statements должны быть идемпотентными: на новой базе create_all уже создал всё из моделей.
+    Новые колонки описываются в columns - они добавляются только если их ещё нет.
+    '''
+    version: int
+    description: str
+    statements: tuple[str, ...] = ()
+    # (таблица, колонка, DDL-тип). Колонка добавляется, только если её ещё нет.
+    columns: tuple[tuple[str, str, str], ...] = ()
+    run: Callable[[], Awaitable] | None = None
+
+
+async def reencode_game_data(batch_size: int = 500, async_session=async_session_maker) -> int:
+    '''
+    Перекодировать игры, сохранённые в старом JSON-формате, в бинарный формат.
+    Строки, которые уже бинарные, не трогаются, поэтому запускать можно сколько угодно раз.
+    :param batch_size: Сколько игр перекодировать за одну транзакцию.
+    :param async_session:
+    :return: Количество перекодированных игр.
+    '''
+    instance_classes = {
+        game_manager.models.GameTitles.rate_off_all.value: roa_game.models.RoaInstance,
+        game_manager.models.GameTitles.debate.value: debate_game.models.DebateGameInstance,
+    }
+    Game = game_manager.models.Game
+    total = 0
+    last_id = 0
+    while True:
+        async with async_session() as session:
+            async with session.begin():
+                rows = (await session.execute(
+                    select(Game.game_id, Game.game_name, Game.game_data)
+                    .where(Game.game_id > last_id, func.typeof(Game.game_data) == 'text')
+                    .order_by(Game.game_id)
+                    .limit(batch_size)
+                )).all()
+                for game_id, game_name, game_data in rows:
+                    last_id = game_id
+                    try:
+                        instance = await instance_classes[game_name].deserialize(game_data)
+                    except (KeyError, ValueError) as e:
+                        logger.warning('game_reencode_failed', extra={'game_id': game_id, 'error': repr(e)})
+                        continue
+                    await session.execute(
+                        update(Game).where(Game.game_id == game_id).values(game_data=await instance.serialize())
+                    )
+                    total += 1
+        if len(rows) < batch_size:
+            return total
+
+
+MIGRATIONS = [
+    Migration(
+        version=1,
+        description='Индексы для поиска слов по лобби и юзеру, участников по лобби и журнала игры',
+        statements=(
+            'CREATE INDEX IF NOT EXISTS ix_hidden_word_lobby_id_value ON hidden_word (lobby_id, value)',
+            'CREATE INDEX IF NOT EXISTS ix_hidden_word_user_id ON hidden_word (user_id)',
+            'CREATE INDEX IF NOT EXISTS ix_user_lobby_id ON user (lobby_id)',
+            'CREATE INDEX IF NOT EXISTS ix_game_event_lobby_id_snapshotted ON game_event (lobby_id, snapshotted)',
+        ),
+    ),
+    Migration(
+        version=2,
+        description='Перекодировать game_data из JSON в бинарный формат',
+        run=reencode_game_data,
+    ),
+    Migration(
+        version=3,
+        description='Игра, которую запускает таймер приёма тем',
+        columns=(('countdown_timers', 'game_name', 'VARCHAR'),),
+    ),
+    Migration(
+        version=4,
+        description='Версия игры для оптимистичной блокировки',
+        columns=(('game', 'version', 'INTEGER NOT NULL DEFAULT 0'),),
+    ),
+]
+
+
+async def get_schema_version(engine=engine) -> int:
+    async with engine.connect() as conn:
+        return (await conn.exec_driver_sql('PRAGMA user_version')).scalar()
+
+
+async def run_migrations(migrations: list[Migration] = MIGRATIONS, engine=engine) -> int:
+    '''
+    Применить все миграции новее текущей версии схемы.
+    :param migrations:
+    :param engine:
+    :return: Версия схемы после применения.
+    '''
+    current = await get_schema_version(engine=engine)
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= current:
+            continue
+        async with engine.begin() as conn:
+            for table, column, ddl in migration.columns:
+                existing = {row[1] for row in (await conn.exec_driver_sql(f'PRAGMA table_info({table})')).all()}
+                if column not in existing:
+                    await conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+            for statement in migration.statements:
+                await conn.exec_driver_sql(statement)
+        if migration.run is not None:
+            await migration.run()
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql(f'PRAGMA user_version = {migration.version:d}')
+        current = migration.version
+        logger.info('migration_applied', extra={'version': migration.version, 'description': migration.description})
+    return current
@@ -0,0 +1,51 @@
+from typing import Callable
+
+from sqlalchemy import select, func
+from sqlalchemy.sql import Select
+
+from common.models import User
+from game_manager.models import Game, GameEvent
+from lobby.models import HiddenWord, CountdownTimer
+
+from .core import engine
+from .errors import FullTableScan
+
+# Запросы с горячих путей бота. Для каждого план SQLite не должен быть полным проходом по таблице.
+HOT_QUERIES: dict[str, Callable[[], Select]] = {
+    'hidden_word by lobby and value': lambda: select(HiddenWord).where(
+        HiddenWord.lobby_id == 1, HiddenWord.value == 'тема'),
+    'hidden_word distinct by lobby': lambda: select(HiddenWord.value).distinct().where(HiddenWord.lobby_id == 1),
+    'hidden_word count by lobby': lambda: select(func.count()).select_from(HiddenWord).where(
+        HiddenWord.lobby_id == 1),
+    'hidden_word count by user': lambda: select(func.count()).select_from(HiddenWord).where(
+        HiddenWord.user_id == 1),
+    'user by lobby': lambda: select(User).where(User.lobby_id.in_([1])),
+    'game by lobby': lambda: select(Game).where(Game.lobby_id == 1),
+    'game_event pending by lobby': lambda: select(GameEvent).where(
+        GameEvent.lobby_id == 1, GameEvent.snapshotted.is_(False)).order_by(GameEvent.id),
+    'countdown_timer by lobby': lambda: select(CountdownTimer).where(CountdownTimer.lobby_id == 1),
+}
+
+
+def is_full_scan(detail: str) -> bool:
+    return detail.startswith('SCAN ') and 'INDEX' not in detail and detail != 'SCAN CONSTANT ROW'
+
+
+async def check_query_plans(queries: dict[str, Callable[[], Select]] = HOT_QUERIES, engine=engine):
+    '''
+    Прогнать EXPLAIN QUERY PLAN для зарегистрированных запросов.
+    Если какой-то из них читает таблицу целиком - FullTableScan.
+    :param queries:
+    :param engine:
+    :return:
+    '''
+    failed = []
+    async with engine.connect() as conn:
+        for name, build in queries.items():
+            sql = str(build().compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+            plan = (await conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')).all()
+            scans = [row[-1] for row in plan if is_full_scan(row[-1])]
+            if scans:
+                failed.append(f'{name}: {"; ".join(scans)}')
+    if failed:
+        raise FullTableScan('\n'.join(failed))
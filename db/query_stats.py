@@ -0,0 +1,89 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Сколько самых медленных запросов помнить на один апдейт.
+SLOWEST_KEPT = 3
+
+
+class QueryStats:
+    '''
+    Запросы одной единицы работы бота (обычно одного апдейта): сколько, сколько времени и самые медленные.
+    '''
+
+    def __init__(self, parent: 'QueryStats | None' = None):
+        # Внешний track_queries: вложенный замер учитывает запросы и в нём.
+        self.parent = parent
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest: list[tuple[float, str]] = []
+        self.statements: list[str] = []
+        self.closed = False
+
+    def add(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements.append(statement)
+        if len(self.slowest) < SLOWEST_KEPT or seconds > self.slowest[-1][0]:
+            self.slowest.append((seconds, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[SLOWEST_KEPT:]
+        if self.parent is not None and not self.parent.closed:
+            self.parent.add(statement, seconds)
+
+    def as_fields(self) -> dict:
+        return {
+            'queries': self.count,
+            'db_ms': round(self.seconds * 1000, 2),
+            'slowest': [{'ms': round(seconds * 1000, 2), 'sql': statement[:200]} for seconds, statement in self.slowest],
+        }
+
+
+_current_stats: ContextVar[QueryStats | None] = ContextVar('current_query_stats', default=None)
+
+
+@contextmanager
+def track_queries():
+    '''
+    Считать запросы, выполненные в этом контексте. Вложенные замеры тоже попадают во внешний.
+    Фоновые задачи, созданные внутри, наследуют контекст, но после выхода их запросы уже не считаются.
+    :return: QueryStats, который заполняется по мере выполнения запросов.
+    '''
+    stats = QueryStats(parent=_current_stats.get())
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        stats.closed = True
+        _current_stats.reset(token)
+
+
+def instrument_engine(engine: AsyncEngine, slow_query_ms: float = config.db_slow_query_ms):
+    '''
+    Повесить на движок замер каждого запроса: учёт в текущем track_queries и лог медленных запросов.
+    :param engine:
+    :param slow_query_ms: Запросы дольше этого пишутся в лог slow_query. 0 - не писать.
+    :return:
+    '''
+    slow_seconds = slow_query_ms / 1000
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def query_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def query_finished(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['query_started'].pop()
+        stats = _current_stats.get()
+        if stats is not None and not stats.closed:
+            stats.add(statement, seconds)
+        if slow_seconds and seconds >= slow_seconds:
+            logger.warning('slow_query', extra={'duration_ms': round(seconds * 1000, 2), 'sql': statement[:1000]})
@@ -1,3 +1,4 @@
+import logging
 
 import roa_game.models
 import game_manager.models
@@ -6,7 +7,21 @@ import lobby.models
 import debate_game.models
 
 from .core import Base, engine
+from .errors import FullTableScan
+from .migrations import run_migrations
+from .query_plans import check_query_plans
+
+logger = logging.getLogger(__name__)
+
+
 async def create_tables():
     async with engine.begin() as conn:
         # await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+    await run_migrations()
+    # При старте план только пишется в лог: бот медленнее без индекса, но работает.
+    # Проверку с кодом выхода запускает разработчик: python -m benchmarks.query_plans.
+    try:
+        await check_query_plans()
+    except FullTableScan as e:
+        logger.warning('query_plan_full_scan', extra={'plans': e.msg})
@@ -1,7 +1,7 @@
 from aiogram.types import Message
 
 from common.controllers import Controller
-from debate_game.models import DebateGame
+from debate_game.models import DebateGame, TurnStep
 from debate_game.views import DebateGameTgView
 
 
@@ -9,8 +9,7 @@ class DebateGameController(Controller):
     def __init__(self, view: DebateGameTgView = DebateGameTgView(), model: DebateGame = DebateGame()):
         super().__init__(view, model)
 
-    async def create(self, message: Message, words_list: list[str]):
-        chat_id = message.chat.id
+    async def create(self, chat_id: int, words_list: list[str]):
         await self.model.create(chat_id=chat_id, words_list=words_list)
         await self.view.create(chat_id=chat_id)
 
@@ -22,13 +21,7 @@ class DebateGameController(Controller):
         chat_id = message.chat.id
         return await self.model.get_players_count(chat_id=chat_id)
 
-    async def set_score(self, message: Message, player_name, score):
-        chat_id = message.chat.id
-        await self.model.set_score(chat_id=chat_id, player_name=player_name, score=score)
-
-    async def get_player_names(self, message: Message):
-        chat_id = message.chat.id
-
+    async def get_player_names(self, chat_id: int):
         return await self.model.get_player_names(chat_id=chat_id)
 
     async def add_player(self, message: Message):
@@ -39,10 +32,6 @@ class DebateGameController(Controller):
         await self.model.add_player(player=(player_id, player_name), chat_id=chat_id)
         await self.view.add_player(chat_id=chat_id, username=player_name)
 
-    async def next_word(self, message: Message):
-        chat_id = message.chat.id
-        await self.model.next_word(chat_id=chat_id)
-
     async def get_round_info(self, message: Message):
         chat_id = message.chat.id
 
@@ -53,31 +42,38 @@ class DebateGameController(Controller):
         chat_id = message.chat.id
         return await self.model.get_state(chat_id=chat_id)
 
-    async def get_current_player(self, message: Message):
-        chat_id = message.chat.id
-        player_name, player_position = await self.model.get_current_player(chat_id=chat_id)
-        await self.view.get_current_player(chat_id=chat_id, username=player_name, position=player_position)
-
-    async def stop_answer(self, message: Message):
-        chat_id = message.chat.id
-        player_name, _ = await self.model.get_current_player(chat_id=chat_id)
-        await self.view.stop_answer(chat_id=chat_id, username=player_name)
-
-    async def switch_player(self, message: Message):
-        chat_id = message.chat.id
-        await self.model.switch_player(chat_id=chat_id)
+    async def get_state(self, chat_id: int):
+        return await self.model.get_state(chat_id=chat_id)
 
-    async def set_poll_id(self, message: Message, poll_id: int):
-        chat_id = message.chat.id
+    async def begin_answers(self, chat_id: int) -> int | None:
+        step = await self.model.begin_answers(chat_id=chat_id)
+        if step is None:
+            return None
+        await self.view.get_current_player(chat_id=chat_id, username=step.player_name, position=step.player_position)
+        return step.deadline
+
+    async def advance_turn(self, chat_id: int, deadline: int) -> TurnStep | None:
+        step = await self.model.advance_turn(chat_id=chat_id, deadline=deadline)
+        if step is None:
+            return None
+        if step.state == 'answering':
+            await self.view.get_current_player(chat_id=chat_id, username=step.player_name,
+                                               position=step.player_position)
+        else:
+            await self.view.stop_answer(chat_id=chat_id, username=step.player_name)
+        return step
+
+    async def set_poll_id(self, chat_id: int, poll_id: int):
         await self.model.set_poll_id(chat_id=chat_id, poll_id=poll_id)
 
-    async def get_poll_id(self, message: Message):
-        chat_id = message.chat.id
+    async def get_poll_id(self, chat_id: int) -> int | None:
         return await self.model.get_poll_id(chat_id=chat_id)
 
-    async def finish_round(self, message: Message):
-        chat_id = message.chat.id
-        await self.model.finish_round(chat_id=chat_id)
+    async def count_votes(self, chat_id: int, poll_id: int | None, votes: dict[str, int]) -> bool:
+        return await self.model.count_votes(chat_id=chat_id, poll_id=poll_id, votes=votes)
+
+    async def pending_turns(self) -> list[tuple[int, int | None]]:
+        return await self.model.get_pending_turns()
 
     async def new_round(self, message: Message):
         chat_id = message.chat.id
@@ -1,15 +1,28 @@
+import logging
+
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.core import async_session_maker
+import config
+from db.core import async_session_maker, async_read_session_maker, unit_of_work
+from game_manager.codec import GameDataWriter, GameDataReader, is_binary
+from game_manager import middlewares
 from game_manager.errors import GameIsDone
 
-from game_manager.models import Game
+from game_manager.models import Game, GameTitles
 from roa_game.errors import GameIsNotExist
 
 from dataclasses import dataclass
 import json
+import math
 import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# В этих состояниях /next считает голоса. counting осталось у игр, сохранённых,
+# пока подсчёт шёл отдельной транзакцией после закрытия голосования.
+VOTING_STATES = ('ready_for_next_word', 'counting')
 
 
 @dataclass
@@ -36,7 +49,24 @@ class Result:
     winner_name: str
 
 
+@dataclass
+class TurnStep:
+    state: str
+    # Кто говорит (answering) или кто только что закончил (between_answers, voting_pending).
+    player_name: str
+    player_position: str
+    deadline: int | None
+
+
 class DebateGameInstance:
+    '''
+    Раунд дебатов - цепочка состояний:
+    ready_for_answer -(/next)-> answering -(дедлайн)-> between_answers -(дедлайн)-> answering
+    -(дедлайн)-> voting_pending -(опрос отправлен)-> ready_for_next_word -(/next, подсчёт голосов)
+    -> ready_for_answer следующей темы.
+    Дедлайн хода хранится в самой игре (unix-время, секунды), поэтому переживает рестарт.
+    '''
+
     def __init__(self, words, state=None, last_poll_id=None):
         self.words = words
         self.players = []
@@ -48,6 +78,7 @@ class DebateGameInstance:
         self.can_switch_player = True
         self.state = state
         self.last_poll_id = last_poll_id
+        self.deadline = None
 
     async def add_player(self, player):
         if len(self.players) >= 2:
@@ -134,23 +165,55 @@ class DebateGameInstance:
         else:
             return None
 
-    async def serialize(self):
-        game_data = {
-            "words": self.words,
-            "players": self.players,
-            "current_round": self.current_round,
-            "current_word": self.current_word,
-            "current_player_index": self.current_player_index,
-            "scores": self.scores,
-            "positions": self.positions,
-            "can_switch_player": self.can_switch_player,
-            "state": self.state,
-            "last_poll_id": self.last_poll_id
-        }
-        return json.dumps(game_data, default=lambda o: o.__dict__, indent=4)
+    async def serialize(self) -> bytes:
+        writer = GameDataWriter()
+        writer.uint(len(self.words))
+        for word in self.words:
+            writer.text(word)
+        writer.uint(len(self.players))
+        for player_id, player_name in self.players:
+            writer.sint(player_id)
+            writer.text(player_name)
+        writer.uint(self.current_round)
+        writer.optional_text(self.current_word)
+        writer.uint(self.current_player_index)
+        writer.uint(len(self.scores))
+        for player_name, score in self.scores.items():
+            writer.text(player_name)
+            writer.sint(score)
+        writer.uint(len(self.positions))
+        for player_name, position in self.positions.items():
+            writer.text(player_name)
+            writer.optional_text(position)
+        writer.flag(self.can_switch_player)
+        writer.optional_text(self.state)
+        writer.optional_sint(self.last_poll_id)
+        writer.optional_sint(self.deadline)
+        return writer.pack()
+
+    @classmethod
+    async def deserialize(cls, data):
+        if not is_binary(data):
+            return await cls.deserialize_json(data)
+        reader = GameDataReader(data)
+        game = cls([reader.text() for _ in range(reader.uint())])
+        game.players = [[reader.sint(), reader.text()] for _ in range(reader.uint())]
+        game.current_round = reader.uint()
+        game.current_word = reader.optional_text()
+        game.current_player_index = reader.uint()
+        game.scores = {reader.text(): reader.sint() for _ in range(reader.uint())}
+        game.positions = {reader.text(): reader.optional_text() for _ in range(reader.uint())}
+        game.can_switch_player = reader.flag()
+        game.state = reader.optional_text()
+        game.last_poll_id = reader.optional_sint()
+        game.deadline = reader.optional_sint() if reader.version >= 2 else None
+        return game
 
     @classmethod
-    async def deserialize(cls, json_data):
+    async def deserialize_json(cls, json_data):
+        '''
+        Старый JSON-формат. Оставлен для строк, которые ещё не перекодированы.
+        '''
         decoded_data = json.loads(json_data)
         game = cls(decoded_data['words'], decoded_data['state'], decoded_data['last_poll_id'])
         game.players = decoded_data['players']
@@ -164,17 +227,81 @@ class DebateGameInstance:
 
     async def set_poll_id(self, poll_id):
         self.last_poll_id = poll_id
+        # /next начинает подсчёт только когда опрос уже в чате.
+        if self.state == 'voting_pending':
+            self.state = 'ready_for_next_word'
+
+    async def apply_event(self, kind: str, payload: dict):
+        '''
+        Доиграть событие из журнала GameEvent поверх снимка.
+        :param kind:
+        :param payload:
+        :return:
+        '''
+        if kind == 'player_added':
+            await self.add_player(tuple(payload['player']))
+        elif kind == 'player_switched':
+            await self.switch_to_next_player()
+        elif kind == 'score_set':
+            await self.set_round_score(player_name=payload['player_name'], score=payload['score'])
+        elif kind == 'poll_attached':
+            await self.set_poll_id(payload['poll_id'])
+        elif kind == 'state_changed':
+            self.state = payload['state']
+        elif kind == 'turn_changed':
+            self.state = payload['state']
+            self.current_player_index = payload['player_index']
+            self.can_switch_player = payload['can_switch_player']
+            self.deadline = payload['deadline']
+
+    def turn_payload(self) -> dict:
+        return {'state': self.state, 'player_index': self.current_player_index,
+                'can_switch_player': self.can_switch_player, 'deadline': self.deadline}
+
+    async def begin_answers(self, now: float) -> bool:
+        '''
+        Дать слово первому игроку. Повторный /next во время раунда ничего не делает.
+        :param now: Текущее unix-время.
+        :return: Перешла ли игра в новое состояние.
+        '''
+        if self.state != 'ready_for_answer':
+            return False
+        self.state = 'answering'
+        self.current_player_index = 0
+        self.can_switch_player = True
+        self.deadline = math.ceil(now) + config.sec_to_answer
+        return True
+
+    async def advance_turn(self, deadline: int, now: float) -> bool:
+        '''
+        Следующий шаг раунда по истечении дедлайна.
+        Срабатывает только для того дедлайна, который сейчас выставлен, поэтому повторный вызов ничего не делает.
+        :param deadline: Дедлайн, по которому сработал таймер.
+        :param now: Текущее unix-время.
+        :return: Перешла ли игра в новое состояние.
+        '''
+        if self.deadline is None or self.deadline != deadline:
+            return False
+        if self.state == 'answering' and self.current_player_index + 1 < len(self.players):
+            self.state = 'between_answers'
+            self.deadline = math.ceil(now) + config.sec_between_answers
+        elif self.state == 'between_answers':
+            await self.switch_to_next_player()
+            self.state = 'answering'
+            self.deadline = math.ceil(now) + config.sec_to_answer
+        else:
+            self.state = 'voting_pending'
+            self.deadline = None
+        return True
+
+    async def get_turn_step(self) -> TurnStep:
+        player_name = self.players[self.current_player_index][1]
+        return TurnStep(state=self.state, player_name=player_name, player_position=self.positions[player_name],
+                        deadline=self.deadline)
 
     async def get_poll_id(self):
         return self.last_poll_id
 
-    async def get_current_player(self):
-        self.state = 'answering'
-        current_player = self.players[self.current_player_index]
-        player_name = current_player[1]
-        player_position = self.positions[player_name]
-        return player_name, player_position
-
     async def get_player_names(self):
         return [player[1] for player in self.players]
 
@@ -209,146 +336,193 @@ class DebateGame(Game):
         return game
 
     async def get_game_data(self) -> DebateGameInstance:
-        return await DebateGameInstance.deserialize(self.game_data)
+        return await self.restore(DebateGameInstance)
 
     async def load_game_data(self, new_game_data: DebateGameInstance):
-        self.game_data = await new_game_data.serialize()
+        await self.snapshot(new_game_data)
+
+    async def __record_turn(self, game_data: DebateGameInstance):
+        await self.record_event(game_data, 'turn_changed', game_data.turn_payload())
 
     @classmethod
     async def create(cls, chat_id, words_list: list[str], async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                await cls.__create(session=session, word_list=words_list, chat_id=chat_id)
+        async with unit_of_work(async_session) as session:
+            await cls.__create(session=session, word_list=words_list, chat_id=chat_id)
 
     @classmethod
+    @middlewares.retry_on_conflict
     async def start(cls, chat_id, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                await game_data.start()
-                await game.load_game_data(new_game_data=game_data)
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            game_data = await game.get_game_data()
+            await game_data.start()
+            await game.load_game_data(new_game_data=game_data)
 
     async def __add_player(self, user_id: int, user_name: str):
         game_data = await self.get_game_data()
         await game_data.add_player((user_id, user_name))
-        await self.load_game_data(new_game_data=game_data)
+        await self.record_event(game_data, 'player_added', {'player': [user_id, user_name]})
 
     @classmethod
+    @middlewares.retry_on_conflict
     async def add_player(cls, chat_id: int, player: tuple[int, str], async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                if game is None:
-                    raise GameIsNotExist()
-                await game.__add_player(user_id=player[0], user_name=player[1])
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            if game is None:
+                raise GameIsNotExist()
+            await game.__add_player(user_id=player[0], user_name=player[1])
 
     @classmethod
-    async def get_players_count(cls, chat_id: int, async_session=async_session_maker) -> int:
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                return await game_data.get_players_count()
+    async def get_players_count(cls, chat_id: int, async_session=async_read_session_maker) -> int:
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            game_data = await game.get_game_data()
+            return await game_data.get_players_count()
 
     @classmethod
-    async def get_state(cls, chat_id: int, async_session=async_session_maker) -> int:
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                return await game_data.get_state()
+    async def get_state(cls, chat_id: int, async_session=async_read_session_maker) -> int:
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            game_data = await game.get_game_data()
+            return await game_data.get_state()
 
     @classmethod
-    async def get_round_info(cls, chat_id: int, async_session=async_session_maker) -> RoundInfo:
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                round_info = await game_data.get_round_info()
-                return round_info
+    async def get_round_info(cls, chat_id: int, async_session=async_read_session_maker) -> RoundInfo:
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            game_data = await game.get_game_data()
+            round_info = await game_data.get_round_info()
+            return round_info
 
     @classmethod
+    @middlewares.retry_on_conflict
     async def set_state_new_round(cls, chat_id, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                game_data.state = 'ready_for_answer'
-                await game.load_game_data(new_game_data=game_data)
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            game_data = await game.get_game_data()
+            game_data.state = 'ready_for_answer'
+            await game.record_event(game_data, 'state_changed', {'state': game_data.state})
 
     @classmethod
-    async def get_current_player(cls, chat_id, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                player_name, player_position = await game_data.get_current_player()
-                await game.load_game_data(game_data)
-                return player_name, player_position
+    @middlewares.retry_on_conflict
+    async def begin_answers(cls, chat_id, async_session=async_session_maker) -> TurnStep | None:
+        '''
+        Начать ответы раунда. Проверка состояния и переход идут одной транзакцией на единственном писателе,
+        поэтому из двух одновременных /next раунд запустит только один.
+        :param chat_id:
+        :param async_session:
+        :return: Первый ход или None, если раунд уже идёт.
+        '''
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            if game is None:
+                raise GameIsNotExist()
+            game_data = await game.get_game_data()
+            if not await game_data.begin_answers(now=time.time()):
+                return None
+            await game.__record_turn(game_data)
+            return await game_data.get_turn_step()
 
     @classmethod
-    async def switch_player(cls, chat_id, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                await game_data.switch_to_next_player()
-                await game.load_game_data(game_data)
+    @middlewares.retry_on_conflict
+    async def advance_turn(cls, chat_id, deadline: int, async_session=async_session_maker) -> TurnStep | None:
+        '''
+        Перейти к следующему ходу по дедлайну.
+        :param chat_id:
+        :param deadline: Дедлайн, по которому сработал таймер.
+        :param async_session:
+        :return: Новый ход или None, если игры уже нет или дедлайн устарел.
+        '''
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            if game is None:
+                return None
+            game_data = await game.get_game_data()
+            if not await game_data.advance_turn(deadline=deadline, now=time.time()):
+                return None
+            await game.__record_turn(game_data)
+            return await game_data.get_turn_step()
 
     @classmethod
-    async def set_score(cls, chat_id, player_name: str, score: int, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                print(f'Оцениваю игрока {player_name} на {score}')
-                await game_data.set_round_score(player_name=player_name, score=score)
-                await game.load_game_data(game_data)
+    async def get_poll_id(cls, chat_id, async_session=async_read_session_maker) -> int | None:
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            if game is None:
+                raise GameIsNotExist()
+            game_data = await game.get_game_data()
+            return await game_data.get_poll_id()
 
     @classmethod
-    async def next_word(cls, chat_id, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
+    @middlewares.retry_on_conflict
+    async def count_votes(cls, chat_id, poll_id: int | None, votes: dict[str, int],
+                          async_session=async_session_maker) -> bool:
+        '''
+        Начислить голоса и перейти к следующей теме.
+        До этого момента игра остаётся в ready_for_next_word, поэтому если остановить опрос не вышло
+        или процесс перезапустился, следующий /next просто повторит подсчёт.
+        Если темы кончились - баллы всё равно сохраняются, а наружу выходит GameIsDone.
+        :param chat_id:
+        :param poll_id: Опрос, голоса которого посчитаны.
+        :param votes: Имя игрока -> число голосов.
+        :param async_session:
+        :return: Посчитаны ли голоса. False - этот опрос уже посчитан.
+        '''
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            if game is None:
+                raise GameIsNotExist()
+            game_data = await game.get_game_data()
+            if game_data.state not in VOTING_STATES or game_data.last_poll_id != poll_id:
+                return False
+            for player_name, score in votes.items():
+                logger.debug('debate_votes', extra={'chat_id': chat_id, 'player': player_name, 'votes': score})
+                await game_data.set_round_score(player_name=player_name, score=score)
+            try:
                 await game_data.next_round()
-                await game.load_game_data(game_data)
+                is_done = False
+            except GameIsDone:
+                game_data.state = 'finished'
+                is_done = True
+            await game.load_game_data(game_data)
+        if is_done:
+            raise GameIsDone()
+        return True
 
-    async def get_player_names(cls, chat_id, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
+    @classmethod
+    async def get_pending_turns(cls, async_session=async_read_session_maker) -> list[tuple[int, int | None]]:
+        '''
+        Дебаты, у которых идёт ход или не отправлен опрос. После рестарта их нужно запланировать заново.
+        :param async_session:
+        :return: (chat_id, deadline). deadline=None - ходы закончились, но опроса ещё нет.
+        '''
+        async with unit_of_work(async_session) as session:
+            games = (await session.execute(
+                select(cls).where(cls.game_name == GameTitles.debate.value)
+            )).scalars().all()
+            turns = []
+            for game in games:
                 game_data = await game.get_game_data()
-                player_names = await game_data.get_player_names()
-                return player_names
-
+                if game_data.deadline is not None or game_data.state == 'voting_pending':
+                    turns.append((game.lobby_id, game_data.deadline))
+            return turns
+
+    async def get_player_names(cls, chat_id, async_session=async_read_session_maker):
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            game_data = await game.get_game_data()
+            player_names = await game_data.get_player_names()
+            return player_names
+
+    @middlewares.retry_on_conflict
     async def set_poll_id(cls, chat_id, poll_id, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                await game_data.set_poll_id(poll_id=poll_id)
-                await game.load_game_data(game_data)
-
-    async def get_poll_id(cls, chat_id, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                return await game_data.get_poll_id()
-
-    async def finish_round(cls, chat_id, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                game_data.state = 'ready_for_next_word'
-                await game.load_game_data(new_game_data=game_data)
-
-    async def result(cls, chat_id, async_session=async_session_maker) -> Result:
-        async with async_session() as session:
-            async with session.begin():
-                game = await cls.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                return await game_data.get_game_result()
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            game_data = await game.get_game_data()
+            await game_data.set_poll_id(poll_id=poll_id)
+            await game.record_event(game_data, 'poll_attached', {'poll_id': poll_id})
+
+    async def result(cls, chat_id, async_session=async_read_session_maker) -> Result:
+        async with unit_of_work(async_session) as session:
+            game = await cls.get(chat_id=chat_id, session=session)
+            game_data = await game.get_game_data()
+            return await game_data.get_game_result()
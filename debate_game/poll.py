@@ -1,6 +1,8 @@
 import asyncio
 
-from telegram.consts import bot
+from aiogram.methods import SendPoll, StopPoll
+
+from telegram.outbox import outbox, Priority
 
 
 class PollManager():
@@ -8,12 +10,16 @@ class PollManager():
         pass
     @staticmethod
     async def send_poll(player_names: list[str], chat_id: int):
-        message = await bot.send_poll(chat_id=chat_id, options=player_names, question='Какой участник понравился больше? Закончили голосовать /next.')
+        message = await outbox.send(
+            SendPoll(chat_id=chat_id, options=player_names,
+                     question='Какой участник понравился больше? Закончили голосовать /next.'),
+            chat_id=chat_id, priority=Priority.prompt)
         return message.message_id
 
     @staticmethod
     async def get_poll_result(chat_id: int, message_id: int) -> dict:
-        poll = await bot.stop_poll(chat_id=chat_id, message_id=message_id)
+        poll = await outbox.send(StopPoll(chat_id=chat_id, message_id=message_id), chat_id=chat_id,
+                                 priority=Priority.prompt)
         result = {}
         for option in poll.options:
             result[option.text] = option.voter_count
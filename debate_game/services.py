@@ -1,19 +1,23 @@
-import asyncio
+import logging
 
-from aiogram.types import message, Message
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
 
-from config import max_word_count_deb, sec_to_answer, sec_between_answers
+from common.scheduler import scheduler
+from common.sharding import current_shard
 from debate_game.controllers import DebateGameController
-from debate_game.helpers import get_name_from_message
+from debate_game.models import VOTING_STATES
 from debate_game.poll import PollManager
 from game_manager.errors import GameIsDone
 from lobby.errors import EmptyParty, FillerAlreadyUsed, GameIsRunning
 
+logger = logging.getLogger(__name__)
+
 
 class DebateGameService():
     @staticmethod
-    async def start(message: Message, words_list: list[str]):
-        await DebateGameController().create(message=message, words_list=words_list)
+    async def start(chat_id: int, words_list: list[str]):
+        await DebateGameController().create(chat_id=chat_id, words_list=words_list)
 
     @staticmethod
     async def add_player(message: Message):
@@ -26,28 +30,25 @@ class DebateGameService():
 
     @staticmethod
     async def next(message: Message):
+        '''
+        /next только переводит раунд в следующее состояние, дальше ходы идут по дедлайнам планировщика.
+        '''
+        chat_id = message.chat.id
         try:
             state = await DebateGameController().state(message=message)
             if state == 'ready_for_answer':
-                for i in range(0, 2):
-                    await DebateGameController().get_current_player(message=message)
-                    await asyncio.sleep(sec_to_answer)
-                    await DebateGameController().stop_answer(message=message)
-                    if i != 1:
-                        await asyncio.sleep(sec_between_answers)
-                        await DebateGameController().switch_player(message=message)
-                player_names = await DebateGameController().get_player_names(message=message)
-                poll_id = await PollManager().send_poll(chat_id=message.chat.id, player_names=player_names)
-                await DebateGameController().set_poll_id(message=message, poll_id=poll_id)
-                await DebateGameController().finish_round(message=message)
-            elif state == 'ready_for_next_word':
-                poll_id = await DebateGameController().get_poll_id(message=message)
-                result = await PollManager().get_poll_result(chat_id=message.chat.id, message_id=poll_id)
-                for k, v in result.items():
-                    await DebateGameController().set_score(message=message, score=v, player_name=k)
-                await DebateGameController().next_word(message=message)
-                await DebateGameController().new_round(message=message)
-                await DebateGameController().get_round_info(message=message)
+                deadline = await DebateGameController().begin_answers(chat_id=chat_id)
+                DebateGameService.schedule_turn(chat_id=chat_id, deadline=deadline)
+            elif state == 'voting_pending':
+                # Опрос не отправился: ошибка Bot API или рестарт между ходами и опросом. Пробуем ещё раз.
+                await DebateGameService.open_voting(chat_id=chat_id)
+            elif state in VOTING_STATES:
+                poll_id = await DebateGameController().get_poll_id(chat_id=chat_id)
+                result = {}
+                if poll_id is not None:
+                    result = await DebateGameService.poll_result(chat_id=chat_id, poll_id=poll_id)
+                if await DebateGameController().count_votes(chat_id=chat_id, poll_id=poll_id, votes=result):
+                    await DebateGameController().get_round_info(message=message)
         except GameIsDone as e:
             await DebateGameController().result(message=message)
             raise e
@@ -55,3 +56,56 @@ class DebateGameService():
         except (EmptyParty, FillerAlreadyUsed, GameIsRunning) as e:
             await DebateGameController().result(message=message)
             raise e
+
+    @staticmethod
+    async def turn_deadline(chat_id: int, deadline: int):
+        '''
+        Истёк дедлайн хода: передать слово, закончить паузу или открыть голосование.
+        '''
+        step = await DebateGameController().advance_turn(chat_id=chat_id, deadline=deadline)
+        if step is None:
+            return
+        if step.state == 'voting_pending':
+            await DebateGameService.open_voting(chat_id=chat_id)
+        DebateGameService.schedule_turn(chat_id=chat_id, deadline=step.deadline)
+
+    @staticmethod
+    async def poll_result(chat_id: int, poll_id: int) -> dict[str, int]:
+        '''
+        Остановить опрос и забрать голоса. Если прошлый /next уже остановил опрос, но голоса не посчитал,
+        или опрос удалили из чата, Telegram отвечает ошибкой - тогда раунд засчитывается без голосов.
+        '''
+        try:
+            return await PollManager().get_poll_result(chat_id=chat_id, message_id=poll_id)
+        except TelegramBadRequest as e:
+            logger.warning('debate_poll_lost', extra={'chat_id': chat_id, 'poll_id': poll_id, 'error': e.message})
+            return {}
+
+    @staticmethod
+    async def open_voting(chat_id: int):
+        '''
+        Отправить опрос, если игра его ждёт. Вызывается по дедлайну, после рестарта и из /next,
+        все - в очереди чата, поэтому второй опрос не уйдёт.
+        '''
+        if await DebateGameController().get_state(chat_id=chat_id) != 'voting_pending':
+            return
+        player_names = await DebateGameController().get_player_names(chat_id=chat_id)
+        poll_id = await PollManager().send_poll(chat_id=chat_id, player_names=player_names)
+        await DebateGameController().set_poll_id(chat_id=chat_id, poll_id=poll_id)
+
+    @staticmethod
+    def schedule_turn(chat_id: int, deadline: int | None):
+        if deadline is not None:
+            scheduler.schedule_at(('debate_turn', chat_id), deadline, DebateGameService.turn_deadline,
+                                  chat_id, deadline, chat_id=chat_id)
+
+    @staticmethod
+    async def reload_turns():
+        for chat_id, deadline in await DebateGameController().pending_turns():
+            if not current_shard.owns(chat_id):
+                continue
+            if deadline is None:
+                scheduler.schedule_in(('debate_turn', chat_id), 0, DebateGameService.open_voting, chat_id,
+                                      chat_id=chat_id)
+            else:
+                DebateGameService.schedule_turn(chat_id=chat_id, deadline=deadline)
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import config
+from db.core import async_session_maker
+from game_manager.errors import GameVersionConflict
+from game_manager.models import Game, GameEvent
+from roa_game.errors import GameIsNotExist
+
+logger = logging.getLogger(__name__)
+
+
+class GameInstanceCache:
+    '''
+    Кэш живых игровых объектов по chat_id с отложенной записью.
+    Чтение идёт из памяти, изменения копятся как события и фоновой задачей раз в flush_seconds
+    дописываются в GameEvent. Полный снимок в Game.game_data пишется раз в snapshot_every событий
+    или по требованию (конец раунда, конец игры).
+    Каждая запись проверяет версию игры. Если игру успели изменить в обход кэша, она перечитывается
+    из БД, несохранённые события доигрываются поверх и запись повторяется.
+    '''
+
+    def __init__(self, loader: Callable[[int], Awaitable], flush_seconds: float,
+                 snapshot_every: int = config.game_snapshot_every, async_session=async_session_maker):
+        '''
+        :param loader: Корутина, которая по chat_id достаёт из БД (объект игры, число недоигранных
+        в снимок событий, версия игры) или возвращает None.
+        :param flush_seconds: Интервал фоновой записи изменений.
+        :param snapshot_every: Через сколько событий писать полный снимок.
+        :param async_session:
+        '''
+        self.loader = loader
+        self.flush_seconds = flush_seconds
+        self.snapshot_every = snapshot_every
+        self.async_session = async_session
+        self._instances = {}
+        self._loading: dict[int, asyncio.Future] = {}
+        self._events: dict[int, list[tuple[str, dict]]] = {}
+        self._stored_events: dict[int, int] = {}
+        self._versions: dict[int, int] = {}
+        self._needs_snapshot: set[int] = set()
+        self._dirty: set[int] = set()
+        self._flusher: asyncio.Task | None = None
+
+    async def get(self, chat_id: int):
+        '''
+        Получить объект игры. Если его нет в памяти - загружается из БД.
+        :param chat_id:
+        :return:
+        '''
+        instance = self._instances.get(chat_id)
+        if instance is not None:
+            return instance
+
+        loading = self._loading.get(chat_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self.loader(chat_id))
+            self._loading[chat_id] = loading
+            try:
+                loaded = await loading
+                if loaded is not None:
+                    self._instances[chat_id], self._stored_events[chat_id], self._versions[chat_id] = loaded
+            finally:
+                self._loading.pop(chat_id, None)
+        else:
+            loaded = await asyncio.shield(loading)
+
+        if loaded is None:
+            raise GameIsNotExist()
+        return loaded[0]
+
+    def __contains__(self, chat_id: int) -> bool:
+        '''
+        Игра чата уже в памяти. Из БД ничего не загружается.
+        '''
+        return chat_id in self._instances
+
+    def put(self, chat_id: int, instance) -> None:
+        '''
+        Положить только что созданную игру, снимок которой уже записан в БД.
+        :param chat_id:
+        :param instance:
+        :return:
+        '''
+        self.evict(chat_id)
+        self._instances[chat_id] = instance
+        self._stored_events[chat_id] = 0
+        self._versions[chat_id] = 0
+
+    def evict(self, chat_id: int) -> None:
+        '''
+        Выкинуть игру из памяти без записи (например, лобби уже удалено).
+        :param chat_id:
+        :return:
+        '''
+        self._instances.pop(chat_id, None)
+        self._events.pop(chat_id, None)
+        self._stored_events.pop(chat_id, None)
+        self._versions.pop(chat_id, None)
+        self._needs_snapshot.discard(chat_id)
+        self._dirty.discard(chat_id)
+
+    def record(self, chat_id: int, kind: str, payload: dict | None = None, snapshot: bool = False) -> None:
+        '''
+        Запомнить изменение, уже применённое к объекту в памяти.
+        :param chat_id:
+        :param kind: Тип события, его умеет применять apply_event игрового объекта.
+        :param payload:
+        :param snapshot: Изменение не стоит доигрывать по событиям - при записи нужен полный снимок.
+        :return:
+        '''
+        if chat_id not in self._instances:
+            return
+        self._events.setdefault(chat_id, []).append((kind, payload or {}))
+        if snapshot:
+            self._needs_snapshot.add(chat_id)
+        self._dirty.add(chat_id)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self._dirty:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('game_flush_failed')
+
+    async def flush(self, chat_id: int | None = None, snapshot: bool = False) -> None:
+        '''
+        Записать изменения в БД одной транзакцией.
+        :param chat_id: Если указан - сбрасывается только эта игра.
+        :param snapshot: Записать полный снимок, даже если событий накопилось мало.
+        :return:
+        '''
+        if chat_id is None:
+            chat_ids = set(self._dirty)
+        elif chat_id in self._dirty or (snapshot and chat_id in self._instances):
+            chat_ids = {chat_id}
+        else:
+            return
+        if snapshot:
+            self._needs_snapshot |= chat_ids
+        for attempt in range(config.game_conflict_retries + 1):
+            conflicted = await self._write(chat_ids)
+            if not conflicted:
+                return
+            for conflicted_id, events in conflicted.items():
+                await self._rebase(conflicted_id, events)
+            chat_ids = set(conflicted)
+        logger.error('game_flush_conflicts', extra={'chat_ids': sorted(chat_ids)})
+
+    async def _write(self, chat_ids: set[int]) -> dict[int, list[tuple[str, dict]]]:
+        '''
+        :return: Игры, версия которых в БД не совпала с нашей, и их события, которые не записались.
+        '''
+        taken = {dirty_id: self._events.pop(dirty_id, []) for dirty_id in chat_ids}
+        self._dirty -= chat_ids
+
+        written = {}
+        conflicted = {}
+        try:
+            async with self.async_session() as session:
+                async with session.begin():
+                    for dirty_id, events in taken.items():
+                        instance = self._instances.get(dirty_id)
+                        if instance is None:
+                            continue
+                        stored = self._stored_events.get(dirty_id, 0) + len(events)
+                        snapshot = dirty_id in self._needs_snapshot or stored >= self.snapshot_every
+                        # Снимок пишется тем же UPDATE, что проверяет версию.
+                        values = {'game_data': await instance.serialize()} if snapshot else {}
+                        try:
+                            version = await Game.bump_version(session=session, lobby_id=dirty_id,
+                                                              expected=self._versions.get(dirty_id, 0), **values)
+                        except GameVersionConflict:
+                            conflicted[dirty_id] = events
+                            continue
+                        if snapshot:
+                            await GameEvent.append(session=session, lobby_id=dirty_id, events=events,
+                                                   snapshotted=True)
+                            await GameEvent.mark_snapshotted(session=session, lobby_id=dirty_id)
+                            written[dirty_id] = 0, version
+                        else:
+                            await GameEvent.append(session=session, lobby_id=dirty_id, events=events)
+                            written[dirty_id] = stored, version
+        except Exception:
+            for dirty_id, events in taken.items():
+                if dirty_id in self._instances:
+                    self._events[dirty_id] = events + self._events.get(dirty_id, [])
+                    self._dirty.add(dirty_id)
+            raise
+
+        for dirty_id, (stored, version) in written.items():
+            self._stored_events[dirty_id] = stored
+            self._versions[dirty_id] = version
+            if stored == 0:
+                self._needs_snapshot.discard(dirty_id)
+        return conflicted
+
+    async def _rebase(self, chat_id: int, events: list[tuple[str, dict]]):
+        '''
+        Перечитать игру из БД и доиграть поверх несохранённые события, как будто они случились после
+        чужой записи. События снова встают в очередь на запись.
+        '''
+        loaded = await self.loader(chat_id)
+        if loaded is None:
+            self.evict(chat_id)
+            return
+        instance, stored_events, version = loaded
+        for kind, payload in events:
+            await instance.apply_event(kind, payload)
+        for kind, payload in self._events.get(chat_id, []):
+            await instance.apply_event(kind, payload)
+        self._instances[chat_id] = instance
+        self._stored_events[chat_id] = stored_events
+        self._versions[chat_id] = version
+        self._events[chat_id] = events + self._events.get(chat_id, [])
+        self._dirty.add(chat_id)
+
+    async def close(self) -> None:
+        '''
+        Остановить фоновую запись и сбросить всё, что накопилось.
+        :return:
+        '''
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
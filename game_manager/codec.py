@@ -0,0 +1,127 @@
+import zlib
+
+import config
+from game_manager.errors import CodecError
+
+# Первый байт - NUL, поэтому бинарные данные нельзя спутать со старым JSON.
+MAGIC = b'\x00G'
+# 2: у дебатов в конце добавлен дедлайн хода.
+VERSION = 2
+FLAG_COMPRESSED = 0x01
+
+
+def is_binary(data) -> bool:
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:2]) == MAGIC
+
+
+class GameDataWriter:
+    '''
+    Компактная запись состояния игры: varint-числа и таблица строк,
+    в которой каждое слово/имя хранится один раз, а дальше - по индексу.
+    '''
+
+    def __init__(self, version: int = VERSION):
+        self.version = version
+        self._strings: dict[str, int] = {}
+        self._body = bytearray()
+
+    def uint(self, value: int):
+        if value < 0:
+            raise ValueError(value)
+        while value > 0x7F:
+            self._body.append((value & 0x7F) | 0x80)
+            value >>= 7
+        self._body.append(value)
+
+    def sint(self, value: int):
+        self.uint(value * 2 if value >= 0 else -value * 2 - 1)
+
+    def flag(self, value: bool):
+        self._body.append(1 if value else 0)
+
+    def text(self, value: str):
+        index = self._strings.get(value)
+        if index is None:
+            index = self._strings[value] = len(self._strings)
+        self.uint(index)
+
+    def optional_text(self, value: str | None):
+        if value is None:
+            self.uint(0)
+        else:
+            self.flag(True)
+            self.text(value)
+
+    def optional_sint(self, value: int | None):
+        if value is None:
+            self.uint(0)
+        else:
+            self.flag(True)
+            self.sint(value)
+
+    def pack(self, compress_threshold: int = config.game_data_compress_threshold) -> bytes:
+        table = GameDataWriter()
+        table.uint(len(self._strings))
+        for value in self._strings:
+            encoded = value.encode()
+            table.uint(len(encoded))
+            table._body += encoded
+        payload = bytes(table._body + self._body)
+
+        flags = 0
+        if compress_threshold and len(payload) > compress_threshold:
+            compressed = zlib.compress(payload)
+            if len(compressed) < len(payload):
+                payload = compressed
+                flags |= FLAG_COMPRESSED
+        return MAGIC + bytes((self.version, flags)) + payload
+
+
+class GameDataReader:
+    def __init__(self, data: bytes):
+        if not is_binary(data):
+            raise CodecError()
+        data = bytes(data)
+        self.version = data[2]
+        if self.version > VERSION:
+            raise CodecError(f'Неизвестная версия данных игры: {self.version}')
+        payload = data[4:]
+        if data[3] & FLAG_COMPRESSED:
+            payload = zlib.decompress(payload)
+        self._data = payload
+        self._pos = 0
+        self._strings = []
+        for _ in range(self.uint()):
+            length = self.uint()
+            self._strings.append(self._data[self._pos:self._pos + length].decode())
+            self._pos += length
+
+    def uint(self) -> int:
+        result = 0
+        shift = 0
+        while True:
+            try:
+                byte = self._data[self._pos]
+            except IndexError:
+                raise CodecError()
+            self._pos += 1
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return result
+            shift += 7
+
+    def sint(self) -> int:
+        value = self.uint()
+        return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+    def flag(self) -> bool:
+        return self.uint() != 0
+
+    def text(self) -> str:
+        return self._strings[self.uint()]
+
+    def optional_text(self) -> str | None:
+        return self.text() if self.flag() else None
+
+    def optional_sint(self) -> int | None:
+        return self.sint() if self.flag() else None
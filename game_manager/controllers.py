@@ -3,7 +3,9 @@ from dataclasses import dataclass
 from aiogram.types import Message
 
 from common.controllers import Controller
-from game_manager.errors import CantRunWithoutWords
+from common.scheduler import scheduler
+from common.sharding import current_shard
+from game_manager.errors import CantRunWithoutWords, WordFillingInterrupted
 from game_manager.models import GameTitles
 from game_manager.views import GameManagerTgView
 from game_manager.services import GameManagerService
@@ -22,10 +24,44 @@ class GameManagerController(Controller):
     async def start_roa(self, message: Message):
         game_type = GameTitles.rate_off_all
         try:
-            await self.model.start(message=message, game_type=game_type)
+            end_time = await self.model.start(message=message, game_type=game_type)
+            self.schedule_word_filling(chat_id=message.chat.id, game_type=game_type, end_time=end_time)
         except (CantRunWithoutWords, EmptyParty, GameIsRunning) as e:
             await self.view.error(e.msg, message.chat.id)
 
+    def schedule_word_filling(self, chat_id: int, game_type: GameTitles, end_time):
+        if end_time is not None:
+            scheduler.schedule(('word_filling', chat_id), end_time, self.finish_word_filling, chat_id, game_type,
+                               chat_id=chat_id)
+
+    async def finish_word_filling(self, chat_id: int, game_type: GameTitles):
+        try:
+            await self.model.finish_word_filling(chat_id=chat_id, game_type=game_type)
+        except (CantRunWithoutWords, EmptyParty, GameIsRunning) as e:
+            await self.view.error(e.msg, chat_id)
+
+    async def abandon_word_filling(self, chat_id: int):
+        try:
+            await self.model.abandon_word_filling(chat_id=chat_id)
+        except WordFillingInterrupted as e:
+            await self.view.error(e.msg, chat_id)
+
+    async def reload_timers(self):
+        '''
+        Заново запланировать таймеры приёма тем и ходов дебатов, которые были открыты до рестарта.
+        Просроченные сработают сразу. При шардировании - только таймеры своих чатов.
+        Таймеры без игры (открытые до миграции 3) по истечении возвращают лобби в ожидание участников.
+        '''
+        for chat_id, game_type, end_time in await self.model.pending_word_filling():
+            if not current_shard.owns(chat_id):
+                continue
+            if game_type is None:
+                scheduler.schedule(('word_filling', chat_id), end_time, self.abandon_word_filling, chat_id,
+                                   chat_id=chat_id)
+                continue
+            self.schedule_word_filling(chat_id=chat_id, game_type=game_type, end_time=end_time)
+        await self.model.reload_debate_turns()
+
     async def next(self, message: Message):
         try:
             await self.model.next(message)
@@ -41,7 +77,8 @@ class GameManagerController(Controller):
     async def start_deb(self, message: Message):
         game_type = GameTitles.debate
         try:
-            await self.model.start(message=message, game_type=game_type)
+            end_time = await self.model.start(message=message, game_type=game_type)
+            self.schedule_word_filling(chat_id=message.chat.id, game_type=game_type, end_time=end_time)
         except (CantRunWithoutWords, EmptyParty, GameIsRunning) as e:
             await self.view.error(e.msg, message.chat.id)
 
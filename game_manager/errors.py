@@ -4,7 +4,25 @@ class CantRunWithoutWords(Exception):
         super().__init__(self.msg)
 
 
+class WordFillingInterrupted(Exception):
+    def __init__(self, message="Бот перезапустился во время приёма тем. Темы сохранены, запустите игру заново."):
+        self.msg = message
+        super().__init__(self.msg)
+
+
 class GameIsDone(Exception):
     def __init__(self, message="Игра завершена"):
         self.msg = message
         super().__init__(self.msg)
+
+
+class CodecError(Exception):
+    def __init__(self, message="Не удалось разобрать данные игры"):
+        self.msg = message
+        super().__init__(self.msg)
+
+
+class GameVersionConflict(Exception):
+    def __init__(self, message="Игру одновременно изменили в другом месте"):
+        self.msg = message
+        super().__init__(self.msg)
@@ -0,0 +1,30 @@
+import config
+from common import metrics
+from db.core import in_unit_of_work
+from game_manager.errors import GameVersionConflict
+
+conflicts_unresolved = metrics.registry.counter(
+    'bot_game_conflicts_unresolved_total', 'Операция с игрой не прошла проверку версии ни с одной попытки')
+
+
+def retry_on_conflict(func):
+    '''
+    Если игру успели изменить между чтением и записью - повторить операцию целиком на свежем состоянии.
+    Повторяет только самая внешняя единица работы: вложенный вызов отдаёт конфликт наружу,
+    потому что его транзакцию откатит и перезапустит внешний.
+    '''
+    async def inner(*args, **kwargs):
+        if in_unit_of_work():
+            return await func(*args, **kwargs)
+        for _ in range(config.game_conflict_retries):
+            try:
+                return await func(*args, **kwargs)
+            except GameVersionConflict:
+                continue
+        try:
+            return await func(*args, **kwargs)
+        except GameVersionConflict:
+            conflicts_unresolved.inc()
+            raise
+
+    return inner
@@ -1,8 +1,20 @@
+from __future__ import annotations
+
+import json
 from enum import Enum
 
-from sqlalchemy import String, ForeignKey, select
+from sqlalchemy import String, ForeignKey, select, insert, update, Boolean, Index, LargeBinary
+from sqlalchemy.ext.asyncio import AsyncSession, async_object_session
 from sqlalchemy.orm import relationship, Mapped, mapped_column
-from db.core import Base, async_session_maker
+from sqlalchemy.orm.attributes import set_committed_value
+
+import config
+from common import metrics
+from db.core import Base, async_session_maker, async_read_session_maker, unit_of_work
+from game_manager.errors import GameVersionConflict
+
+version_conflicts = metrics.registry.counter(
+    'bot_game_version_conflicts_total', 'Запись игры не прошла проверку версии', ('model',))
 
 
 class GameTitles(Enum):
@@ -14,16 +26,152 @@ class Game(Base):
     __tablename__ = 'game'
     game_id: Mapped[int] = mapped_column(primary_key=True, unique=True)
     game_name: Mapped[GameTitles] = mapped_column(String())
-    game_data: Mapped[str] = mapped_column(String())
+    # Снимок состояния в бинарном формате из game_manager.codec. Старые строки могут оставаться JSON-текстом.
+    # Изменения после снимка лежат в GameEvent и доигрываются при загрузке.
+    # В уже созданных таблицах колонка объявлена VARCHAR, но SQLite хранит BLOB как есть при любом типе колонки,
+    # так что пересоздавать таблицу не нужно.
+    game_data: Mapped[bytes | str] = mapped_column(LargeBinary())
+    # Растёт при каждом изменении игры: и снимке, и событии. Запись проверяет, что версия не сменилась с чтения.
+    version: Mapped[int] = mapped_column(default=0, server_default='0')
 
     lobby_id: Mapped[int] = mapped_column(ForeignKey('lobby.chat_id'), unique=True)
     lobby = relationship('Lobby', back_populates='game')
 
     @classmethod
-    async def get_game_name_by_lobby_id(cls, lobby_id: int, async_session=async_session_maker) -> str | None:
-        async with async_session() as session:
-            async with session.begin():
-                game = (await session.execute(select(Game).where(Game.lobby_id==lobby_id))).scalar_one_or_none()
-                if game is None:
-                    return None
-                return game.game_name
+    async def get_game_name_by_lobby_id(cls, lobby_id: int, async_session=async_read_session_maker) -> str | None:
+        async with unit_of_work(async_session) as session:
+            game = (await session.execute(select(Game).where(Game.lobby_id==lobby_id))).scalar_one_or_none()
+            if game is None:
+                return None
+            return game.game_name
+
+    async def restore(self, instance_cls):
+        '''
+        Восстановить состояние игры: последний снимок + события после него.
+        :param instance_cls: Класс игрового объекта с deserialize и apply_event.
+        :return:
+        '''
+        session = async_object_session(self)
+        instance = await instance_cls.deserialize(self.game_data)
+        events = await GameEvent.get_pending(session=session, lobby_id=self.lobby_id)
+        for event in events:
+            await instance.apply_event(event.kind, json.loads(event.payload))
+        self.pending_events = len(events)
+        return instance
+
+    @classmethod
+    async def bump_version(cls, session: AsyncSession, lobby_id: int, expected: int, **values) -> int:
+        '''
+        Поднять версию игры, если она всё ещё expected.
+        :param session:
+        :param lobby_id:
+        :param expected: Версия, с которой игру прочитали.
+        :param values: Другие колонки, которые пишутся тем же запросом (например, game_data снимка).
+        :return: Новая версия.
+        '''
+        result = await session.execute(
+            update(Game).where(Game.lobby_id == lobby_id, Game.version == expected)
+            .values(version=Game.version + 1, **values).execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            version_conflicts.inc(cls.__name__)
+            raise GameVersionConflict()
+        return expected + 1
+
+    async def claim(self, **values):
+        '''
+        Проверить, что игру не изменили с момента чтения, и поднять версию.
+        Вызывается перед каждой записью изменения, но версия поднимается один раз за транзакцию:
+        несколько событий подряд - одно изменение для других писателей.
+        :param values: Колонки игры, которые пишутся тем же UPDATE, что и версия.
+        '''
+        session = async_object_session(self)
+        transaction = session.sync_session.get_transaction()
+        if transaction is not None and getattr(self, '_claimed_in', None) is transaction:
+            for key, value in values.items():
+                setattr(self, key, value)
+            return
+        set_committed_value(self, 'version', await type(self).bump_version(
+            session=session, lobby_id=self.lobby_id, expected=self.version, **values))
+        for key, value in values.items():
+            set_committed_value(self, key, value)
+        self._claimed_in = session.sync_session.get_transaction()
+
+    async def record_event(self, instance, kind: str, payload: dict | None = None):
+        '''
+        Записать одно изменение игры. Раз в config.game_snapshot_every событий вместо события
+        для доигрывания делается снимок, а событие пишется только в историю.
+        :param instance: Игровой объект, к которому изменение уже применено.
+        :param kind:
+        :param payload:
+        :return:
+        '''
+        session = async_object_session(self)
+        events = [(kind, payload or {})]
+        if getattr(self, 'pending_events', 0) + 1 >= config.game_snapshot_every:
+            await self.snapshot(instance)
+            await GameEvent.append(session=session, lobby_id=self.lobby_id, events=events, snapshotted=True)
+            return
+        await self.claim()
+        await GameEvent.append(session=session, lobby_id=self.lobby_id, events=events)
+        self.pending_events = getattr(self, 'pending_events', 0) + 1
+
+    async def snapshot(self, instance):
+        '''
+        Записать полный снимок состояния. События до него больше не доигрываются.
+        :param instance:
+        :return:
+        '''
+        session = async_object_session(self)
+        await self.claim(game_data=await instance.serialize())
+        await GameEvent.mark_snapshotted(session=session, lobby_id=self.lobby_id)
+        self.pending_events = 0
+
+
+class GameEvent(Base):
+    '''
+    Журнал изменений игры. Хранится до расформирования лобби и служит историей игры.
+    '''
+    __tablename__ = 'game_event'
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String())
+    payload: Mapped[str] = mapped_column(String())
+    # Событие уже вошло в снимок Game.game_data и при загрузке не доигрывается.
+    snapshotted: Mapped[bool] = mapped_column(Boolean(), default=False)
+
+    lobby_id: Mapped[int] = mapped_column(ForeignKey('lobby.chat_id'))
+    lobby = relationship('Lobby', back_populates='events')
+
+    __table_args__ = (
+        Index('ix_game_event_lobby_id_snapshotted', 'lobby_id', 'snapshotted'),
+    )
+
+    @classmethod
+    async def append(cls, session: AsyncSession, lobby_id: int, events: list[tuple[str, dict]],
+                     snapshotted: bool = False):
+        '''
+        Дописать события одним insert.
+        :param session:
+        :param lobby_id:
+        :param events: Список (kind, payload).
+        :param snapshotted: Событие пишется только для истории, состояние уже в снимке.
+        :return:
+        '''
+        if not events:
+            return
+        await session.execute(insert(cls), [
+            {'lobby_id': lobby_id, 'kind': kind, 'payload': json.dumps(payload), 'snapshotted': snapshotted}
+            for kind, payload in events
+        ])
+
+    @classmethod
+    async def get_pending(cls, session: AsyncSession, lobby_id: int) -> list[GameEvent]:
+        return list((await session.execute(
+            select(cls).where(cls.lobby_id == lobby_id, cls.snapshotted.is_(False)).order_by(cls.id)
+        )).scalars())
+
+    @classmethod
+    async def mark_snapshotted(cls, session: AsyncSession, lobby_id: int):
+        await session.execute(
+            update(cls).where(cls.lobby_id == lobby_id, cls.snapshotted.is_(False)).values(snapshotted=True)
+        )
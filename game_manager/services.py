@@ -1,38 +1,88 @@
+import datetime
+
 from aiogram.types import message
 
 import config
 from common.services import WordProviderService
+from db.core import unit_of_work, async_read_session_maker
 from debate_game.services import DebateGameService
-from game_manager.errors import CantRunWithoutWords, GameIsDone
+from game_manager.errors import CantRunWithoutWords, GameIsDone, WordFillingInterrupted
 from game_manager.models import GameTitles, Game
 from lobby.controllers import LobbyController
-from lobby.models import Lobby
+from lobby.models import Lobby, WordProvider
+from roa_game.models import roa_cache
 from roa_game.services import RoaGameService
 
 
 class GameManagerService():
     @staticmethod
-    async def start(message: message, game_type: GameTitles):
-        await WordProviderService().run_timer(message=message)
-        if await WordProviderService().word_counter(message=message) <= 0:
-            await Lobby.destroy(chat_id=message.chat.id)
-            raise CantRunWithoutWords()
+    async def start(message: message, game_type: GameTitles) -> datetime.datetime:
+        '''
+        Открыть приём тем. Сама игра запускается в finish_word_filling, когда истечёт таймер.
+        :param message:
+        :param game_type:
+        :return: Момент, когда приём тем закрывается.
+        '''
+        return await WordProviderService().start_timer(message=message, game_name=game_type.value)
+
+    @staticmethod
+    async def finish_word_filling(chat_id: int, game_type: GameTitles):
+        '''
+        Закрыть приём тем и запустить игру на собранных темах.
+        :param chat_id:
+        :param game_type:
+        :return:
+        '''
+        await WordProviderService().close_chat(chat_id=chat_id)
 
         if game_type == GameTitles.rate_off_all:
             max_word_count = config.max_word_count_roa
         elif game_type == GameTitles.debate:
             max_word_count = config.max_word_count_deb
-        words_list = await WordProviderService.get_shuffled_trimed_words(message=message,
-                                                                         max_word_count=max_word_count)
+        async with unit_of_work(async_read_session_maker):
+            word_count = await WordProviderService().word_counter(chat_id=chat_id)
+            words_list = await WordProviderService.get_shuffled_trimed_words(chat_id=chat_id,
+                                                                             max_word_count=max_word_count)
+        if word_count <= 0:
+            await Lobby.destroy(chat_id=chat_id)
+            raise CantRunWithoutWords()
 
         if game_type == GameTitles.rate_off_all:
-            await RoaGameService().start_roa(message=message, words_list=words_list)
+            await RoaGameService().start_roa(chat_id=chat_id, words_list=words_list)
         elif game_type == GameTitles.debate:
-            await DebateGameService().start(message=message, words_list=words_list)
+            await DebateGameService().start(chat_id=chat_id, words_list=words_list)
+
+    @staticmethod
+    async def abandon_word_filling(chat_id: int):
+        '''
+        Приём тем, открытый до миграции 3: какую игру запускать, неизвестно.
+        Лобби возвращается в ожидание участников, чтобы игру можно было начать заново.
+        :param chat_id:
+        :return:
+        '''
+        await WordProviderService().reopen_chat(chat_id=chat_id)
+        raise WordFillingInterrupted()
+
+    @staticmethod
+    async def pending_word_filling() -> list[tuple[int, GameTitles | None, datetime.datetime]]:
+        '''
+        Приёмы тем, которые не успели закрыться до рестарта.
+        :return: (chat_id, game_type, end_time), game_type - None, если игра не записана.
+        '''
+        return [(chat_id, GameTitles(game_name) if game_name is not None else None, end_time)
+                for chat_id, game_name, end_time in await WordProvider.get_pending_timers()]
+
+    @staticmethod
+    async def reload_debate_turns():
+        await DebateGameService().reload_turns()
 
     @staticmethod
     async def next(message: message):
-        game_name = await Game().get_game_name_by_lobby_id(lobby_id=message.chat.id)
+        # Живая игра ROA лежит в кэше, тогда название игры можно не искать в БД.
+        if message.chat.id in roa_cache:
+            game_name = GameTitles.rate_off_all.value
+        else:
+            game_name = await Game().get_game_name_by_lobby_id(lobby_id=message.chat.id)
         if game_name == GameTitles.rate_off_all.value:
             try:
                 await RoaGameService().next_word(message=message)
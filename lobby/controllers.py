@@ -43,11 +43,12 @@ class WordProviderController(Controller):
     def __init__(self, view: WordProviderTgView = WordProviderTgView(), model: WordProvider = WordProvider()):
         super().__init__(view, model)
 
-    async def start(self, message: Message):
+    async def start(self, message: Message, game_name: str):
         chat_id = message.chat.id
         try:
-            await self.model.start(lobby_id=chat_id)
+            end_time = await self.model.start(lobby_id=chat_id, game_name=game_name)
             await self.view.start(chat_id=chat_id)
+            return end_time
         except (EmptyParty, FillerAlreadyUsed, GameIsRunning) as e:
             raise e
 
@@ -61,17 +62,17 @@ class WordProviderController(Controller):
         except (EmptyParty, FillerAlreadyUsed, UserNotInLobby, FillerIsClosed, MaxWordCount) as e:
             await self.view.error(error_text=e.msg, chat_id=message.chat.id)
 
-    async def close_chat(self, message: Message):
-        chat_id = message.chat.id
+    async def close_chat(self, chat_id: int):
         await self.model.close_chat(chat_id=chat_id)
         return await self.view.timer_timeout(chat_id=chat_id)
 
-    async def count_words(self, message: Message) -> int:
-        chat_id = message.chat.id
+    async def reopen_chat(self, chat_id: int):
+        await self.model.reopen_chat(chat_id=chat_id)
+
+    async def count_words(self, chat_id: int) -> int:
         result = await self.model.count_words(chat_id=chat_id)
         return result
 
-    async def shuffle_and_trim_words(self, message: Message, max_word_count: int) -> list[str]:
-        chat_id = message.chat.id
+    async def shuffle_and_trim_words(self, chat_id: int, max_word_count: int) -> list[str]:
         words = await self.model.shuffle_and_trim_words(chat_id=chat_id, max_word_count=max_word_count)
         return words
@@ -1,23 +1,25 @@
 from common.errors import UserNotInLobby
-from db.core import async_session_maker
+from db.core import unit_of_work
 from .errors import EmptyParty, GameIsRunning
 from lobby.errors import FillerIsClosed
 
 
+# Проверки открывают единицу работы (или присоединяются к уже открытой) и вызывают метод внутри неё,
+# поэтому проверки и сам метод модели идут одной транзакцией и не загружают одни и те же объекты повторно.
+
 def lobby_not_empty(func):
     async def inner(*args, **kwargs):
         from lobby.models import Lobby
         lobby_id = kwargs.get('lobby_id')
         if not lobby_id:
             raise Exception('В параметре функции нет lobby_id')
-        async_session = async_session_maker
-        async with async_session() as session:
-            async with session.begin():
-                lobby = await Lobby.is_exist(chat_id=lobby_id, session=session)
-                if not lobby:
-                    raise EmptyParty()
-        res = await func(*args, **kwargs)
-        return res
+        async with unit_of_work() as session:
+            # Ссылка на лобби держится до конца метода: identity map сессии слабая,
+            # и пока объект жив, следующие проверки берут его без запроса.
+            lobby = await Lobby.get(chat_id=lobby_id, session=session, with_users=False)
+            if not lobby:
+                raise EmptyParty()
+            return await func(*args, **kwargs)
 
     return inner
 
@@ -28,14 +30,11 @@ def user_in_lobby(func):
         user_id = kwargs.get('user_id')
         if not user_id:
             raise Exception('В параметре функции нет user_id')
-        async_session = async_session_maker
-        async with async_session() as session:
-            async with session.begin():
-                user = await User.get(session=session, tg_id=user_id)
-                if not user:
-                    raise UserNotInLobby()
-        res = await func(*args, **kwargs)
-        return res
+        async with unit_of_work() as session:
+            user = await User.get(session=session, tg_id=user_id)
+            if not user:
+                raise UserNotInLobby()
+            return await func(*args, **kwargs)
 
     return inner
 
@@ -49,18 +48,15 @@ def fill_word_state(func):
         if not user_id:
             raise Exception('В параметре функции нет user_id')
 
-        async_session = async_session_maker
-        async with async_session() as session:
-            async with session.begin():
-                lobby = (await User.get(session=session, tg_id=user_id)).lobby
-                if not lobby:
-                    raise EmptyParty()
+        async with unit_of_work() as session:
+            lobby = (await User.get(session=session, tg_id=user_id)).lobby
+            if not lobby:
+                raise EmptyParty()
 
-                state = lobby.state
-                if state != LobbyStates.word_filling.value:
-                    raise FillerIsClosed()
-        res = await func(*args, **kwargs)
-        return res
+            state = lobby.state
+            if state != LobbyStates.word_filling.value:
+                raise FillerIsClosed()
+            return await func(*args, **kwargs)
 
     return inner
 
@@ -74,17 +70,14 @@ def wait_members_state(func):
         if not lobby_id:
             raise Exception('В параметре функции нет lobby_id')
 
-        async_session = async_session_maker
-        async with async_session() as session:
-            async with session.begin():
-                lobby = await Lobby.get(chat_id=lobby_id, session=session)
-                if not lobby:
-                    raise EmptyParty()
-
-                state = lobby.state
-                if state != LobbyStates.wait_members.value:
-                    raise GameIsRunning()
-        res = await func(*args, **kwargs)
-        return res
+        async with unit_of_work() as session:
+            lobby = await Lobby.get(chat_id=lobby_id, session=session, with_users=False)
+            if not lobby:
+                raise EmptyParty()
+
+            state = lobby.state
+            if state != LobbyStates.wait_members.value:
+                raise GameIsRunning()
+            return await func(*args, **kwargs)
 
     return inner
@@ -2,22 +2,26 @@ from __future__ import annotations
 
 import asyncio
 import datetime
+import logging
 from datetime import timedelta
 from enum import Enum
 from typing import Callable
 
-from sqlalchemy import String, select, DATETIME, ForeignKey, func, delete
+from sqlalchemy import String, select, DATETIME, ForeignKey, func, delete, inspect, Index
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import relationship, Mapped, mapped_column, selectinload
+from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 import config
+from common import metrics
 from common.helpers import wait_timeout
 from common.models import User
-from db.core import Base, async_session_maker
+from db.core import Base, async_session_maker, async_read_session_maker, unit_of_work
 from lobby import middlewares
 from lobby.errors import FillerAlreadyUsed, MaxWordCount, EmptyParty, GameIsRunning, EmptyWords, CantStopWhileFiller
 from roa_game.errors import GameIsNotExist
 
+logger = logging.getLogger(__name__)
+
 
 class LobbyStates(Enum):
     wait_members = 'wait_members'
@@ -37,34 +41,38 @@ class Lobby(Base):
     countdown_timer = relationship('CountdownTimer', uselist=True, back_populates="lobby", cascade="all, delete-orphan")
     words = relationship('HiddenWord', back_populates='lobby', uselist=True, cascade="all, delete-orphan")
     game = relationship('Game', back_populates='lobby', cascade="all, delete-orphan")
+    events = relationship('GameEvent', back_populates='lobby', uselist=True, cascade="all, delete-orphan")
 
     def __repr__(self):
         return f'CHAT_ID: {self.chat_id}\nUsers: {self.users}'
 
     @classmethod
-    async def get(cls, session: AsyncSession, chat_id: int) -> Lobby | None:
+    async def get(cls, session: AsyncSession, chat_id: int, with_users: bool = True) -> Lobby | None:
         '''
-        Получить лобби с его пользователями
+        Получить лобби с его пользователями.
+        Если лобби или его участники уже загружены в этой сессии и на лобби ещё есть ссылка,
+        запроса в БД за ними не будет.
         :param session:
         :param chat_id:
+        :param with_users: Загрузить участников. Для проверки состояния они не нужны.
         :return:
         '''
-        lobby = (await session.execute(
-            select(cls).options(selectinload(cls.users)).where(Lobby.chat_id == chat_id)
-        )).scalar_one_or_none()
+        # session.get с options перечитывает строку даже из identity map, поэтому без них.
+        lobby = await session.get(cls, chat_id)
+        if lobby is not None and with_users and 'users' in inspect(lobby).unloaded:
+            await session.run_sync(lambda _: lobby.users)
         return lobby
 
     @classmethod
     async def is_exist(cls, session: AsyncSession, chat_id: int) -> bool:
         '''
-        Проверка, что лобби существует.
+        Проверка, что лобби существует. Участники не загружаются; если лобби уже
+        в сессии - запроса не будет.
         :param session:
         :param chat_id:
         :return:
         '''
-        if await cls.get(session=session, chat_id=chat_id):
-            return True
-        return False
+        return await session.get(cls, chat_id) is not None
 
     @classmethod
     async def create(cls, session: AsyncSession, chat_id: int, state: str = LobbyStates.wait_members.value,
@@ -85,13 +93,18 @@ class Lobby(Base):
 
     @classmethod
     async def destroy(cls, chat_id: int, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                lobby = await cls.get(session=session, chat_id=chat_id)
-                if lobby:
-                    if await lobby.is_fill_words_state():
-                        raise CantStopWhileFiller()
-                    await session.delete(lobby)
+        from roa_game.acks import score_acks
+        from roa_game.models import roa_cache, score_batcher
+        async with unit_of_work(async_session) as session:
+            lobby = await cls.get(session=session, chat_id=chat_id)
+            if lobby:
+                if await lobby.is_fill_words_state():
+                    raise CantStopWhileFiller()
+                await session.delete(lobby)
+        # Оценки из незакрытого окна и статус раунда относятся к удалённой игре.
+        roa_cache.evict(chat_id)
+        score_batcher.discard(chat_id)
+        score_acks.forget(chat_id)
         return None
 
     @classmethod
@@ -107,28 +120,25 @@ class Lobby(Base):
         :param async_session:
         :return:
         '''
-        async with async_session() as session:
-            async with session.begin():
-                await Lobby.create(chat_id=chat_id, session=session)
-                await User.create(tg_id=user_id, name=name, username=username, session=session, lobby_id=chat_id)
-                await session.commit()
+        async with unit_of_work(async_session) as session:
+            await Lobby.create(chat_id=chat_id, session=session)
+            await User.create(tg_id=user_id, name=name, username=username, session=session, lobby_id=chat_id)
         return None
 
     @classmethod
-    async def get_members(cls, chat_id: int, async_session=async_session_maker) -> list[User.name]:
+    async def get_members(cls, chat_id: int, async_session=async_read_session_maker) -> list[User.name]:
         '''
         Получить список участников определенного лобби.
         :param chat_id:
         :param async_session:
         :return:
         '''
-        async with async_session() as session:
-            async with session.begin():
-                lobby = await cls.get(session=session, chat_id=chat_id)
-                if not lobby:
-                    return []
-                lobby_users = [user.name for user in lobby.users]
-                return lobby_users
+        async with unit_of_work(async_session) as session:
+            lobby = await cls.get(session=session, chat_id=chat_id)
+            if not lobby:
+                return []
+            lobby_users = [user.name for user in lobby.users]
+            return lobby_users
 
     async def get_members_id_name_tuple(self) -> list[tuple[User.tg_id, User.name]]:
         return [(user.tg_id, user.name) for user in self.users]
@@ -142,6 +152,19 @@ class Lobby(Base):
     async def is_fill_words_state(self):
         return self.state == LobbyStates.word_filling.value
 
+    @classmethod
+    async def count_by_state(cls, async_session=async_read_session_maker) -> dict[tuple, int]:
+        '''
+        Количество лобби в каждом состоянии, для метрик.
+        :param async_session:
+        :return: {(состояние,): количество}, все состояния LobbyStates, даже пустые.
+        '''
+        async with unit_of_work(async_session) as session:
+            rows = (await session.execute(select(cls.state, func.count()).group_by(cls.state))).all()
+        counts = {(state.value,): 0 for state in LobbyStates}
+        counts.update({(state,): count for state, count in rows})
+        return counts
+
     @classmethod
     async def is_ready_for_game(cls, session, chat_id: int) -> bool:
         lobby = await Lobby.get(chat_id=chat_id, session=session)
@@ -157,11 +180,13 @@ class CountdownTimer(Base):
     __tablename__ = 'countdown_timers'
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     start_time: Mapped[datetime.datetime] = mapped_column(
-        DATETIME(timezone=True), default=datetime.datetime.utcnow()
+        DATETIME(timezone=True), default=datetime.datetime.utcnow
     )
     end_time: Mapped[datetime.datetime] = mapped_column(
-        DATETIME(timezone=True), default=datetime.datetime.utcnow() + timedelta(seconds=config.send_word_seconds)
+        DATETIME(timezone=True), default=lambda: datetime.datetime.utcnow() + timedelta(seconds=config.send_word_seconds)
     )
+    # Какая игра запустится, когда таймер истечёт. Нужна, чтобы поднять таймер после рестарта.
+    game_name: Mapped[str] = mapped_column(String(), nullable=True)
 
     lobby_id: Mapped[int] = mapped_column(ForeignKey('lobby.chat_id'), unique=True)
     lobby = relationship('Lobby', back_populates='countdown_timer')
@@ -194,19 +219,47 @@ class CountdownTimer(Base):
         # return timer
 
     @classmethod
-    async def create(cls, session: AsyncSession, lobby_id: int) -> CountdownTimer:
+    async def create(cls, session: AsyncSession, lobby_id: int, game_name: str | None = None) -> CountdownTimer:
         '''
         Создать таймер.
         :param lobby_id:
+        :param game_name:
         :param async_session:
         :return:
         '''
         timer = await CountdownTimer.get(session=session, lobby_id=lobby_id)
         if not timer:
-            timer = cls(lobby_id=lobby_id)
-            session.add(timer)
+            timer = cls.add(session=session, lobby_id=lobby_id, game_name=game_name)
         return timer
 
+    @classmethod
+    def add(cls, session: AsyncSession, lobby_id: int, game_name: str | None = None) -> CountdownTimer:
+        '''
+        Добавить новый таймер без проверки, что у лобби его ещё нет.
+        :param session:
+        :param lobby_id:
+        :param game_name:
+        :return:
+        '''
+        start_time = datetime.datetime.utcnow()
+        timer = cls(lobby_id=lobby_id, game_name=game_name, start_time=start_time,
+                    end_time=start_time + timedelta(seconds=config.send_word_seconds))
+        session.add(timer)
+        return timer
+
+    @classmethod
+    async def get_pending(cls, session: AsyncSession) -> list[CountdownTimer]:
+        '''
+        Таймеры лобби, которые всё ещё собирают темы. После рестарта их нужно запланировать заново.
+        У таймеров, открытых до миграции 3, game_name пустой.
+        :param session:
+        :return:
+        '''
+        return list((await session.execute(
+            select(cls).join(Lobby, Lobby.chat_id == cls.lobby_id)
+            .where(Lobby.state == LobbyStates.word_filling.value)
+        )).scalars())
+
     async def is_running(self) -> bool:
         '''
         Проверка на то, что таймер запущен.
@@ -242,14 +295,15 @@ class CountdownTimer(Base):
         return False
 
     @classmethod
-    async def run(cls, lobby_id: int, session: AsyncSession) -> CountdownTimer:
+    async def run(cls, lobby_id: int, session: AsyncSession, game_name: str | None = None) -> CountdownTimer:
         '''
         Инициализировать таймер.
         :param lobby_id:
+        :param game_name:
         :param async_session:
         :return:
         '''
-        timer = await CountdownTimer.create(session=session, lobby_id=lobby_id)
+        timer = await CountdownTimer.create(session=session, lobby_id=lobby_id, game_name=game_name)
         return timer
 
 
@@ -261,9 +315,13 @@ class HiddenWord(Base):
     lobby_id: Mapped[int] = mapped_column(ForeignKey('lobby.chat_id'))
     lobby = relationship('Lobby', back_populates='words')
 
-    user_id: Mapped[int] = mapped_column(ForeignKey('user.tg_id'))
+    user_id: Mapped[int] = mapped_column(ForeignKey('user.tg_id'), index=True)
     user = relationship('User', back_populates='words')
 
+    __table_args__ = (
+        Index('ix_hidden_word_lobby_id_value', 'lobby_id', 'value'),
+    )
+
     @classmethod
     async def get(cls, session: AsyncSession, lobby_id: int, value: str) -> HiddenWord | None:
         '''
@@ -304,7 +362,6 @@ class HiddenWord(Base):
             select(cls).where(HiddenWord.lobby_id == lobby_id)
         )).scalars()
         if not word_list:
-            print(word_list)
             raise EmptyWords()
         word_list = list(word_list)
         if in_str:
@@ -312,27 +369,38 @@ class HiddenWord(Base):
         return word_list
 
     @classmethod
-    async def count_personal_words(cls, session: AsyncSession, user_id: int):
-        word_list = (await session.execute(
-            select(HiddenWord)
-            .join(User, User.tg_id == HiddenWord.user_id)
-            .where(HiddenWord.user_id == user_id)
-        )).scalars()
-        return len(list(word_list))
+    async def count(cls, session: AsyncSession, lobby_id: int) -> int:
+        return (await session.execute(
+            select(func.count()).select_from(cls).where(HiddenWord.lobby_id == lobby_id)
+        )).scalar_one()
+
+    @classmethod
+    async def count_personal_words(cls, session: AsyncSession, user_id: int) -> int:
+        return (await session.execute(
+            select(func.count()).select_from(cls).where(HiddenWord.user_id == user_id)
+        )).scalar_one()
 
 
 class WordProvider():
     @classmethod
     @middlewares.lobby_not_empty
     @middlewares.wait_members_state
-    async def start(cls, lobby_id: int, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                if await cls.is_not_active(session=session, lobby_id=lobby_id):
-                    lobby = (await Lobby.get(session=session, chat_id=lobby_id))
-                    if lobby:
-                        await lobby.fill_words_state()
-                    await CountdownTimer.run(lobby_id=lobby_id, session=session)
+    async def start(cls, lobby_id: int, game_name: str, async_session=async_session_maker) -> datetime.datetime:
+        '''
+        Открыть приём тем.
+        :param lobby_id:
+        :param game_name: Игра, которая запустится по окончании таймера.
+        :param async_session:
+        :return: Момент, когда приём тем закрывается.
+        '''
+        async with unit_of_work(async_session) as session:
+            if await cls.is_not_active(session=session, lobby_id=lobby_id):
+                lobby = (await Lobby.get(session=session, chat_id=lobby_id, with_users=False))
+                if lobby:
+                    await lobby.fill_words_state()
+                # Что таймера ещё нет, is_not_active уже проверил.
+                timer = CountdownTimer.add(session=session, lobby_id=lobby_id, game_name=game_name)
+                return timer.end_time
 
     @classmethod
     @middlewares.user_in_lobby
@@ -347,16 +415,16 @@ class WordProvider():
         :param async_session:
         :return:
         '''
-        async with async_session() as session:
-            async with session.begin():
-                user = await User.get(tg_id=user_id, session=session)
-                lobby = user.lobby
-                count_personal_words = await HiddenWord.count_personal_words(session=session, user_id=user_id)
-                print(f'TGID:{user.tg_id}, count: {count_personal_words}')
-                if count_personal_words >= config.personal_word_count:
-                    raise MaxWordCount()
-                await HiddenWord.create(session=session, lobby_id=lobby.chat_id, word=word, user_id=user_id)
-                return config.personal_word_count - count_personal_words - 1
+        async with unit_of_work(async_session) as session:
+            user = await User.get(tg_id=user_id, session=session)
+            lobby = user.lobby
+            count_personal_words = await HiddenWord.count_personal_words(session=session, user_id=user_id)
+            logger.debug('word_submitted', extra={'chat_id': lobby.chat_id, 'user_id': user.tg_id,
+                                                  'words_count': count_personal_words})
+            if count_personal_words >= config.personal_word_count:
+                raise MaxWordCount()
+            await HiddenWord.create(session=session, lobby_id=lobby.chat_id, word=word, user_id=user_id)
+            return config.personal_word_count - count_personal_words - 1
 
     @classmethod
     async def is_not_active(cls, lobby_id: int, session: AsyncSession):
@@ -367,26 +435,55 @@ class WordProvider():
 
     @classmethod
     async def close_chat(cls, chat_id: int, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                lobby = await Lobby.get(chat_id=chat_id, session=session)
+        async with unit_of_work(async_session) as session:
+            lobby = await Lobby.get(chat_id=chat_id, session=session, with_users=False)
+            if lobby:
                 await lobby.game_running_state()
 
     @classmethod
-    async def count_words(cls, chat_id: int, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                return len(await HiddenWord.get_list(lobby_id=chat_id, session=session))
+    async def reopen_chat(cls, chat_id: int, async_session=async_session_maker):
+        '''
+        Вернуть лобби из приёма тем в ожидание участников и удалить таймер, чтобы игру можно было запустить заново.
+        Собранные темы остаются и попадут в следующую игру.
+        :param chat_id:
+        :param async_session:
+        :return:
+        '''
+        async with unit_of_work(async_session) as session:
+            lobby = await Lobby.get(chat_id=chat_id, session=session, with_users=False)
+            if lobby and await lobby.is_fill_words_state():
+                lobby.state = LobbyStates.wait_members.value
+                await session.execute(delete(CountdownTimer).where(CountdownTimer.lobby_id == chat_id))
+
+    @classmethod
+    async def get_pending_timers(cls, async_session=async_read_session_maker
+                                 ) -> list[tuple[int, str | None, datetime.datetime]]:
+        '''
+        Незакрытые приёмы тем: (chat_id, game_name, end_time). game_name пустой у таймеров, открытых до миграции 3.
+        :param async_session:
+        :return:
+        '''
+        async with unit_of_work(async_session) as session:
+            timers = await CountdownTimer.get_pending(session=session)
+            return [(timer.lobby_id, timer.game_name, timer.end_time) for timer in timers]
+
+    @classmethod
+    async def count_words(cls, chat_id: int, async_session=async_read_session_maker):
+        async with unit_of_work(async_session) as session:
+            return await HiddenWord.count(lobby_id=chat_id, session=session)
 
     @classmethod
-    async def shuffle_and_trim_words(cls, chat_id: int, max_word_count: int, async_session=async_session_maker) -> list[str]:
-        async with async_session() as session:
-            async with session.begin():
-                desired_count = max_word_count
-                unique_values = (await session.execute(
-                    select(HiddenWord.value).distinct().where(HiddenWord.lobby_id == chat_id).order_by(
-                        func.random()))).scalars().all()
+    async def shuffle_and_trim_words(cls, chat_id: int, max_word_count: int,
+                                     async_session=async_read_session_maker) -> list[str]:
+        async with unit_of_work(async_session) as session:
+            desired_count = max_word_count
+            unique_values = (await session.execute(
+                select(HiddenWord.value).distinct().where(HiddenWord.lobby_id == chat_id).order_by(
+                    func.random()))).scalars().all()
 
             if len(unique_values) < desired_count:
                 desired_count = len(unique_values)
             return [unique_values[i] for i in range(0, desired_count)]
+
+
+metrics.registry.gauge('bot_lobbies', 'Лобби по состояниям', ('state',), collect=Lobby.count_by_state)
@@ -2,7 +2,7 @@ from aiogram.types import message
 
 from common.views import CommonView
 from config import bot_link, send_word_seconds
-from telegram.consts import bot
+from telegram.outbox import outbox, Priority
 
 
 class LobbyView(CommonView):
@@ -25,31 +25,35 @@ class LobbyView(CommonView):
 
     @staticmethod
     async def destroy(chat_id):
-        await bot.send_message(chat_id=chat_id,
-                               text='Спасибо за игру. Лобби расформировано. '
-                                    'Список участников обнулён. Хорошего дня! 😊')
+        outbox.send_message(chat_id=chat_id,
+                            text='Спасибо за игру. Лобби расформировано. '
+                                 'Список участников обнулён. Хорошего дня! 😊')
 
     @staticmethod
     async def error(error_text, chat_id: int):
-        await bot.send_message(chat_id=chat_id, text=error_text)
+        outbox.send_message(chat_id=chat_id, text=error_text)
 
 
 class WordProviderTgView():
     @staticmethod
     async def start(chat_id: int):
-        await bot.send_message(chat_id=chat_id,
-                               text=f'📝 *Перейдите сюда* {bot_link} *и вводите темы, которые вас интересуют.*\n'
-                                    f'🔒 *В ближайшие {send_word_seconds} секунд доступ закроется.* 🔒 \n'
-                                    f'*Как только напишите темы - возвращайтесь.*')
+        outbox.send_message(chat_id=chat_id,
+                            text=f'📝 *Перейдите сюда* {bot_link} *и вводите темы, которые вас интересуют.*\n'
+                                 f'🔒 *В ближайшие {send_word_seconds} секунд доступ закроется.* 🔒 \n'
+                                 f'*Как только напишите темы - возвращайтесь.*',
+                            priority=Priority.prompt)
 
     @staticmethod
     async def timer_timeout(chat_id: int):
-        await bot.send_message(chat_id=chat_id, text=f'🔒Вы больше не можете присылать темы в ЛС бота🔒')
+        outbox.send_message(chat_id=chat_id, text=f'🔒Вы больше не можете присылать темы в ЛС бота🔒',
+                            priority=Priority.prompt)
 
     @staticmethod
     async def error(error_text, chat_id: int):
-        await bot.send_message(chat_id=chat_id, text=error_text)
+        outbox.send_message(chat_id=chat_id, text=error_text)
 
     @staticmethod
     async def fill_word(message: message, remain_count):
-        await message.answer(text=f'Записал. Оставшееся количество, которое вам доступно: {remain_count}')
+        outbox.send_message(chat_id=message.chat.id,
+                            text=f'Записал. Оставшееся количество, которое вам доступно: {remain_count}',
+                            priority=Priority.ack)
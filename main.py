@@ -1,7 +1,34 @@
 import asyncio
-from db.services import create_tables
-from telegram.tg import run_bot
+
+from common.logs import setup_logging
+from common.sharding import configure_worker_from_env
+from common.startup import startup_report
+
+
+async def main():
+    # Импорты внутри main: процессы пула отрисовки запускаются через spawn и импортируют этот модуль,
+    # им не нужно поднимать бота.
+    is_worker = configure_worker_from_env()
+    # Фазы идут по слоям: каждая импортирует только то, что не подтянули предыдущие.
+    with startup_report.phase('импорт aiogram'):
+        import aiogram.types  # noqa: F401
+    with startup_report.phase('импорт БД и моделей'):
+        from db.services import create_tables
+    with startup_report.phase('импорт игровых сервисов'):
+        import game_manager.services  # noqa: F401
+        import roa_game.render  # noqa: F401
+    with startup_report.phase('импорт хэндлеров'):
+        from telegram.tg import run_bot
+    # Обработчиков запускает фронт, когда таблицы и миграции уже готовы.
+    if not is_worker:
+        with startup_report.phase('БД: таблицы, миграции, планы запросов'):
+            await create_tables()
+    await run_bot()
+
 
 if __name__ == '__main__':
-    asyncio.run(create_tables())
-    asyncio.run(run_bot())
\ No newline at end of file
+    listener = setup_logging()
+    try:
+        asyncio.run(main())
+    finally:
+        listener.stop()
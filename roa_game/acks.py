@@ -0,0 +1,86 @@
+import asyncio
+from dataclasses import dataclass, field
+from enum import Enum
+
+from aiogram.methods import EditMessageText
+from aiogram.types import Message
+
+import config
+from common.scheduler import scheduler
+from telegram.methods import SetMessageReaction
+from telegram.outbox import outbox, Priority
+
+
+class AckMode(Enum):
+    # Реакция на сообщение с оценкой: без новых сообщений в чате.
+    reaction = 'reaction'
+    # Одно сообщение за раунд со списком проголосовавших, правится не чаще раза в debounce_seconds.
+    status = 'status'
+    none = 'none'
+
+
+@dataclass
+class RoundStatus:
+    message_id: int | None = None
+    voters: dict[int, str] = field(default_factory=dict)
+    text: str | None = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class ScoreAcks:
+    '''
+    Подтверждения оценок в ROA. Раньше на каждую оценку уходило отдельное сообщение.
+    В режиме status на раунд уходит одно сообщение и несколько правок, сколько бы игроков ни голосовало.
+    '''
+
+    def __init__(self, mode: str = config.score_ack_mode, debounce_seconds: float = config.score_ack_debounce_seconds,
+                 reaction: str = config.score_ack_reaction):
+        self.mode = AckMode(mode)
+        self.debounce_seconds = debounce_seconds
+        self.reaction = reaction
+        self._rounds: dict[int, RoundStatus] = {}
+
+    def acknowledge(self, message: Message):
+        chat_id = message.chat.id
+        if self.mode == AckMode.reaction:
+            outbox.send(SetMessageReaction(chat_id=chat_id, message_id=message.message_id,
+                                           reaction=[{'type': 'emoji', 'emoji': self.reaction}]),
+                        chat_id=chat_id, priority=Priority.ack)
+        elif self.mode == AckMode.status:
+            status = self._rounds.setdefault(chat_id, RoundStatus())
+            status.voters[message.from_user.id] = message.from_user.full_name
+            key = ('score_status', chat_id)
+            if not scheduler.is_scheduled(key):
+                scheduler.schedule_in(key, self.debounce_seconds, self._flush, chat_id, status)
+
+    def new_round(self, chat_id: int):
+        '''
+        Раунд закончился: следующая оценка начнёт новое сообщение.
+        '''
+        self.forget(chat_id)
+
+    def forget(self, chat_id: int):
+        '''
+        Забыть сообщение раунда и отменить его правку. Вызывается и при удалении лобби.
+        '''
+        scheduler.cancel(('score_status', chat_id))
+        self._rounds.pop(chat_id, None)
+
+    async def _flush(self, chat_id: int, status: RoundStatus):
+        # Пока первое сообщение раунда ждёт в очереди, следующая правка ждёт его id.
+        async with status.lock:
+            if self._rounds.get(chat_id) is not status:
+                return
+            text = f'📝 Оценки поставили ({len(status.voters)}): ' + ', '.join(status.voters.values())
+            if text == status.text:
+                return
+            status.text = text
+            if status.message_id is None:
+                sent = await outbox.send_message(chat_id=chat_id, text=text, priority=Priority.ack, mergeable=False)
+                status.message_id = sent.message_id
+            else:
+                outbox.send(EditMessageText(chat_id=chat_id, message_id=status.message_id, text=text),
+                            chat_id=chat_id, priority=Priority.ack)
+
+
+score_acks = ScoreAcks()
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class ScoreBatcher:
+    '''
+    Собирает оценки одного чата в короткое окно и применяет их одной пачкой.
+    Если пользователь успел прислать несколько чисел - остаётся последнее.
+    '''
+
+    def __init__(self, apply: Callable[[int, dict[int, int]], Awaitable], window_seconds: float):
+        '''
+        :param apply: Корутина, которая применяет пачку {user_id: score} к игре чата.
+        :param window_seconds: Длина окна, в течение которого копятся оценки.
+        '''
+        self.apply = apply
+        self.window_seconds = window_seconds
+        self._pending: dict[int, dict[int, int]] = {}
+        self._timers: dict[int, asyncio.Task] = {}
+
+    async def submit(self, chat_id: int, user_id: int, score: int) -> None:
+        '''
+        Добавить оценку в окно чата. Применения не ждёт: апдейты чата обрабатываются по очереди,
+        и ожидание окна задержало бы все следующие. Кому нужны применённые оценки - вызывает drain.
+        :param chat_id:
+        :param user_id:
+        :param score:
+        :return:
+        '''
+        self._pending.setdefault(chat_id, {})[user_id] = score
+        if chat_id not in self._timers:
+            self._timers[chat_id] = asyncio.create_task(self._close_window(chat_id))
+
+    async def _close_window(self, chat_id: int):
+        await asyncio.sleep(self.window_seconds)
+        self._timers.pop(chat_id, None)
+        try:
+            await self.drain(chat_id)
+        except Exception:
+            logger.exception('score_batch_failed', extra={'chat_id': chat_id})
+
+    async def drain(self, chat_id: int) -> None:
+        '''
+        Применить накопленные оценки чата прямо сейчас, не дожидаясь конца окна.
+        Вызывается перед подсчётом раунда, чтобы не потерять последние оценки.
+        :param chat_id:
+        :return:
+        '''
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        scores = self._pending.pop(chat_id, None)
+        if scores:
+            await self.apply(chat_id, scores)
+
+    def discard(self, chat_id: int) -> None:
+        '''
+        Выбросить оценки чата, которые ещё не применены: игры больше нет.
+        :param chat_id:
+        :return:
+        '''
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._pending.pop(chat_id, None)
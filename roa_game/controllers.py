@@ -1,6 +1,7 @@
 from aiogram.types import Message
 
 from common.controllers import Controller
+from roa_game.errors import RenderQueueFull, RenderTimeout
 from roa_game.graph import Plotter
 from roa_game.models import RoaGame, RoundData
 from roa_game.views import RoaGameTgView, GraphTgView
@@ -10,9 +11,7 @@ class RoaGameController(Controller):
     def __init__(self, view: RoaGameTgView = RoaGameTgView(), model: RoaGame = RoaGame()):
         super().__init__(view, model)
 
-    async def start(self, message: Message, words_list: list[str]):
-        chat_id = message.chat.id
-
+    async def start(self, chat_id: int, words_list: list[str]):
         await self.model.start(chat_id=chat_id, words_list=words_list)
         await self.view.start(chat_id=chat_id)
 
@@ -20,8 +19,7 @@ class RoaGameController(Controller):
         chat_id = message.chat.id
         await self.model.next_word(chat_id=chat_id)
 
-    async def get_current_word(self, message: Message):
-        chat_id = message.chat.id
+    async def get_current_word(self, chat_id: int):
         word = await self.model.get_current_word(chat_id=chat_id)
         await self.view.current_topic(chat_id=chat_id, topic=word)
 
@@ -52,5 +50,8 @@ class GraphController(Controller):
     async def result(self, message: Message, round_data_list: list[RoundData]):
         chat_id = message.chat.id
 
-        bytes_png = await self.model.create_plot(round_data_list)
-        await self.view.plot(chat_id=chat_id, bytes_png=bytes_png)
+        try:
+            chart = await self.model.create_plot(round_data_list)
+        except (RenderQueueFull, RenderTimeout) as e:
+            return await self.view.error(error_text=e.msg, chat_id=chat_id)
+        await self.view.plot(chat_id=chat_id, chart=chart)
@@ -2,3 +2,15 @@ class GameIsNotExist(Exception):
     def __init__(self, message="Игра не началась"):
         self.msg = message
         super().__init__(self.msg)
+
+
+class RenderQueueFull(Exception):
+    def __init__(self, message="Сейчас рисуется слишком много графиков, этот пропущен"):
+        self.msg = message
+        super().__init__(self.msg)
+
+
+class RenderTimeout(Exception):
+    def __init__(self, message="График не успел нарисоваться"):
+        self.msg = message
+        super().__init__(self.msg)
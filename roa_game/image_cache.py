@@ -0,0 +1,126 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+# Маркер "картинки для темы нет" - чтобы не спрашивать Unsplash про неё каждую игру.
+NEGATIVE_SUFFIX = '.none'
+POSITIVE_SUFFIX = '.png'
+
+
+class ImageCache:
+    '''
+    Готовые миниатюры тем на диске. Ключ - sha256 от нормализованной темы, поэтому одна и та же тема
+    из разных игр и с разным регистром/пробелами попадает в один файл.
+    Время записи - mtime файла (по нему считается TTL), время последнего чтения - atime (по нему LRU).
+    Методы блокирующие, из event loop их вызывают через asyncio.to_thread.
+    '''
+
+    def __init__(self, directory: str = config.image_cache_dir, max_bytes: int = config.image_cache_max_bytes,
+                 ttl_seconds: float = config.image_cache_ttl_seconds,
+                 negative_ttl_seconds: float = config.image_cache_negative_ttl_seconds):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._lock = threading.Lock()
+        # Путь -> размер, от давно не читанных к недавним.
+        self._index: OrderedDict[str, int] | None = None
+        self._size = 0
+
+    @staticmethod
+    def normalize(keyword: str) -> str:
+        return ' '.join(keyword.casefold().split())
+
+    def _path(self, keyword: str, suffix: str) -> str:
+        digest = hashlib.sha256(self.normalize(keyword).encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + suffix)
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                entries.append((stat.st_atime, path, stat.st_size))
+        self._index = OrderedDict((path, size) for _, path, size in sorted(entries))
+        self._size = sum(self._index.values())
+
+    def _drop(self, path: str):
+        size = self._index.pop(path, None)
+        if size is not None:
+            self._size -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _read(self, path: str, ttl_seconds: float, now: float) -> bytes | None:
+        if path not in self._index:
+            return None
+        try:
+            mtime = os.stat(path).st_mtime
+            if now - mtime > ttl_seconds:
+                self._drop(path)
+                return None
+            with open(path, 'rb') as f:
+                content = f.read()
+            os.utime(path, (now, mtime))
+        except FileNotFoundError:
+            self._drop(path)
+            return None
+        self._index.move_to_end(path)
+        return content
+
+    def get(self, keyword: str) -> tuple[bool, bytes | None]:
+        '''
+        :param keyword: Тема.
+        :return: (есть ли запись в кэше, миниатюра). (True, None) - тема закэширована как "картинки нет".
+        '''
+        now = time.time()
+        with self._lock:
+            self._load_index()
+            content = self._read(self._path(keyword, POSITIVE_SUFFIX), self.ttl_seconds, now)
+            if content is not None:
+                return True, content
+            if self._read(self._path(keyword, NEGATIVE_SUFFIX), self.negative_ttl_seconds, now) is not None:
+                return True, None
+            return False, None
+
+    def put(self, keyword: str, thumbnail: bytes | None):
+        '''
+        Сохранить миниатюру темы или, если thumbnail=None, отметить, что картинки нет.
+        Если кэш вылез за max_bytes - удаляются давно не читанные записи.
+        :param keyword:
+        :param thumbnail:
+        :return:
+        '''
+        path = self._path(keyword, POSITIVE_SUFFIX if thumbnail is not None else NEGATIVE_SUFFIX)
+        content = thumbnail or b''
+        with self._lock:
+            self._load_index()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            self._drop_from_index(path)
+            self._index[path] = len(content)
+            self._size += len(content)
+            while self._size > self.max_bytes and len(self._index) > 1:
+                self._drop(next(iter(self._index)))
+
+    def _drop_from_index(self, path: str):
+        size = self._index.pop(path, None)
+        if size is not None:
+            self._size -= size
+
+
+image_cache = ImageCache()
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from io import BytesIO
+
+import config
+from common.http import HttpClient, http_client
+from roa_game.image_cache import ImageCache, image_cache
+
+logger = logging.getLogger(__name__)
+
+
+def make_thumbnail(content: bytes, size: int = config.image_thumbnail_size) -> bytes:
+    '''
+    Уменьшить картинку до миниатюры для графика. Выполняется вне event loop.
+    :param content: Исходная картинка в любом формате, который понимает PIL.
+    :param size: Максимальная сторона миниатюры в пикселях.
+    :return: Миниатюра в PNG.
+    '''
+    # PIL нужен только в конце игры, поэтому не грузится при старте бота.
+    from PIL import Image
+
+    img = Image.open(BytesIO(content))
+    img.thumbnail((size, size))
+    buf = BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+class ImageScraper:
+    def __init__(self, api_key=config.unsplash_api_key, client: HttpClient = http_client,
+                 concurrency: int = config.image_fetch_concurrency,
+                 total_timeout_seconds: float = config.image_fetch_total_timeout_seconds,
+                 cache: ImageCache | None = image_cache):
+        self.api_key = api_key
+        self.base_url = "https://api.unsplash.com/photos/random"
+        self.client = client
+        self.concurrency = concurrency
+        self.total_timeout_seconds = total_timeout_seconds
+        self.cache = cache
+
+    async def fetch_random_image(self, keyword) -> str | None:
+        '''
+        :param keyword:
+        :return: Ссылка на картинку или None, если по теме ничего нет.
+        Остальные ответы (лимит, ошибка ключа) - исключение, чтобы тема не попала в кэш как "картинки нет".
+        '''
+        headers = {"Authorization": f"Client-ID {self.api_key}"}
+        async with self.client.session().get(self.base_url, params={'query': keyword}, headers=headers) as response:
+            if response.status == 404:
+                return None
+            response.raise_for_status()
+            json_response = await response.json()
+            if 'urls' in json_response:
+                return json_response['urls']['regular']
+        return None
+
+    async def fetch_thumbnail(self, keyword) -> bytes | None:
+        image_url = await self.fetch_random_image(keyword)
+        if not image_url:
+            return None
+        async with self.client.session().get(image_url) as response:
+            response.raise_for_status()
+            content = await response.read()
+        return await asyncio.to_thread(make_thumbnail, content)
+
+    async def fetch_cached_thumbnail(self, keyword) -> bytes | None:
+        '''
+        Миниатюра из кэша, а при промахе - из Unsplash с записью в кэш.
+        '''
+        if self.cache is None:
+            return await self.fetch_thumbnail(keyword)
+        is_cached, thumbnail = await asyncio.to_thread(self.cache.get, keyword)
+        if is_cached:
+            return thumbnail
+        thumbnail = await self.fetch_thumbnail(keyword)
+        await asyncio.to_thread(self.cache.put, keyword, thumbnail)
+        return thumbnail
+
+    async def fetch_thumbnails(self, keywords: list[str]) -> dict[str, bytes | None]:
+        '''
+        Миниатюры для всех тем сразу, не больше concurrency запросов одновременно.
+        Тема, для которой картинка не нашлась, не скачалась или не успела за total_timeout_seconds, получает None.
+        :param keywords:
+        :return: Тема -> PNG-миниатюра.
+        '''
+        keywords = list(dict.fromkeys(keywords))
+        if not self.api_key or not keywords:
+            return {keyword: None for keyword in keywords}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(keyword):
+            async with semaphore:
+                return await self.fetch_cached_thumbnail(keyword)
+
+        tasks = {keyword: asyncio.create_task(fetch(keyword)) for keyword in keywords}
+        done, pending = await asyncio.wait(tasks.values(), timeout=self.total_timeout_seconds)
+        for task in pending:
+            task.cancel()
+
+        thumbnails = {}
+        for keyword, task in tasks.items():
+            thumbnails[keyword] = None
+            if task not in done:
+                logger.warning('image_fetch_timeout', extra={'keyword': keyword})
+            elif task.exception() is not None:
+                logger.warning('image_fetch_failed', extra={'keyword': keyword, 'error': repr(task.exception())})
+            else:
+                thumbnails[keyword] = task.result()
+        return thumbnails
@@ -1,15 +1,22 @@
 import json
+import logging
 from dataclasses import dataclass
 
 from sqlalchemy import String, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column
-from game_manager.models import Game
-from db.core import async_session_maker
+import config
+from game_manager.cache import GameInstanceCache
+from game_manager.codec import GameDataWriter, GameDataReader, is_binary
+from game_manager.models import Game, GameTitles
+from db.core import async_session_maker, async_read_session_maker, unit_of_work
 from lobby.models import Lobby, HiddenWord, WordProvider
+from roa_game.batcher import ScoreBatcher
 from roa_game.errors import GameIsNotExist
 from game_manager.errors import GameIsDone
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class RoundData:
@@ -80,18 +87,61 @@ class RoaInstance:
         else:
             self.current_round += 1
 
-    async def serialize(self):
-        return json.dumps({
-            "words": self.words,
-            "participants": list(self.participants.items()),  # Преобразуем в список кортежей
-            "num_rounds": self.num_rounds,
-            "current_round": self.current_round,
-            "current_scores": self.current_scores,
-            "word_total_scores": self.word_total_scores
-        })
+    async def apply_event(self, kind: str, payload: dict):
+        '''
+        Доиграть событие из журнала GameEvent поверх снимка.
+        :param kind:
+        :param payload:
+        :return:
+        '''
+        if kind == 'scores_set':
+            for user_id, score in payload['scores']:
+                await self.set_score_for_word(user_id=user_id, score=score)
+        elif kind == 'round_advanced':
+            await self.next_round()
+
+    async def serialize(self) -> bytes:
+        writer = GameDataWriter()
+        writer.uint(len(self.words))
+        for word in self.words:
+            writer.text(word)
+        writer.uint(len(self.participants))
+        for user_id, name in self.participants.items():
+            writer.sint(user_id)
+            writer.text(name)
+        writer.uint(self.num_rounds)
+        writer.uint(self.current_round)
+        # Оценки - матрица слово x участник в порядке таблиц выше, без повторения ключей.
+        for word in self.words:
+            scores = self.current_scores[word]
+            for user_id in self.participants:
+                writer.sint(scores.get(user_id, 0))
+        for word in self.words:
+            writer.sint(self.word_total_scores[word])
+        return writer.pack()
+
+    @staticmethod
+    async def deserialize(data):
+        if not is_binary(data):
+            return await RoaInstance.deserialize_json(data)
+        reader = GameDataReader(data)
+        words = [reader.text() for _ in range(reader.uint())]
+        participants = [(reader.sint(), reader.text()) for _ in range(reader.uint())]
+        game = RoaInstance(words, participants)
+        game.num_rounds = reader.uint()
+        game.current_round = reader.uint()
+        game.current_scores = {
+            word: {user_id: reader.sint() for user_id, _ in participants}
+            for word in words
+        }
+        game.word_total_scores = {word: reader.sint() for word in words}
+        return game
 
     @staticmethod
-    async def deserialize(json_data):
+    async def deserialize_json(json_data):
+        '''
+        Старый JSON-формат. Оставлен для строк, которые ещё не перекодированы.
+        '''
         data = json.loads(json_data)
         game = RoaInstance(data["words"], data["participants"])  # Используем как словарь
         game.num_rounds = data["num_rounds"]
@@ -107,10 +157,11 @@ class RoaInstance:
 class RoaGame(Game):
 
     @classmethod
-    async def create(cls, chat_id: int, session: AsyncSession, users, words):
-        game_data = RoaInstance(words=words, participants=users)
-        game_data = await game_data.serialize()
+    async def create(cls, chat_id: int, session: AsyncSession, users, words) -> RoaInstance:
+        instance = RoaInstance(words=words, participants=users)
+        game_data = await instance.serialize()
         session.add(RoaGame(lobby_id=chat_id, game_data=game_data, game_name='roa'))
+        return instance
 
     @classmethod
     async def get(cls, chat_id: int, session: AsyncSession):
@@ -119,110 +170,113 @@ class RoaGame(Game):
         )).scalar_one_or_none()
         return game
 
-    async def __next_word_in_data(self):
-        game_data = await self.get_game_data()
-        await game_data.next_round()
-        await self.load_game_data(new_game_data=game_data)
-
     async def get_game_data(self) -> RoaInstance:
         return await RoaInstance.deserialize(self.game_data)
 
-    async def __get_scores_for_current_word(self) -> RoundData:
-        game_data = await self.get_game_data()
-        return await game_data.get_scores_for_current_word()
-
-    async def __set_score(self, user_id, score: int) -> None:
-        game_data = await self.get_game_data()
-        await game_data.set_score_for_word(user_id=user_id, score=score)
-        await self.load_game_data(new_game_data=game_data)
-
     async def load_game_data(self, new_game_data: RoaInstance):
         self.game_data = await new_game_data.serialize()
 
+    @classmethod
+    async def load_instance(cls, chat_id: int, async_session=async_read_session_maker
+                            ) -> tuple[RoaInstance, int, int] | None:
+        '''
+        Достать состояние игры из БД: снимок + события после него. Используется кэшем при промахе.
+        :param chat_id:
+        :param async_session:
+        :return: Объект игры, количество событий после снимка и версия игры.
+        '''
+        async with unit_of_work(async_session) as session:
+            game = await RoaGame.get(chat_id=chat_id, session=session)
+            if game is None or game.game_name != GameTitles.rate_off_all.value:
+                return None
+            instance = await game.restore(RoaInstance)
+            return instance, game.pending_events, game.version
+
     @classmethod
     async def start(cls, chat_id, words_list: list[str], async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                if await Lobby.is_ready_for_game(session=session, chat_id=chat_id):
-                    lobby = await Lobby.get(session=session, chat_id=chat_id)
-                    users = await lobby.get_members_id_name_tuple()
-                    await cls.create(session=session, chat_id=chat_id, users=users, words=words_list)
-                    await lobby.game_running_state()
-                else:
-                    print('Лобби не соотвествует тому, что надо для запуска ROA')
+        instance = None
+        async with unit_of_work(async_session) as session:
+            lobby = await Lobby.get(session=session, chat_id=chat_id)
+            if await Lobby.is_ready_for_game(session=session, chat_id=chat_id):
+                users = await lobby.get_members_id_name_tuple()
+                instance = await cls.create(session=session, chat_id=chat_id, users=users, words=words_list)
+                await lobby.game_running_state()
+            else:
+                logger.warning('roa_lobby_not_ready', extra={'chat_id': chat_id})
+        if instance is not None:
+            roa_cache.put(chat_id, instance)
 
     @classmethod
-    async def get_current_word(cls, chat_id: int, async_session=async_session_maker):
-        async with async_session() as session:
-            async with session.begin():
-                game = await RoaGame.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                return await game_data.get_current_word()
+    async def get_current_word(cls, chat_id: int):
+        game_data = await roa_cache.get(chat_id)
+        return await game_data.get_current_word()
 
     @classmethod
-    async def next_word(cls, chat_id: int, async_session=async_session_maker):
+    async def next_word(cls, chat_id: int):
         '''
-        Переключает на следующее слово.
+        Переключает на следующее слово. Конец раунда - изменения сразу пишутся в БД.
         :param chat_id:
-        :param async_session:
         :return:
         '''
-        async with async_session() as session:
-            async with session.begin():
-                game = await RoaGame.get(chat_id=chat_id, session=session)
-                await game.__next_word_in_data()
+        await score_batcher.drain(chat_id)
+        game_data = await roa_cache.get(chat_id)
+        await game_data.next_round()
+        roa_cache.record(chat_id, 'round_advanced', snapshot=True)
+        await roa_cache.flush(chat_id)
 
     @classmethod
-    async def get_round_score(cls, chat_id: int, async_session=async_session_maker) -> RoundData | None:
+    async def get_round_score(cls, chat_id: int) -> RoundData | None:
         '''
         Получить данные по раунду.
         :param chat_id:
-        :param async_session:
         :return:
         '''
-        async with async_session() as session:
-            async with session.begin():
-                game = await RoaGame.get(chat_id=chat_id, session=session)
-                if not game:
-                    raise GameIsNotExist()
-                prev_word_data = await game.__get_scores_for_current_word()
-                return prev_word_data
+        await score_batcher.drain(chat_id)
+        game_data = await roa_cache.get(chat_id)
+        return await game_data.get_scores_for_current_word()
 
     @classmethod
-    async def set_score(cls, user_id, chat_id: int, score: int, async_session=async_session_maker):
+    async def set_score(cls, user_id, chat_id: int, score: int):
         '''
-        Публичный метод чтобы поставить оценку текущему слову в раунде
+        Публичный метод чтобы поставить оценку текущему слову в раунде.
+        Оценки чата копятся в коротком окне и применяются пачкой через set_scores.
         :param user_id:
         :param chat_id:
         :param score:
-        :param async_session:
         :return:
         '''
-        async with async_session() as session:
-            async with session.begin():
-                game = await RoaGame.get(chat_id=chat_id, session=session)
-                if game is None:
-                    raise GameIsNotExist()
-                await game.__set_score(user_id=user_id, score=score)
-                print('------------')
-                print((await RoaGame.get(chat_id=chat_id, session=session)).game_data)
-                return score
+        await roa_cache.get(chat_id)
+        await score_batcher.submit(chat_id=chat_id, user_id=user_id, score=score)
+        return score
 
     @classmethod
-    async def result(cls, chat_id: int, async_session=async_session_maker) -> list[RoundData]:
+    async def set_scores(cls, chat_id: int, scores: dict[int, int]):
         '''
-        Публичный метод чтобы поставить оценку текущему слову в раунде
-        :param user_id:
+        Применить пачку оценок {user_id: score} к текущему слову.
         :param chat_id:
-        :param score:
-        :param async_session:
+        :param scores:
         :return:
         '''
-        async with async_session() as session:
-            async with session.begin():
-                game = await RoaGame.get(chat_id=chat_id, session=session)
-                game_data = await game.get_game_data()
-                return await game_data.get_total_scores_all()
+        game_data = await roa_cache.get(chat_id)
+        for user_id, score in scores.items():
+            await game_data.set_score_for_word(user_id=user_id, score=score)
+        roa_cache.record(chat_id, 'scores_set', {'scores': list(scores.items())})
+
+    @classmethod
+    async def result(cls, chat_id: int) -> list[RoundData]:
+        '''
+        Итоги игры. Игра закончилась - состояние сбрасывается в БД.
+        :param chat_id:
+        :return:
+        '''
+        await score_batcher.drain(chat_id)
+        game_data = await roa_cache.get(chat_id)
+        await roa_cache.flush(chat_id, snapshot=True)
+        return await game_data.get_total_scores_all()
+
+
+roa_cache = GameInstanceCache(loader=RoaGame.load_instance, flush_seconds=config.roa_flush_seconds)
+score_batcher = ScoreBatcher(apply=RoaGame.set_scores, window_seconds=config.roa_score_window_ms / 1000)
 
 
 # async def main():
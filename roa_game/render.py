@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import multiprocessing
+import random
+import textwrap
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+
+import config
+from common.logs import elapsed_ms
+from roa_game.errors import RenderQueueFull, RenderTimeout
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'WEBP': 'webp'}
+# Ступени ужатия, если результат не влез в бюджет: сначала качество (JPEG/WebP), потом размер.
+QUALITY_STEPS = (1.0, 0.85, 0.7, 0.55)
+SCALE_STEPS = (1.0, 0.8, 0.64, 0.5, 0.4)
+
+
+@dataclass
+class RenderProfile:
+    name: str
+    dpi: int
+    format: str
+    max_side: int
+    max_bytes: int
+    quality: int
+
+    @classmethod
+    def from_config(cls, name: str = config.render_profile) -> 'RenderProfile':
+        profile = config.render_profiles[name]
+        image_format = profile['format'].upper()
+        if image_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f'Неизвестный формат профиля {name}: {image_format}')
+        return cls(name=name, dpi=profile['dpi'], format=image_format, max_side=profile['max_side'],
+                   max_bytes=profile['max_bytes'], quality=profile['quality'])
+
+
+@dataclass
+class RenderedChart:
+    content: bytes
+    file_name: str
+    profile: str
+    encode_seconds: float
+
+
+def encode_image(image, profile: RenderProfile) -> bytes:
+    '''
+    Закодировать картинку по профилю так, чтобы она влезла в max_bytes.
+    Если не влезает и на последней ступени - возвращается самый маленький вариант.
+    :param image: PIL.Image.
+    :param profile:
+    :return:
+    '''
+    from PIL import Image
+
+    if image.mode != 'RGB' and profile.format == 'JPEG':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    scale = min(1.0, profile.max_side / max(image.size))
+    image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS) \
+        if scale < 1.0 else image
+
+    quality_steps = QUALITY_STEPS if profile.format != 'PNG' else (1.0,)
+    content = None
+    for scale_step in SCALE_STEPS:
+        scaled = image if scale_step == 1.0 else image.resize(
+            (round(image.width * scale_step), round(image.height * scale_step)), Image.LANCZOS)
+        for quality_step in quality_steps:
+            buf = BytesIO()
+            scaled.save(buf, format=profile.format, optimize=True, quality=round(profile.quality * quality_step))
+            content = buf.getvalue()
+            if len(content) <= profile.max_bytes:
+                return content
+    return content
+
+
+def render_chart(bars: list[tuple[str, int]], thumbnails: dict[str, bytes | None],
+                 profile: RenderProfile) -> RenderedChart:
+    '''
+    Нарисовать итоговый график. Выполняется в процессе пула, поэтому принимает и возвращает только простые данные.
+    Рисует через Figure, без глобального состояния pyplot. matplotlib и PIL импортируются здесь,
+    чтобы основной процесс бота их не загружал.
+    :param bars: (тема, общий балл) по раундам.
+    :param thumbnails: Тема -> PNG-миниатюра.
+    :param profile: Разрешение, формат и бюджет по размеру.
+    :return:
+    '''
+    from matplotlib import colormaps
+    from matplotlib.figure import Figure
+    from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+    from PIL import Image
+
+    figsize = (10, 6)
+    # Рисовать крупнее, чем max_side, бессмысленно - всё равно ужмётся при кодировании.
+    dpi = min(profile.dpi, profile.max_side / max(figsize))
+    labels = [textwrap.fill(word, width=15) for word, _ in bars]
+    x = [total_score for _, total_score in bars]
+    colors = [colormaps['jet'](random.random()) for _ in range(len(labels))]
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    drawn_bars = ax.barh(labels, x, color=colors, edgecolor='black')
+
+    ax.set_title('РЕЙТИНГ ВСЕГО', pad=20)
+
+    ax.grid(True, axis='x')
+    ax.axvline(0, color='black', linewidth=0.5)
+
+    for bar, (word, total_score) in zip(drawn_bars, bars):
+        thumbnail = thumbnails.get(word)
+        if thumbnail:
+            imagebox = OffsetImage(Image.open(BytesIO(thumbnail)))
+            ax.add_artist(AnnotationBbox(imagebox, (total_score, bar.get_y() + bar.get_height() / 2), frameon=False))
+
+    start = time.perf_counter()
+    buf = BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight', dpi=dpi)
+    buf.seek(0)
+    content = encode_image(Image.open(buf), profile)
+    return RenderedChart(content=content, file_name=f'rateofall.{FORMAT_EXTENSIONS[profile.format]}',
+                         profile=profile.name, encode_seconds=time.perf_counter() - start)
+
+
+def warm_up_worker():
+    import matplotlib.figure  # noqa: F401
+    import matplotlib.offsetbox  # noqa: F401
+    import PIL.Image  # noqa: F401
+
+
+class ChartRenderer:
+    '''
+    Пул процессов для отрисовки графиков. Пока график рисуется, event loop бота свободен,
+    а несколько закончившихся одновременно игр рисуются параллельно.
+    '''
+
+    def __init__(self, workers: int = config.render_workers, queue_limit: int = config.render_queue_limit,
+                 timeout_seconds: float = config.render_timeout_seconds, profile: RenderProfile | None = None):
+        self.profile = profile or RenderProfile.from_config()
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout_seconds = timeout_seconds
+        self._executor: ProcessPoolExecutor | None = None
+        self._in_flight = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # spawn, а не fork: к моменту первой отрисовки в процессе уже есть потоки aiosqlite и to_thread.
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    async def warm_up(self):
+        '''
+        Поднять процессы пула и загрузить в них matplotlib заранее, чтобы первый график не ждал их запуска.
+        Вызывается в фоне после старта бота.
+        '''
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            loop.run_in_executor(self._get_executor(), warm_up_worker) for _ in range(self.workers)
+        ])
+        logger.info('render_pool_warmed', extra={'duration_ms': elapsed_ms(start)})
+
+    async def render(self, bars: list[tuple[str, int]], thumbnails: dict[str, bytes | None]) -> RenderedChart:
+        '''
+        :param bars:
+        :param thumbnails:
+        :return:
+        Если в работе и в очереди уже workers + queue_limit графиков - RenderQueueFull.
+        Если график не готов за timeout_seconds - RenderTimeout (процесс пула при этом дорисует его впустую).
+        '''
+        if self._in_flight >= self.workers + self.queue_limit:
+            raise RenderQueueFull()
+        self._in_flight += 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._get_executor(), render_chart, bars, thumbnails,
+                                                                self.profile)
+            chart = await asyncio.wait_for(future, self.timeout_seconds)
+            logger.info('chart_rendered', extra={'profile': chart.profile, 'bytes': len(chart.content),
+                                                 'encode_ms': round(chart.encode_seconds * 1000, 2)})
+            return chart
+        except asyncio.TimeoutError:
+            raise RenderTimeout()
+        finally:
+            self._in_flight -= 1
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+chart_renderer = ChartRenderer()
@@ -1,3 +1,5 @@
+import logging
+
 from aiogram.types import message
 
 from lobby.errors import EmptyParty, FillerAlreadyUsed, GameIsRunning
@@ -5,22 +7,24 @@ from roa_game.controllers import RoaGameController, GraphController
 from roa_game.errors import GameIsNotExist
 from game_manager.errors import GameIsDone
 
+logger = logging.getLogger(__name__)
+
 
 class RoaGameService():
     @staticmethod
-    async def start_roa(message: message, words_list: list[str]):
+    async def start_roa(chat_id: int, words_list: list[str]):
         try:
-            await RoaGameController().start(message=message, words_list=words_list)
-            await RoaGameController().get_current_word(message=message)
+            await RoaGameController().start(chat_id=chat_id, words_list=words_list)
+            await RoaGameController().get_current_word(chat_id=chat_id)
         except (EmptyParty, FillerAlreadyUsed, GameIsRunning) as e:
-            print(e)
+            logger.warning('roa_start_failed', extra={'chat_id': chat_id, 'error': e.msg})
 
     @staticmethod
     async def next_word(message: message):
         try:
             await RoaGameController().round_stats(message=message)
             await RoaGameController().next_word(message=message)
-            await RoaGameController().get_current_word(message=message)
+            await RoaGameController().get_current_word(chat_id=message.chat.id)
         except (EmptyParty, FillerAlreadyUsed, GameIsRunning) as e:
             raise e
         except GameIsDone:
@@ -1,52 +1,57 @@
-from io import BytesIO
-
-from PIL import Image
+from aiogram.methods import SendPhoto
 from aiogram.types import BufferedInputFile, Message
 
 from common.views import CommonView
+from roa_game.acks import score_acks
 from roa_game.models import RoundData
-from telegram.consts import bot
+from roa_game.render import RenderedChart
+from telegram.outbox import outbox, Priority
 
 
 class RoaGameTgView(CommonView):
     @staticmethod
     async def start(chat_id: int):
-        await bot.send_message(chat_id=chat_id,
-                               text=f'🎉 Добро пожаловать в игру *Рейтинг всего*! 🌟')
+        outbox.send_message(chat_id=chat_id, text=f'🎉 Добро пожаловать в игру *Рейтинг всего*! 🌟',
+                            priority=Priority.prompt)
 
     @staticmethod
     async def error(error_text, chat_id: int):
-        await bot.send_message(chat_id=chat_id, text=error_text)
+        outbox.send_message(chat_id=chat_id, text=error_text)
 
     @staticmethod
     async def set_score(message: Message):
-        await message.answer(text=f'📝')
+        score_acks.acknowledge(message)
 
     @staticmethod
     async def current_topic(chat_id: int, topic: str):
-        await bot.send_message(chat_id=chat_id,
-                               text=f'🌟 *ТЕМА:* {topic}\n Напишите в чат, как вы оцениваете данное событие/предмет (число от -10 до 10).\nКак только все игроки поставят оценки /next.',
-                               parse_mode='Markdown')
+        outbox.send_message(chat_id=chat_id,
+                            text=f'🌟 *ТЕМА:* {topic}\n Напишите в чат, как вы оцениваете данное событие/предмет (число от -10 до 10).\nКак только все игроки поставят оценки /next.',
+                            parse_mode='Markdown', priority=Priority.prompt)
 
     @staticmethod
     async def round_stats(chat_id: int, round_data: RoundData):
+        score_acks.new_round(chat_id)
         text = (f'🌟 *ТЕМА:* {round_data.word}\n'
                 f'🎯 *Общий балл:* {round_data.total_score}\n\n')
 
         for user, score in round_data.users:
             text += f'💫 {user} поставил(а) {score}\n'
-        await bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+        outbox.send_message(chat_id=chat_id, text=text, parse_mode='Markdown', priority=Priority.prompt)
 
     @staticmethod
     async def result(chat_id: int, round_data: list[RoundData]):
         text = '🏆 *Результаты по игре:*\n'
         for data in round_data:
             text += f'🌟 {data.word} -> {data.total_score} баллов\n'
-        await bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+        outbox.send_message(chat_id=chat_id, text=text, parse_mode='Markdown', priority=Priority.prompt)
 
 
 class GraphTgView():
     @staticmethod
-    async def plot(chat_id: int, bytes_png: BytesIO):
-        photo = BufferedInputFile(bytes_png.read(), 'rateofall.png')
-        return await bot.send_photo(chat_id=chat_id, photo=photo)
+    async def error(error_text, chat_id: int):
+        outbox.send_message(chat_id=chat_id, text=error_text)
+
+    @staticmethod
+    async def plot(chat_id: int, chart: RenderedChart):
+        photo = BufferedInputFile(chart.content, chart.file_name)
+        return outbox.send(SendPhoto(chat_id=chat_id, photo=photo), chat_id=chat_id, priority=Priority.prompt)
@@ -1,6 +1,11 @@
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 
+import config
+
 TOKEN = ''
-bot = Bot(TOKEN, parse_mode=ParseMode.HTML)
+session = AiohttpSession(api=TelegramAPIServer.from_base(config.bot_api_server)) if config.bot_api_server else None
+bot = Bot(TOKEN, parse_mode=ParseMode.HTML, session=session)
 dp = Dispatcher(skip_updates=True)
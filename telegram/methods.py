@@ -0,0 +1,20 @@
+from typing import Optional, Union
+
+from aiogram.methods import TelegramMethod
+
+
+class SetMessageReaction(TelegramMethod[bool]):
+    '''
+    setMessageReaction из Bot API 7.0. В aiogram 3.2 этого метода ещё нет.
+
+    Source: https://core.telegram.org/bots/api#setmessagereaction
+    '''
+
+    __returning__ = bool
+    __api_method__ = "setMessageReaction"
+
+    chat_id: Union[int, str]
+    message_id: int
+    reaction: Optional[list[dict]] = None
+    """Список ReactionType, например [{'type': 'emoji', 'emoji': '👍'}]"""
+    is_big: Optional[bool] = None
@@ -0,0 +1,112 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, Update
+
+from common import metrics
+from common.chat_executor import ChatExecutor
+from common.logs import elapsed_ms
+from common.models import User
+from db.query_stats import track_queries, QueryStats
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateLoggingMiddleware(BaseMiddleware):
+    '''
+    Одна запись на апдейт: чат, тип апдейта, хэндлер, время обработки и запросы к БД - без repr всего сообщения.
+    '''
+
+    async def __call__(self, handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]], event: Message,
+                       data: Dict[str, Any]) -> Any:
+        start = time.perf_counter()
+        with track_queries() as queries:
+            try:
+                result = await handler(event, data)
+            except Exception:
+                logger.exception('update_failed', extra=self._fields(event, data, start, queries))
+                raise
+            if logger.isEnabledFor(logging.INFO):
+                logger.info('update', extra=self._fields(event, data, start, queries))
+            return result
+
+    @staticmethod
+    def _fields(event: Message, data: Dict[str, Any], start: float, queries: QueryStats) -> dict:
+        update = data.get('event_update')
+        return {
+            'chat_id': event.chat.id,
+            'update_type': update.event_type if update is not None else type(event).__name__,
+            'handler': data['handler'].callback.__name__,
+            'duration_ms': elapsed_ms(start),
+            **queries.as_fields(),
+        }
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    '''
+    Гистограмма времени обработки по хэндлерам и счётчик ошибок.
+    '''
+
+    async def __call__(self, handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]], event: Message,
+                       data: Dict[str, Any]) -> Any:
+        name = data['handler'].callback.__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.handler_errors.inc(name)
+            raise
+        finally:
+            metrics.handler_seconds.observe(time.perf_counter() - start, name)
+
+
+class UpdateCountMiddleware(BaseMiddleware):
+    '''
+    Внешний middleware на апдейты: считает все входящие, включая те, для которых нет хэндлера.
+    '''
+
+    async def __call__(self, handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]], event: Update,
+                       data: Dict[str, Any]) -> Any:
+        metrics.updates.inc(event.event_type)
+        return await handler(event, data)
+
+
+class ChatOrderMiddleware(BaseMiddleware):
+    '''
+    Внешний middleware на апдейты: апдейты одного чата обрабатываются строго по очереди,
+    разных чатов - параллельно в пределах общего лимита.
+    '''
+
+    def __init__(self, executor: ChatExecutor):
+        self.executor = executor
+
+    async def __call__(self, handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]], event: Update,
+                       data: Dict[str, Any]) -> Any:
+        chat = data.get('event_chat')
+        async with self.executor.slot(chat.id if chat is not None else None):
+            return await handler(event, data)
+
+
+class ShardRoutingMiddleware(BaseMiddleware):
+    '''
+    Внешний middleware фронта при шардировании: апдейт не обрабатывается, а пересылается обработчику,
+    которому принадлежит чат. Личные сообщения идут туда же, куда лобби автора, - темы для игры
+    должен принять тот же процесс, что ведёт игру.
+    '''
+
+    def __init__(self, forwarder):
+        self.forwarder = forwarder
+
+    async def __call__(self, handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]], event: Update,
+                       data: Dict[str, Any]) -> Any:
+        chat = data.get('event_chat')
+        user = data.get('event_from_user')
+        if chat is not None and chat.type == 'private' and user is not None:
+            chat_id = await User.get_lobby_id(tg_id=user.id) or chat.id
+        elif chat is not None:
+            chat_id = chat.id
+        else:
+            chat_id = user.id if user is not None else 0
+        await self.forwarder.forward(chat_id, event)
@@ -0,0 +1,255 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+from aiogram.methods import SendMessage, TelegramMethod
+
+import config
+from common import metrics
+from .consts import bot
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+
+
+class Priority(IntEnum):
+    # Ход игры: темы, кто отвечает, итоги раунда.
+    prompt = 0
+    # Лобби, ошибки, служебные сообщения.
+    normal = 1
+    # Подтверждения вроде "записал".
+    ack = 2
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        '''
+        :return: Через сколько секунд появится токен. 0 - есть прямо сейчас.
+        '''
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+@dataclass(order=True)
+class Outgoing:
+    priority: int
+    seq: int
+    method: TelegramMethod = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    mergeable: bool = field(default=False, compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+class Outbox:
+    '''
+    Все исходящие запросы к Bot API идут через одну очередь с общим лимитом и лимитом на каждый чат.
+    Внутри чата раньше уходят сообщения с более высоким приоритетом, при равном - в порядке постановки.
+    Хэндлеры ставят сообщение в очередь и сразу возвращаются; кому нужен ответ API (id опроса) - ждут future.
+    '''
+
+    def __init__(self, global_per_second: float = config.outbox_global_per_second,
+                 group_per_minute: float = config.outbox_group_per_minute,
+                 private_per_second: float = config.outbox_private_per_second,
+                 chat_burst: int = config.outbox_chat_burst, max_in_flight: int = config.outbox_max_in_flight,
+                 max_retries: int = config.outbox_max_retries):
+        self.global_bucket = TokenBucket(rate=global_per_second, capacity=global_per_second)
+        self.group_per_minute = group_per_minute
+        self.private_per_second = private_per_second
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._queues: dict[int, list[Outgoing]] = {}
+        self._buckets: dict[int, TokenBucket] = {}
+        self._paused_until: dict[int, float] = {}
+        # Чаты, у которых запрос уже в полёте: следующий ждёт его, чтобы не нарушить порядок.
+        self._busy: set[int] = set()
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._seq = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._sending: set[asyncio.Task] = set()
+
+    def send_message(self, chat_id: int, text: str, parse_mode: str | None = None,
+                     priority: Priority = Priority.normal, reply_to_message_id: int | None = None,
+                     mergeable: bool = True) -> asyncio.Future:
+        '''
+        Поставить текст в очередь. Тексты, которые ещё ждут отправки в этот же чат с тем же parse_mode,
+        склеиваются в одно сообщение, если влезают в лимит Telegram.
+        :return: future с отправленным Message.
+        '''
+        kwargs = {'chat_id': chat_id, 'text': text}
+        if parse_mode is not None:
+            kwargs['parse_mode'] = parse_mode
+        if reply_to_message_id is not None:
+            kwargs['reply_to_message_id'] = reply_to_message_id
+            mergeable = False
+        method = SendMessage(**kwargs)
+        if mergeable:
+            merged = self._merge(chat_id, method, priority)
+            if merged is not None:
+                return merged
+        return self.send(method, chat_id=chat_id, priority=priority, mergeable=mergeable)
+
+    def send(self, method: TelegramMethod, chat_id: int, priority: Priority = Priority.normal,
+             mergeable: bool = False) -> asyncio.Future:
+        '''
+        Поставить в очередь любой метод Bot API.
+        :return: future с результатом метода.
+        '''
+        future = asyncio.get_running_loop().create_future()
+        # Исключение в future, которую никто не ждёт, не должно сыпать предупреждениями.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        heapq.heappush(self._queues.setdefault(chat_id, []),
+                       Outgoing(priority=priority, seq=next(self._seq), method=method, future=future,
+                                mergeable=mergeable))
+        self._start()
+        self._wakeup.set()
+        return future
+
+    def _merge(self, chat_id: int, method: SendMessage, priority: Priority) -> asyncio.Future | None:
+        # Клеить можно только к последнему ждущему сообщению того же приоритета - тогда порядок не меняется.
+        same_priority = [item for item in self._queues.get(chat_id, ()) if item.priority == priority]
+        if not same_priority:
+            return None
+        last = max(same_priority, key=lambda item: item.seq)
+        queued = last.method
+        if (last.mergeable and last.attempts == 0 and queued.parse_mode == method.parse_mode
+                and len(queued.text) + len(method.text) + 2 <= MAX_MESSAGE_LENGTH):
+            queued.text = f'{queued.text}\n\n{method.text}'
+            return last.future
+        return None
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # У групп id отрицательные.
+            rate = self.group_per_minute / 60 if chat_id < 0 else self.private_per_second
+            bucket = self._buckets[chat_id] = TokenBucket(rate=rate, capacity=self.chat_burst)
+        return bucket
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    def _next_ready(self, now: float) -> tuple[int | None, float | None]:
+        '''
+        :return: (чат, из которого можно отправлять прямо сейчас; через сколько проверить снова)
+        '''
+        best_chat, best_key, wait = None, None, None
+        for chat_id, queue in list(self._queues.items()):
+            if not queue:
+                # Пустой чат забывается, когда его лимит полностью восстановился.
+                if self._bucket(chat_id).is_full(now) and self._paused_until.get(chat_id, 0) <= now:
+                    del self._queues[chat_id]
+                    self._buckets.pop(chat_id, None)
+                    self._paused_until.pop(chat_id, None)
+                continue
+            if chat_id in self._busy:
+                continue
+            delay = max(self._bucket(chat_id).delay(now), self._paused_until.get(chat_id, 0) - now)
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            key = (queue[0].priority, queue[0].seq)
+            if best_key is None or key < best_key:
+                best_chat, best_key = chat_id, key
+        return best_chat, wait
+
+    async def _loop(self):
+        while True:
+            now = time.monotonic()
+            chat_id, wait = self._next_ready(now)
+            if chat_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            global_delay = self.global_bucket.delay(now)
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+            await self._in_flight.acquire()
+            now = time.monotonic()
+            self.global_bucket.take(now)
+            self._bucket(chat_id).take(now)
+            item = heapq.heappop(self._queues[chat_id])
+            self._busy.add(chat_id)
+            task = asyncio.create_task(self._deliver(chat_id, item))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, chat_id: int, item: Outgoing):
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await bot(item.method)
+            outcome = 'ok'
+        except TelegramRetryAfter as e:
+            outcome = 'retry_after'
+            logger.warning('flood_control', extra={'chat_id': chat_id, 'retry_after': e.retry_after})
+            self._paused_until[chat_id] = time.monotonic() + e.retry_after
+            self._retry(chat_id, item, count_attempt=False)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            if item.attempts >= self.max_retries:
+                item.future.set_exception(e)
+            else:
+                self._paused_until[chat_id] = time.monotonic() + 2 ** item.attempts
+                self._retry(chat_id, item)
+        except Exception as e:
+            logger.warning('send_failed', extra={'chat_id': chat_id, 'method': type(item.method).__name__,
+                                                 'error': repr(e)})
+            item.future.set_exception(e)
+        else:
+            item.future.set_result(result)
+        finally:
+            metrics.send_seconds.observe(time.perf_counter() - start, type(item.method).__name__, outcome)
+            self._busy.discard(chat_id)
+            self._in_flight.release()
+            self._wakeup.set()
+
+    def _retry(self, chat_id: int, item: Outgoing, count_attempt: bool = True):
+        if count_attempt:
+            item.attempts += 1
+        # seq сохраняется, поэтому сообщение встаёт в начало очереди своего приоритета.
+        heapq.heappush(self._queues.setdefault(chat_id, []), item)
+
+    async def close(self, timeout_seconds: float = 5):
+        '''
+        Дождаться отправки того, что уже в очереди, но не дольше timeout_seconds.
+        '''
+        deadline = time.monotonic() + timeout_seconds
+        while (any(self._queues.values()) or self._sending) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+outbox = Outbox()
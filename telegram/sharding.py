@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+import secrets
+import signal
+import sys
+import time
+from contextlib import suppress
+
+import aiohttp
+from aiogram.types import Update
+
+import config
+from common import metrics
+from common.sharding import shard_of, SHARD_ENV, SECRET_ENV
+from .webhook import SECRET_HEADER
+
+logger = logging.getLogger(__name__)
+
+forwarded = metrics.registry.counter(
+    'bot_shard_forwarded_total', 'Апдейты, пересланные обработчику', ('shard',))
+forward_retries = metrics.registry.counter(
+    'bot_shard_forward_retries_total', 'Повторные попытки переслать апдейт обработчику', ('shard',))
+forward_seconds = metrics.registry.histogram(
+    'bot_shard_forward_seconds', 'Сколько апдейт ждал пересылки обработчику, включая повторы')
+worker_restarts = metrics.registry.counter(
+    'bot_shard_worker_restarts_total', 'Перезапуски упавших обработчиков', ('shard',))
+
+
+def worker_url(index: int, base_port: int = config.sharding_base_port) -> str:
+    return f'http://127.0.0.1:{base_port + index}{config.webhook_path}'
+
+
+class ShardForwarder:
+    '''
+    Пересылка апдейтов обработчикам на их локальные вебхуки. У каждого обработчика своя очередь
+    и одна задача отправки, поэтому апдейты одного чата приходят к нему в том же порядке.
+    Пока обработчик недоступен или его очередь полна (503), апдейт повторяется с нарастающей паузой,
+    а следующие ждут за ним.
+    '''
+
+    def __init__(self, workers: int = config.sharding_workers, secret: str = '',
+                 queue_size: int = config.sharding_queue_size, base_port: int = config.sharding_base_port):
+        self.workers = workers
+        self.secret = secret
+        self.base_port = base_port
+        self.queues: list[asyncio.Queue[tuple[float, dict]]] = [asyncio.Queue(maxsize=queue_size)
+                                                               for _ in range(workers)]
+        self._tasks: list[asyncio.Task] = []
+        self._session: aiohttp.ClientSession | None = None
+
+    def shard_for(self, chat_id: int) -> int:
+        return shard_of(chat_id, self.workers)
+
+    async def forward(self, chat_id: int, update: Update):
+        '''
+        Поставить апдейт в очередь обработчика чата. Если очередь полна - ждём, пока освободится,
+        и не забираем у Telegram новые апдейты.
+        :param chat_id: Чат, по которому выбирается обработчик.
+        :param update:
+        :return:
+        '''
+        payload = update.model_dump(mode='json', by_alias=True, exclude_none=True)
+        await self.queues[self.shard_for(chat_id)].put((time.perf_counter(), payload))
+
+    async def _sender(self, index: int):
+        url = worker_url(index, self.base_port)
+        headers = {SECRET_HEADER: self.secret}
+        queue = self.queues[index]
+        while True:
+            queued_at, payload = await queue.get()
+            delay = 0.05
+            while True:
+                try:
+                    async with self._session.post(url, json=payload, headers=headers) as response:
+                        if response.status == 200:
+                            break
+                        if response.status != 503:
+                            # Обработчик отверг апдейт - повтор не поможет.
+                            logger.error('shard_forward_rejected', extra={'shard': index, 'status': response.status,
+                                                                          'update_id': payload['update_id']})
+                            break
+                except aiohttp.ClientError:
+                    pass
+                forward_retries.inc(str(index))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 2)
+            forward_seconds.observe(time.perf_counter() - queued_at)
+            forwarded.inc(str(index))
+            queue.task_done()
+
+    def start(self):
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        self._tasks = [asyncio.create_task(self._sender(index)) for index in range(self.workers)]
+
+    async def close(self, timeout_seconds: float = 5):
+        '''
+        Дослать то, что уже в очередях, но не дольше timeout_seconds.
+        '''
+        try:
+            await asyncio.wait_for(asyncio.gather(*[queue.join() for queue in self.queues]), timeout_seconds)
+        except asyncio.TimeoutError:
+            logger.warning('shard_forward_dropped', extra={'updates': sum(queue.qsize() for queue in self.queues)})
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class Supervisor:
+    '''
+    Запускает обработчики отдельными процессами (python -m main с BOT_SHARD=i/N)
+    и перезапускает упавшие. Каждый обработчик принимает апдейты своих чатов на 127.0.0.1:BasePort+i.
+    '''
+
+    def __init__(self, workers: int = config.sharding_workers,
+                 restart_delay_seconds: float = config.sharding_restart_delay_seconds):
+        self.workers = workers
+        self.restart_delay_seconds = restart_delay_seconds
+        # Обработчики слушают только localhost, но чужой процесс на машине не должен подсовывать апдейты.
+        self.secret = secrets.token_urlsafe(32)
+        self._processes: dict[int, asyncio.subprocess.Process] = {}
+        self._watchers: list[asyncio.Task] = []
+        self._stopping = False
+
+    async def _spawn(self, index: int) -> asyncio.subprocess.Process:
+        env = dict(os.environ)
+        env[SHARD_ENV] = f'{index}/{self.workers}'
+        env[SECRET_ENV] = self.secret
+        # Своя группа процессов: Ctrl+C в терминале получает только фронт, а обработчики он
+        # останавливает сам, когда дошлёт им очередь апдейтов.
+        process = await asyncio.create_subprocess_exec(sys.executable, '-m', 'main', env=env,
+                                                       start_new_session=True)
+        self._processes[index] = process
+        logger.info('shard_worker_started', extra={'shard': index, 'pid': process.pid})
+        return process
+
+    async def _watch(self, index: int):
+        while not self._stopping:
+            process = await self._spawn(index)
+            code = await process.wait()
+            if self._stopping:
+                return
+            logger.error('shard_worker_exited', extra={'shard': index, 'pid': process.pid, 'code': code})
+            worker_restarts.inc(str(index))
+            await asyncio.sleep(self.restart_delay_seconds)
+
+    def start(self):
+        self._watchers = [asyncio.create_task(self._watch(index)) for index in range(self.workers)]
+
+    async def stop(self, timeout_seconds: float = 10):
+        '''
+        Попросить обработчики завершиться (SIGTERM) и дождаться их. Кто не успел - убивается.
+        '''
+        self._stopping = True
+        for task in self._watchers:
+            task.cancel()
+        self._watchers = []
+        processes = [process for process in self._processes.values() if process.returncode is None]
+        for process in processes:
+            process.terminate()
+        try:
+            await asyncio.wait_for(asyncio.gather(*[process.wait() for process in processes]), timeout_seconds)
+        except asyncio.TimeoutError:
+            for process in processes:
+                if process.returncode is None:
+                    logger.warning('shard_worker_killed', extra={'pid': process.pid})
+                    # Вместе с процессами отрисовки, которые запустил обработчик.
+                    with suppress(ProcessLookupError):
+                        os.killpg(process.pid, signal.SIGKILL)
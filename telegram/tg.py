@@ -1,80 +1,219 @@
-from aiogram import types
+import asyncio
+import signal
+from contextlib import suppress
+
+from aiogram import Dispatcher, types
 from aiogram.filters import Command
+
+import config
 from common.controllers import CommandController
+from common.chat_executor import chat_executor
+from common.http import http_client
+from common.metrics import metrics_server
+from common.scheduler import scheduler
+from common.sharding import current_shard
+from common.startup import startup_report
 from telegram.filters import ChatTypeFilter, IntRangeFilter, IsNotStartMessage
 from game_manager.controllers import GameManagerController
 from lobby.controllers import LobbyController, WordProviderController
+from roa_game.models import roa_cache
+from roa_game.render import chart_renderer
 from .consts import bot, dp
+from .middlewares import (UpdateLoggingMiddleware, HandlerMetricsMiddleware, UpdateCountMiddleware, ChatOrderMiddleware,
+                          ShardRoutingMiddleware)
+from .outbox import outbox
+from .sharding import ShardForwarder, Supervisor
+from .webhook import WebhookServer
+
+
+dp.update.outer_middleware(ChatOrderMiddleware(chat_executor))
+dp.message.middleware(UpdateLoggingMiddleware())
+if config.metrics_enabled:
+    dp.update.outer_middleware(UpdateCountMiddleware())
+    dp.message.middleware(HandlerMetricsMiddleware())
 
 
 @dp.message(Command('hi'), ChatTypeFilter(chat_type=["group"]))
 async def hi(message: types.Message):
-    print(f'TG::{message}')
     await CommandController().greeting(message=message)
 
 
 @dp.message(Command('join'), ChatTypeFilter(chat_type=["group"]))
 async def join(message: types.Message):
-    print(f'TG::{message}')
     response = await LobbyController().add_member(message)
-    await message.reply(text=response)
+    outbox.send_message(chat_id=message.chat.id, text=response, reply_to_message_id=message.message_id)
 
 
 @dp.message(Command('party'), ChatTypeFilter(chat_type=["group"]))
 async def party(message: types.Message):
-    print(f'TG::{message}')
     response = await LobbyController().get_members_list(message)
-    await message.reply(text=response)
+    outbox.send_message(chat_id=message.chat.id, text=response, reply_to_message_id=message.message_id)
 
 
 @dp.message(Command('roa'), ChatTypeFilter(chat_type=["group"]))
 async def roa_start(message: types.Message):
-    print(f'TG::{message}')
     await GameManagerController().start_roa(message=message)
 
 
 @dp.message(Command('stop'), ChatTypeFilter(chat_type=["group"]))
 async def stop_handler(message: types.Message):
-    print(f'TG::{message}')
     await LobbyController().destroy(message)
 
 
 @dp.message(IsNotStartMessage(), ChatTypeFilter(chat_type=["private"]))
 async def word_provider_sender_handler(message: types.Message):
-    print(f'TG::{message}')
     await WordProviderController().send_word(message)
 
 
 @dp.message(Command('start'), ChatTypeFilter(chat_type=["private"]))
-async def word_provider_sender_handler(message: types.Message):
-    print(f'TG::{message}')
+async def start_in_private_handler(message: types.Message):
     await CommandController().start_in_private(message)
 
 
 @dp.message(Command('next'), ChatTypeFilter(chat_type=["group"]))
 async def next_handler(message: types.Message):
-    print(f'TG::{message}')
     await GameManagerController().next(message)
 
 
 @dp.message(IntRangeFilter(), ChatTypeFilter(chat_type=["group"]))
 async def score_input(message: types.Message):
-    print(f'TG::{message}')
     await GameManagerController().set_score_roa(message)
 
 
 # Дебаты
 @dp.message(Command('deb'), ChatTypeFilter(chat_type=["group"]))
-async def roa_start(message: types.Message):
-    print(f'TG::{message}')
+async def deb_start(message: types.Message):
     await GameManagerController().start_deb(message=message)
 
 
 @dp.message(Command('me'), ChatTypeFilter(chat_type=["group"]))
 async def add_player_in_deb(message: types.Message):
-    print(f'TG::{message}')
     await GameManagerController().add_player_in_deb(message=message)
 
 
+background_tasks = set()
+
+
+@dp.startup()
+async def on_startup():
+    with startup_report.phase('восстановление таймеров'):
+        await GameManagerController().reload_timers()
+        scheduler.start()
+    startup_report.report()
+    if config.metrics_enabled:
+        await metrics_server.start()
+    if config.render_warm_up:
+        task = asyncio.create_task(chart_renderer.warm_up())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+
+@dp.shutdown()
+async def on_shutdown():
+    await metrics_server.stop()
+    await scheduler.stop()
+    await outbox.close()
+    await roa_cache.close()
+    await http_client.close()
+    chart_renderer.close()
+
+
+def _stop_on_signals() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(signal_number, stop.set)
+    return stop
+
+
+async def run_webhook() -> None:
+    '''
+    Апдейты приходят на встроенный aiohttp-сервер. Если задан WEBHOOK Url - адрес регистрируется в Telegram,
+    иначе сервер просто слушает порт (для локальной проверки записанными апдейтами).
+    '''
+    stop = _stop_on_signals()
+    server = WebhookServer(dispatcher=dp, bot=bot)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        await server.start()
+        if config.webhook_url:
+            await bot.set_webhook(url=config.webhook_url + config.webhook_path,
+                                  secret_token=config.webhook_secret_token or None,
+                                  allowed_updates=dp.resolve_used_update_types())
+        await stop.wait()
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+
+
+async def run_worker() -> None:
+    '''
+    Обработчик своей части чатов при шардировании: апдейты ему пересылает фронт на локальный вебхук.
+    В Telegram обработчик только отправляет сообщения.
+    '''
+    stop = _stop_on_signals()
+    server = WebhookServer(dispatcher=dp, bot=bot, host='127.0.0.1',
+                           port=config.sharding_base_port + current_shard.index,
+                           secret_token=current_shard.secret)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        await server.start()
+        await stop.wait()
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+
+
+async def run_front() -> None:
+    '''
+    Процесс, который получает апдейты от Telegram (getUpdates или вебхуком) и раздаёт их обработчикам.
+    Хэндлеров у его диспетчера нет, апдейты перехватывает ShardRoutingMiddleware.
+    '''
+    supervisor = Supervisor()
+    forwarder = ShardForwarder(secret=supervisor.secret)
+    front = Dispatcher()
+    front.update.outer_middleware(ShardRoutingMiddleware(forwarder))
+    if config.metrics_enabled:
+        front.update.outer_middleware(UpdateCountMiddleware())
+        await metrics_server.start()
+    supervisor.start()
+    forwarder.start()
+    try:
+        if config.webhook_enabled:
+            stop = _stop_on_signals()
+            # Один воркер, иначе апдейты одного чата могут поменяться местами, пока ищется лобби.
+            server = WebhookServer(dispatcher=front, bot=bot, workers=1)
+            await server.start()
+            try:
+                if config.webhook_url:
+                    await bot.set_webhook(url=config.webhook_url + config.webhook_path,
+                                          secret_token=config.webhook_secret_token or None,
+                                          allowed_updates=dp.resolve_used_update_types())
+                await stop.wait()
+            finally:
+                await server.stop()
+        else:
+            await bot.delete_webhook()
+            # Апдейты по одному, по той же причине, что и один воркер вебхука.
+            await front.start_polling(bot, handle_as_tasks=False, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        await forwarder.close()
+        await supervisor.stop()
+        await metrics_server.stop()
+        await bot.session.close()
+
+
 async def run_bot() -> None:
-    await dp.start_polling(bot)
+    if current_shard.is_worker:
+        await run_worker()
+    elif config.sharding_workers > 1:
+        await run_front()
+    elif config.webhook_enabled:
+        await run_webhook()
+    else:
+        # getUpdates не работает, пока у бота зарегистрирован вебхук.
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
@@ -0,0 +1,139 @@
+import asyncio
+import hmac
+import logging
+import time
+from collections import deque
+from typing import Hashable
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+import config
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+queue_seconds = metrics.registry.histogram(
+    'bot_webhook_queue_seconds', 'Сколько апдейт ждал в очереди вебхука до передачи в диспетчер')
+rejected = metrics.registry.counter(
+    'bot_webhook_rejected_total', 'Апдейты, которые вебхук не принял', ('reason',))
+
+
+class WebhookServer:
+    '''
+    Приём апдейтов по вебхуку. Обработчик запроса только проверяет секрет и кладёт апдейт
+    в очередь его чата, а в диспетчер их передают workers задач.
+    Задача берёт чат целиком и передаёт его апдейты по одному, пока очередь чата не опустеет,
+    поэтому один чат занимает не больше одной задачи: шквал апдейтов из одной группы, которые всё равно
+    ждут друг друга, не забирает задачи у остальных чатов.
+    Если принятых и ещё не обработанных апдейтов queue_size - отвечаем 503, и Telegram повторит доставку позже.
+    '''
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, host: str = config.webhook_host,
+                 port: int = config.webhook_port, path: str = config.webhook_path,
+                 secret_token: str = config.webhook_secret_token, workers: int = config.webhook_workers,
+                 queue_size: int = config.webhook_queue_size):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+        self.queue_size = queue_size
+        # Очереди чатов, у которых есть необработанные апдейты, и чаты, которые ждут свободную задачу.
+        self._chats: dict[Hashable, deque[tuple[float, Update]]] = {}
+        self._ready: asyncio.Queue[Hashable] = asyncio.Queue()
+        self._pending = 0
+        self._tasks: list[asyncio.Task] = []
+        self._runner = None
+
+    @staticmethod
+    def chat_key(update: Update) -> Hashable:
+        '''
+        Апдейты без чата (например, изменения опроса) друг друга не ждут - у каждого своя очередь.
+        '''
+        chat, _, _ = UserContextMiddleware.resolve_event_context(event=update)
+        return chat.id if chat is not None else ('update', update.update_id)
+
+    def put(self, update: Update) -> bool:
+        '''
+        Поставить апдейт в очередь его чата.
+        :return: False - принятых апдейтов уже queue_size.
+        '''
+        if self._pending >= self.queue_size:
+            return False
+        self._pending += 1
+        key = self.chat_key(update)
+        chat = self._chats.get(key)
+        if chat is None:
+            chat = self._chats[key] = deque()
+            self._ready.put_nowait(key)
+        chat.append((time.perf_counter(), update))
+        return True
+
+    async def handle(self, request):
+        from aiohttp import web
+        if self.secret_token and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''),
+                                                         self.secret_token):
+            rejected.inc('secret')
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': self.bot})
+        except ValueError:
+            rejected.inc('bad_request')
+            return web.Response(status=400)
+        if not self.put(update):
+            rejected.inc('queue_full')
+            logger.warning('webhook_queue_full', extra={'update_id': update.update_id})
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            chat = self._chats[key]
+            try:
+                # Апдейты, пришедшие в чат за время обработки, дописываются в эту же очередь.
+                while chat:
+                    queued_at, update = chat.popleft()
+                    queue_seconds.observe(time.perf_counter() - queued_at)
+                    try:
+                        await self.dispatcher.feed_update(self.bot, update)
+                    except Exception:
+                        logger.exception('webhook_update_failed', extra={'update_id': update.update_id})
+                    finally:
+                        self._pending -= 1
+            finally:
+                del self._chats[key]
+                self._ready.task_done()
+
+    async def start(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if not self.secret_token:
+            logger.warning('webhook_without_secret')
+        logger.info('webhook_started', extra={'host': self.host, 'port': self.port, 'path': self.path})
+
+    async def stop(self, timeout_seconds: float = 5):
+        '''
+        Перестать принимать апдейты и дождаться обработки уже принятых, но не дольше timeout_seconds.
+        '''
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout_seconds)
+        except asyncio.TimeoutError:
+            logger.warning('webhook_queue_dropped', extra={'updates': self._pending})
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []